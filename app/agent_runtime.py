@@ -1,8 +1,9 @@
 import json
-from dataclasses import asdict
+from dataclasses import asdict, replace
 from typing import Optional
 from pydantic import BaseModel, Field
 from app.deps import agent_singleton
+from app.core.types import QueryFilter
 import os
 
 DEFAULT_QUERY_IMAGE = os.getenv("DEFAULT_QUERY_IMAGE", "data/images/SYNTH/img_0001.jpg")
@@ -33,15 +34,9 @@ def visual_agent_tool_fn(query_image: str, top_k: int = 10, prefer_online: bool
     '''
     query_image = query_image or DEFAULT_QUERY_IMAGE
     agent = agent_singleton
-    agent.cfg.top_k = top_k
-    agent.cfg.prefer_online = prefer_online
-    resp = agent.retrieve(query_image)
-    items = [asdict(r) for r in resp.results]
-    if filter_color:
-        items = [x for x in items if (x.get("color") or "").lower() == filter_color.lower()]
-    if max_price is not None:
-        items = [x for x in items if x.get("price") is not None and x["price"] <= max_price]
-    items = items[:top_k]
+    cfg = replace(agent.cfg, top_k=top_k, prefer_online=prefer_online)
+    resp = agent.retrieve(query_image, filters=QueryFilter(color=filter_color, max_price=max_price), config=cfg)
+    items = [asdict(r) for r in resp.results][:top_k]
     return json.dumps({"query_image": query_image, "count": len(items), "results": items}, ensure_ascii=False)
 
 def build_agent():
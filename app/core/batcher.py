@@ -0,0 +1,95 @@
+# app/core/batcher.py
+from typing import List, Optional, Tuple
+from concurrent.futures import Future, ThreadPoolExecutor
+import queue, threading, time
+from .orchestrator import VisualAgent, ImageQuery
+from .types import AgentConfig, AgentResponse, QueryFilter
+from .metrics import BATCH_SIZE
+
+_Request = Tuple[ImageQuery, Optional[QueryFilter], Optional[AgentConfig], Future]
+
+class MicroBatcher:
+    """
+    Dispatcher delante de VisualAgent.retrieve que agrupa las consultas
+    concurrentes que llegan dentro de una ventana (`max_wait_ms`) o hasta
+    `max_batch`, y las resuelve con VisualAgent.retrieve_many: un único
+    forward del embedder y una búsqueda multi-vector por lote.
+    """
+    def __init__(self, agent: VisualAgent, max_batch: int = 16, max_wait_ms: float = 3.0, workers: int = 1):
+        self.agent = agent
+        self.max_batch = max(int(max_batch), 1)
+        self.max_wait = max(float(max_wait_ms), 0.0) / 1000.0
+        self._queue: "queue.Queue[Optional[_Request]]" = queue.Queue()
+        self._pool = ThreadPoolExecutor(max_workers=max(int(workers), 1), thread_name_prefix="microbatch")
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+    def _start(self) -> None:
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="microbatch-dispatch", daemon=True)
+                self._thread.start()
+
+    def submit(
+        self, query_image: ImageQuery, filters: Optional[QueryFilter] = None, config: Optional[AgentConfig] = None
+    ) -> "Future[AgentResponse]":
+        '''Encola una consulta; el Future se resuelve cuando termina su lote.'''
+        if self._thread is None:
+            self._start()
+        fut: "Future[AgentResponse]" = Future()
+        self._queue.put((query_image, filters, config, fut))
+        return fut
+
+    def retrieve(
+        self, query_image: ImageQuery, filters: Optional[QueryFilter] = None, config: Optional[AgentConfig] = None
+    ) -> AgentResponse:
+        '''Versión bloqueante de `submit` (misma firma que VisualAgent.retrieve).'''
+        return self.submit(query_image, filters, config).result()
+
+    def close(self) -> None:
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+        self._pool.shutdown(wait=True)
+
+    def _loop(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch: List[_Request] = [first]
+            deadline = time.monotonic() + self.max_wait
+            stop = False
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            self._pool.submit(self._run, batch)
+            if stop:
+                return
+
+    def _run(self, batch: List[_Request]) -> None:
+        BATCH_SIZE.labels(source="microbatch").observe(len(batch))
+        try:
+            responses = self.agent.retrieve_many(
+                [r[0] for r in batch], [r[1] for r in batch], [r[2] for r in batch]
+            )
+        except Exception:
+            # Una imagen inválida no debe tumbar el lote: se reintenta una a una
+            for query_image, filters, config, fut in batch:
+                try:
+                    fut.set_result(self.agent.retrieve(query_image, filters=filters, config=config))
+                except Exception as e:
+                    fut.set_exception(e)
+            return
+        for (_, _, _, fut), resp in zip(batch, responses):
+            fut.set_result(resp)
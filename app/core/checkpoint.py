@@ -0,0 +1,109 @@
+# app/core/checkpoint.py
+from typing import Dict, Set, Any, Iterable
+import os, json, time, hashlib, threading
+
+def listing_digest(items: Iterable[str]) -> str:
+    '''Huella del listado ordenado de items: si cambia, los índices de bloque ya no significan lo mismo.'''
+    h = hashlib.sha256()
+    for it in items:
+        h.update(it.encode("utf-8") + b"\0")
+    return h.hexdigest()[:32]
+
+class Checkpoint:
+    """
+    Checkpoint durable de un job de indexado por bloques (JSON, escritura atómica).
+    Guarda la marca de agua (`next_chunk`: todos los bloques anteriores están hechos),
+    los bloques completados por encima de ella (los workers terminan fuera de orden)
+    y los bloques fallidos con su error. Al reanudar sólo se procesan los bloques
+    pendientes o fallidos. `listing` (ver listing_digest) identifica el listado
+    ordenado de items: sólo se reanuda sobre exactamente el mismo listado.
+    """
+    def __init__(
+        self, path: str, job: str = "", chunk_size: int = 0, total: int = 0, every: int = 10, listing: str = ""
+    ):
+        self.path = path
+        self.job = job
+        self.chunk_size = chunk_size
+        self.total = total
+        self.listing = listing
+        self.every = max(int(every), 1)
+        self.next_chunk = 0
+        self.completed: Set[int] = set()
+        self.failed: Dict[int, str] = {}
+        self.finished = False
+        self._dirty = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def open(
+        cls, path: str, resume: bool, job: str = "", chunk_size: int = 0, total: int = 0, every: int = 10,
+        listing: str = "",
+    ) -> "Checkpoint":
+        '''Reanuda desde `path` si `resume` y el checkpoint es compatible; si no, empieza de cero.'''
+        ckpt = cls(path, job=job, chunk_size=chunk_size, total=total, every=every, listing=listing)
+        if not resume or not os.path.exists(path):
+            return ckpt
+        with open(path) as f:
+            data = json.load(f)
+        saved = (data.get("job"), data.get("chunk_size"), data.get("total"), data.get("listing", ""))
+        if saved != (job, chunk_size, total, listing) or data.get("finished"):
+            print(f"[checkpoint] {path} no es reanudable (job/tamaño/listado distinto o ya terminado); empezando de cero")
+            return ckpt
+        ckpt.next_chunk = int(data.get("next_chunk", 0))
+        ckpt.completed = {int(c) for c in data.get("completed", [])}
+        ckpt.failed = {int(c): e for c, e in (data.get("failed") or {}).items()}
+        print(f"[checkpoint] Reanudando {job}: next_chunk={ckpt.next_chunk}, fallidos={sorted(ckpt.failed)}")
+        return ckpt
+
+    def is_done(self, chunk: int) -> bool:
+        return chunk < self.next_chunk or chunk in self.completed
+
+    def mark_done(self, chunk: int) -> None:
+        with self._lock:
+            self.failed.pop(chunk, None)
+            self.completed.add(chunk)
+            while self.next_chunk in self.completed:
+                self.completed.discard(self.next_chunk)
+                self.next_chunk += 1
+            self._touch()
+
+    def mark_failed(self, chunk: int, error: Any) -> None:
+        with self._lock:
+            self.failed[chunk] = str(error)
+            self._touch()
+
+    def finish(self) -> None:
+        '''Cierra el job; sólo queda "terminado" si no hay bloques fallidos.'''
+        with self._lock:
+            self.finished = not self.failed
+            self._save()
+
+    def save(self) -> None:
+        with self._lock:
+            self._save()
+
+    def _touch(self) -> None:
+        self._dirty += 1
+        if self._dirty >= self.every:
+            self._save()
+
+    def _save(self) -> None:
+        data = {
+            "job": self.job,
+            "chunk_size": self.chunk_size,
+            "total": self.total,
+            "listing": self.listing,
+            "next_chunk": self.next_chunk,
+            "completed": sorted(self.completed),
+            "failed": {str(c): e for c, e in sorted(self.failed.items())},
+            "finished": self.finished,
+            "updated_at": time.time(),
+        }
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self._dirty = 0
@@ -0,0 +1,65 @@
+# app/core/digest_cache.py
+from typing import Dict, List, Sequence
+import os, sqlite3, threading
+from .utils import content_digest
+
+"""
+Caché persistente (SQLite) del sha256 del contenido de cada imagen, validada
+por (tamaño, mtime): un re-indexado incremental sólo lee los archivos nuevos o
+modificados, el resto cuesta un stat. La comparten la API y el indexador.
+"""
+
+_SQL_VARS = 900  # por debajo del límite de parámetros de SQLite
+
+class DigestCache:
+    """ruta -> (tamaño, mtime_ns, sha256 del contenido)."""
+    def __init__(self, path: str = "data/manifests/content_digests.sqlite"):
+        self.path = path
+        self.hashed = 0
+        self.reused = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS digests (path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, digest BLOB)"
+        )
+        self._db.commit()
+
+    def digests(self, paths: Sequence[str]) -> Dict[str, bytes]:
+        '''Digest de cada ruta; sólo se hashean las que no están o cambiaron de tamaño/mtime.'''
+        stats: Dict[str, tuple] = {}
+        out: Dict[str, bytes] = {}
+        for p in dict.fromkeys(paths):
+            try:
+                st = os.stat(p)
+                stats[p] = (st.st_size, st.st_mtime_ns)
+            except OSError:
+                out[p] = content_digest(p)  # rutas sintéticas: no se guardan
+        uniq: List[str] = list(stats)
+        with self._lock:
+            for start in range(0, len(uniq), _SQL_VARS):
+                chunk = uniq[start:start + _SQL_VARS]
+                rows = self._db.execute(
+                    f"SELECT path, size, mtime_ns, digest FROM digests WHERE path IN ({', '.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+                for p, size, mtime_ns, digest in rows:
+                    if stats[p] == (size, mtime_ns):
+                        out[p] = bytes(digest)
+            todo = [p for p in uniq if p not in out]
+            self.reused += len(uniq) - len(todo)
+            self.hashed += len(todo)
+            rows = []
+            for p in todo:
+                out[p] = content_digest(p)
+                rows.append((p, *stats[p], out[p]))
+            if rows:
+                self._db.executemany("INSERT OR REPLACE INTO digests VALUES (?, ?, ?, ?)", rows)
+                self._db.commit()
+        return out
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
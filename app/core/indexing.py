@@ -0,0 +1,105 @@
+# app/core/indexing.py
+from typing import List, Dict, Any, Optional
+from .utils import fingerprint, model_tag_for, ENRICH_VERSION
+from .checkpoint import Checkpoint
+from .digest_cache import DigestCache
+from .metrics import span, INDEX_STAGE_SECONDS, INDEX_ITEMS
+
+"""Pipeline de indexado (dataset -> embed -> upsert) compartido por la API."""
+
+def build_payloads(dataset, paths: List[str], fps: Dict[str, str]) -> List[Dict[str, Any]]:
+    '''Payloads de un bloque, con una sola consulta de metadatos si el dataset lo permite.'''
+    many = getattr(dataset, "get_metadata_many", None)
+    mds = many(paths) if many is not None else [dataset.get_metadata(p) for p in paths]
+    return [build_payload(p, fps[p], md) for p, md in zip(paths, mds)]
+
+def build_payload(filepath: str, fp: str, md: Dict[str, Any]) -> Dict[str, Any]:
+    '''Payload a guardar en el vector store para un item.'''
+    return {
+        "filepath": filepath,
+        "title": md.get("title"),
+        "brand": md.get("brand"),
+        "color": md.get("color"),
+        "source": md.get("source"),
+        "url": md.get("url"),
+        "price": md.get("price"),
+        "fingerprint": fp,
+    }
+
+def index_paths(
+    vstore,
+    embedder,
+    dataset,
+    paths: List[str],
+    incremental: bool = True,
+    prune: bool = False,
+    chunk_size: int = 256,
+    checkpoint: Optional[Checkpoint] = None,
+    enricher=None,
+    digests: Optional[DigestCache] = None,
+) -> Dict[str, int]:
+    '''
+    Indexa `paths` en el vector store por bloques de `chunk_size`.
+    En modo incremental sólo embebe/sube los items nuevos o cuya huella
+    (contenido + modelo + versión del enriquecido) cambió; con `prune` borra los que ya no existen.
+    El modo incremental requiere que el store exponga `fingerprints()`/`delete()`.
+    Con `checkpoint` se saltan los bloques ya hechos y se reintentan los fallidos.
+    Con `enricher` (p. ej. SimpleEnricher) se materializan brand/color/price/url
+    una sola vez aquí, en lugar de en cada consulta.
+    Con `digests` sólo se lee el contenido de los archivos cuyo tamaño/mtime
+    cambió: un re-indexado sin cambios cuesta un stat por archivo.
+    '''
+    tag = model_tag_for(embedder)
+    payload = ENRICH_VERSION if enricher is not None else ""
+    existing: Dict[str, Any] = {}
+    if incremental and hasattr(vstore, "fingerprints"):
+        existing = vstore.fingerprints()
+
+    stats = {"seen": len(paths), "upserted": 0, "unchanged": 0, "resumed": 0, "failed": 0, "deleted": 0}
+    for n_chunk, start in enumerate(range(0, len(paths), chunk_size)):
+        chunk = paths[start:start + chunk_size]
+        if checkpoint is not None and checkpoint.is_done(n_chunk):
+            stats["resumed"] += len(chunk)
+            continue
+        try:
+            with span("fingerprint", INDEX_STAGE_SECONDS):
+                known = digests.digests(chunk) if digests is not None else {}
+                fps = {p: fingerprint(p, tag, known.get(p), payload) for p in chunk}
+            todo = [p for p in chunk if existing.get(p) != fps[p]]
+            if todo:
+                with span("embed", INDEX_STAGE_SECONDS):
+                    vectors = embedder.embed_images(todo)
+                with span("metadata", INDEX_STAGE_SECONDS):
+                    payloads = build_payloads(dataset, todo, fps)
+                if enricher is not None:
+                    with span("enrich", INDEX_STAGE_SECONDS):
+                        payloads = enricher.enrich_batch(payloads)
+                with span("upsert", INDEX_STAGE_SECONDS):
+                    vstore.index(vectors, payloads)
+        except Exception as e:
+            print(f"[index] bloque {n_chunk} falló: {e}")
+            stats["failed"] += len(chunk)
+            INDEX_ITEMS.labels(result="failed").inc(len(chunk))
+            if checkpoint is None:
+                raise
+            checkpoint.mark_failed(n_chunk, e)
+            continue
+        stats["upserted"] += len(todo)
+        stats["unchanged"] += len(chunk) - len(todo)
+        INDEX_ITEMS.labels(result="upserted").inc(len(todo))
+        INDEX_ITEMS.labels(result="unchanged").inc(len(chunk) - len(todo))
+        if checkpoint is not None:
+            checkpoint.mark_done(n_chunk)
+
+    if incremental and prune and not stats["failed"] and hasattr(vstore, "delete"):
+        vanished = sorted(set(existing) - set(paths))
+        if vanished:
+            stats["deleted"] = vstore.delete(vanished)
+            INDEX_ITEMS.labels(result="deleted").inc(stats["deleted"])
+
+    if checkpoint is not None:
+        checkpoint.finish()
+    if digests is not None:
+        stats["hashed"], stats["hash_reused"] = digests.hashed, digests.reused
+    print(f"[index] {stats}")
+    return stats
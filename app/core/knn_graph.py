@@ -0,0 +1,124 @@
+# app/core/knn_graph.py
+from typing import List, Dict, Any, Optional, Sequence, Tuple
+import os, json, time
+import numpy as np
+from .tools.numpy_vector_store import _normalize_rows, topk_indices
+
+"""
+Grafo k-NN precalculado del catálogo: para cada item, sus K vecinos más
+similares (sin él mismo) como matrices compactas (N, K) int32 / float16.
+Guarda además el payload de cada item (el del índice) para que las respuestas
+lleven los mismos campos materializados que la búsqueda en vivo.
+Se construye offline (app/knn_job.py) y VisualAgent lo usa para responder
+consultas por items del catálogo sin embeber ni buscar en vivo.
+"""
+
+def build_knn_graph(
+    vectors: np.ndarray, k: int = 50, tile: int = 4096, log_every: int = 0
+) -> Tuple[np.ndarray, np.ndarray]:
+    '''
+    Top-k exacto de cada fila contra todas las demás con matmul float32 por bloques:
+    cada bloque de `tile` consultas recorre la matriz en bloques de `tile` columnas
+    y sólo guarda su top-k acumulado, así la memoria temporal es O(tile * (tile + k))
+    aunque `vectors` sea un memmap mayor que la RAM.
+    Devuelve (vecinos (N, k) int32, similitudes (N, k) float16), por similitud descendente.
+    '''
+    n = vectors.shape[0]
+    k = max(min(int(k), n - 1), 0)
+    neighbors = np.zeros((n, k), dtype=np.int32)
+    scores = np.zeros((n, k), dtype=np.float16)
+    if k == 0:
+        return neighbors, scores
+    t0 = time.perf_counter()
+    for qs in range(0, n, tile):
+        qe = min(qs + tile, n)
+        q = _normalize_rows(np.asarray(vectors[qs:qe], dtype=np.float32))
+        best_sc = np.empty((qe - qs, 0), dtype=np.float32)
+        best_ix = np.empty((qe - qs, 0), dtype=np.int64)
+        for cs in range(0, n, tile):
+            ce = min(cs + tile, n)
+            block = q @ _normalize_rows(np.asarray(vectors[cs:ce], dtype=np.float32)).T
+            # el propio item no es vecino de sí mismo
+            lo, hi = max(qs, cs), min(qe, ce)
+            if lo < hi:
+                r = np.arange(lo, hi)
+                block[r - qs, r - cs] = -np.inf
+            cand_sc = np.concatenate([best_sc, block], axis=1)
+            cand_ix = np.concatenate([best_ix, np.broadcast_to(np.arange(cs, ce), block.shape)], axis=1)
+            top = topk_indices(cand_sc, k)
+            best_sc = np.take_along_axis(cand_sc, top, axis=1)
+            best_ix = np.take_along_axis(cand_ix, top, axis=1)
+        neighbors[qs:qe] = best_ix
+        scores[qs:qe] = best_sc
+        if log_every and (qs // tile) % log_every == 0:
+            print(f"[knn] {qe}/{n} filas ({time.perf_counter() - t0:.1f}s)")
+    return neighbors, scores
+
+def write_knn_graph(
+    path: str, payloads: Sequence[Dict[str, Any]], neighbors: np.ndarray, scores: np.ndarray, model_tag: str = ""
+) -> None:
+    '''Escribe el grafo (fila i = payloads[i]) de forma atómica (archivo temporal + os.replace).'''
+    meta = {"count": len(payloads), "k": int(neighbors.shape[1]), "model_tag": model_tag, "created_at": time.time()}
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        np.savez(
+            f,
+            neighbors=np.ascontiguousarray(neighbors, dtype=np.int32),
+            scores=np.ascontiguousarray(scores, dtype=np.float16),
+            payloads=np.frombuffer(json.dumps(list(payloads)).encode("utf-8"), dtype=np.uint8),
+            meta=np.frombuffer(json.dumps(meta).encode("utf-8"), dtype=np.uint8),
+        )
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+class KnnGraph:
+    """Grafo k-NN cargado en memoria: id del item -> vecinos precalculados (O(1) por consulta)."""
+    def __init__(
+        self, payloads: List[Dict[str, Any]], neighbors: np.ndarray, scores: np.ndarray, meta: Optional[Dict[str, Any]] = None
+    ):
+        if neighbors.shape != scores.shape or neighbors.shape[0] != len(payloads):
+            raise ValueError(f"Grafo inconsistente: {len(payloads)} items, vecinos {neighbors.shape}, scores {scores.shape}")
+        self.payloads = payloads
+        self.ids = [p["filepath"] for p in payloads]
+        self.neighbors = neighbors
+        self.scores = scores
+        self.meta = meta or {}
+        self._rows: Dict[str, int] = {fp: i for i, fp in enumerate(self.ids)}
+
+    @classmethod
+    def load(cls, path: str, model_tag: Optional[str] = None) -> "KnnGraph":
+        '''Carga un grafo; con `model_tag`, falla si se construyó con vectores de otro modelo.'''
+        with np.load(path) as data:
+            meta = json.loads(data["meta"].tobytes().decode("utf-8"))
+            if model_tag and meta.get("model_tag") and meta["model_tag"] != model_tag:
+                raise ValueError(f"Grafo k-NN {path} es de {meta['model_tag']}, esperado {model_tag}")
+            if "payloads" not in data.files:
+                raise ValueError(f"Grafo k-NN {path} sin payloads (formato antiguo); relanza app.knn_job")
+            payloads = json.loads(data["payloads"].tobytes().decode("utf-8"))
+            return cls(payloads, data["neighbors"], data["scores"], meta)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, filepath: str) -> bool:
+        return filepath in self._rows
+
+    @property
+    def k(self) -> int:
+        return int(self.neighbors.shape[1])
+
+    def query(self, filepath: str, k: int = 10) -> Optional[List[Dict[str, Any]]]:
+        '''
+        Top-k del item con el mismo formato que VectorStoreTool.query (payload
+        + score): el propio item primero (similitud 1, como en la búsqueda en
+        vivo) y luego sus vecinos. None si el item no está en el grafo.
+        '''
+        row = self._rows.get(filepath)
+        if row is None:
+            return None
+        out = [{**self.payloads[row], "score": 1.0}]
+        for j, sc in zip(self.neighbors[row, :max(k - 1, 0)], self.scores[row, :max(k - 1, 0)]):
+            out.append({**self.payloads[j], "score": float(sc)})
+        return out[:k]
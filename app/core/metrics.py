@@ -0,0 +1,205 @@
+# app/core/metrics.py
+from typing import Dict, List, Tuple, Optional, Sequence
+from contextlib import contextmanager
+import os, time, bisect, threading
+
+"""
+Métricas en proceso con formato de exposición Prometheus (sin dependencias).
+  - Counter / Histogram con etiquetas, API al estilo de prometheus_client
+  - span("etapa"): cronometra un bloque, lo observa en un histograma y lo suma
+    al desglose por petición activo en el hilo (ver `collect`)
+Con METRICS_ENABLED=0 span devuelve un contexto vacío y los inc/observe
+retornan de inmediato: el coste queda en una comprobación de bool.
+"""
+
+ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_metrics: List["_Metric"] = []
+_lock = threading.Lock()
+
+def _fmt_labels(names: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, doc: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.doc = doc
+        self.label_names = tuple(labels)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        with _lock:
+            _metrics.append(self)
+
+    def labels(self, **kw):
+        key = tuple(str(kw.get(n, "")) for n in self.label_names)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+class _CounterChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        if not ENABLED:
+            return
+        with self._lock:
+            self.value += amount
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{_fmt_labels(self.label_names, k)} {c.value}" for k, c in self._children.items()]
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum", "count", "_lock")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        if not ENABLED:
+            return
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.sum += value
+            self.count += 1
+            if i < len(self.counts):
+                self.counts[i] += 1
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, doc: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, doc, labels)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def render(self) -> List[str]:
+        out = []
+        for k, h in self._children.items():
+            acc = 0
+            for b, c in zip(h.buckets, h.counts):
+                acc += c
+                le = _fmt_labels(self.label_names, k, 'le="%s"' % b)
+                out.append(f"{self.name}_bucket{le} {acc}")
+            le = _fmt_labels(self.label_names, k, 'le="+Inf"')
+            out.append(f"{self.name}_bucket{le} {h.count}")
+            out.append(f"{self.name}_sum{_fmt_labels(self.label_names, k)} {h.sum}")
+            out.append(f"{self.name}_count{_fmt_labels(self.label_names, k)} {h.count}")
+        return out
+
+def render() -> str:
+    '''Todas las métricas en formato de texto Prometheus (text/plain; version=0.0.4).'''
+    lines: List[str] = []
+    for m in list(_metrics):
+        lines.append(f"# HELP {m.name} {m.doc}")
+        lines.append(f"# TYPE {m.name} {m.kind}")
+        lines.extend(m.render())
+    return "\n".join(lines) + "\n"
+
+# ------- Métricas del servicio -------
+STAGE_SECONDS = Histogram("visual_stage_seconds", "Duración por etapa de la recuperación", ["stage"])
+RETRIEVE_SECONDS = Histogram("visual_retrieve_seconds", "Duración de VisualAgent.retrieve_many (un lote)")
+QUERIES = Counter("visual_queries_total", "Consultas de recuperación visual")
+BATCH_SIZE = Histogram("visual_batch_size", "Consultas por lote de recuperación", ["source"],
+                       buckets=(1, 2, 4, 8, 16, 32, 64, 128))
+CACHE_REQUESTS = Counter("visual_cache_requests_total", "Consultas a cachés en proceso", ["cache", "result"])
+VSTORE_ERRORS = Counter("visual_vstore_errors_total", "Errores del vector store", ["store", "transient"])
+VSTORE_RETRIES = Counter("visual_vstore_retries_total", "Reintentos del vector store", ["store"])
+ENRICH_ERRORS = Counter("visual_enrich_errors_total", "Fallos del servicio de enriquecimiento", ["enricher"])
+INDEX_STAGE_SECONDS = Histogram("visual_index_stage_seconds", "Duración por etapa y bloque del indexado", ["stage"])
+INDEX_ITEMS = Counter("visual_index_items_total", "Items procesados por el indexado", ["result"])
+SHARD_SECONDS = Histogram("visual_shard_seconds", "Búsqueda dentro de cada shard del índice particionado", ["shard"])
+
+# ------- Spans y desglose por petición -------
+_local = threading.local()
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NOOP = _NoopSpan()
+
+class _Span:
+    __slots__ = ("stage", "hist", "t0")
+
+    def __init__(self, stage: str, hist: Histogram):
+        self.stage = stage
+        self.hist = hist
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        dt = time.perf_counter() - self.t0
+        self.hist.labels(stage=self.stage).observe(dt)
+        acc = getattr(_local, "timings", None)
+        if acc is not None:
+            acc[self.stage] = acc.get(self.stage, 0.0) + dt
+        return False
+
+def span(stage: str, hist: Histogram = STAGE_SECONDS):
+    '''Cronometra un bloque: `with span("embed"): ...`.'''
+    if not ENABLED:
+        return _NOOP
+    return _Span(stage, hist)
+
+def record(stage: str, seconds: float, hist: Histogram = STAGE_SECONDS) -> None:
+    '''Como `span` pero con una duración ya medida (p. ej. en otro proceso).'''
+    if not ENABLED:
+        return
+    hist.labels(stage=stage).observe(seconds)
+    acc = getattr(_local, "timings", None)
+    if acc is not None:
+        acc[stage] = acc.get(stage, 0.0) + seconds
+
+@contextmanager
+def collect():
+    '''Acumula en un dict los spans de este hilo (desglose por petición, en segundos).'''
+    prev = getattr(_local, "timings", None)
+    timings: Dict[str, float] = {}
+    _local.timings = timings if ENABLED else None
+    try:
+        yield timings
+    finally:
+        _local.timings = prev
+
+def server_timing(timings: Optional[Dict[str, float]]) -> str:
+    '''Valor de la cabecera Server-Timing (duraciones en ms).'''
+    return ", ".join(f"{k};dur={v * 1000:.2f}" for k, v in (timings or {}).items())
@@ -1,6 +1,26 @@
-from typing import List, Dict, Any, Optional
-from .types import AgentConfig, AgentResponse, EnrichedItem, RetrievalCandidate
+from typing import List, Dict, Any, Optional, Sequence, Tuple, Union
+import os, time, hashlib, threading
+from .types import AgentConfig, AgentResponse, EnrichedItem, RetrievalCandidate, QueryFilter
 from .tools.base import EmbedderTool, DatasetTool, VectorStoreTool, EnricherTool
+from .utils import model_tag_for
+from .knn_graph import KnnGraph
+from .metrics import span, collect, QUERIES, BATCH_SIZE, RETRIEVE_SECONDS, CACHE_REQUESTS
+
+# Metadatos que el indexado guarda en el payload (ver indexing.build_payload)
+PAYLOAD_METADATA_FIELDS = ("title", "brand", "color", "source", "url")
+
+def _has_metadata(r: Dict[str, Any]) -> bool:
+    '''El payload trae los metadatos si tiene todos los campos y alguno no es nulo.'''
+    return all(f in r for f in PAYLOAD_METADATA_FIELDS) and any(r[f] is not None for f in PAYLOAD_METADATA_FIELDS)
+
+# Una consulta es una ruta (lado servidor) o el contenido de la imagen en memoria
+ImageQuery = Union[str, bytes]
+
+def query_label(query: ImageQuery) -> str:
+    '''Identificador legible de la consulta: la ruta, o `upload:<sha256 corto>` para bytes.'''
+    if isinstance(query, str):
+        return query
+    return f"upload:{hashlib.sha256(query).hexdigest()[:16]}"
 
 class VisualAgent:
     """Agente visual que combina incrustación, recuperación, enriquecimiento y clasificación.
@@ -19,51 +39,329 @@ class VisualAgent:
         self.enricher = enricher
         self.cfg = config
         self._indexed = False
+        self._index_lock = threading.Lock()
+        self.knn_graph: Optional[KnnGraph] = None  # vecinos precalculados (app/knn_job.py)
 
     def _ensure_index(self, limit: int = 200):
-        '''Asegura que el índice esté construido (indexación lazy).'''
+        '''Asegura que el índice esté construido (indexación lazy, una sola vez entre hilos).'''
         if self._indexed:
             return
-        fps = self.dataset.sample_paths(limit=limit)
-        vecs = [self.embedder.embed_image(fp) for fp in fps]
-        payloads = [{"filepath": fp} for fp in fps]
-        self.vstore.index(vecs, payloads)
-        self._indexed = True
+        with self._index_lock:
+            if self._indexed:
+                return
+            fps = self.dataset.sample_paths(limit=limit)
+            vecs = self.embedder.embed_images(fps)
+            payloads = [{"filepath": fp} for fp in fps]
+            self.vstore.index(vecs, payloads)
+            self._indexed = True
+
+    def load_knn_graph(self, path: str) -> int:
+        '''Carga el grafo k-NN precalculado (debe ser del mismo modelo). Devuelve el nº de items.'''
+        self.knn_graph = KnnGraph.load(path, model_tag=model_tag_for(self.embedder))
+        return len(self.knn_graph)
+
+    def warmup(
+        self, snapshot_path: Optional[str] = None, index_limit: int = 200, knn_graph_path: Optional[str] = None
+    ) -> Dict[str, float]:
+        '''
+        Calienta embedder, conexión del vector store e índice antes del primer retrieve.
+        Con `snapshot_path`, un vector store en proceso carga el índice de disco
+        (sin re-embeber); si no hay snapshot válido lo construye y lo guarda ahí.
+        Con `knn_graph_path` carga además el grafo k-NN si existe y es válido.
+        Devuelve la duración de cada etapa en segundos.
+        '''
+        timings: Dict[str, float] = {}
+        for name, tool in (("embedder", self.embedder), ("vstore", self.vstore)):
+            t0 = time.perf_counter()
+            warm = getattr(tool, "warmup", None)
+            if warm is not None:
+                warm()
+            timings[f"{name}_s"] = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        tag = model_tag_for(self.embedder)
+        can_snapshot = snapshot_path and hasattr(self.vstore, "load") and hasattr(self.vstore, "save")
+        loaded = False
+        if can_snapshot and os.path.exists(snapshot_path):
+            try:
+                with self._index_lock:
+                    n = self.vstore.load(snapshot_path, model_tag=tag)
+                    self._indexed = True
+                loaded = True
+                print(f"[warmup] índice cargado de {snapshot_path} ({n} items)")
+            except Exception as e:
+                print(f"[warmup] snapshot {snapshot_path} no válido ({e}); se reconstruye")
+        if not loaded and self.dataset is not None:
+            self._ensure_index(limit=index_limit)
+            if can_snapshot:
+                self.vstore.save(snapshot_path, model_tag=tag)
+        timings["index_s"] = time.perf_counter() - t0
+
+        if knn_graph_path and os.path.exists(knn_graph_path):
+            t0 = time.perf_counter()
+            try:
+                n = self.load_knn_graph(knn_graph_path)
+                print(f"[warmup] grafo k-NN cargado de {knn_graph_path} ({n} items)")
+            except Exception as e:
+                print(f"[warmup] grafo k-NN {knn_graph_path} no válido ({e}); sólo búsqueda en vivo")
+            timings["knn_graph_s"] = time.perf_counter() - t0
+        return timings
 
-    def _retrieve(self, qvec: List[float], k: int) -> List[RetrievalCandidate]:
+    def _retrieve(self, qvec: List[float], k: int, where: Optional[QueryFilter] = None) -> List[RetrievalCandidate]:
         '''Recupera los candidatos relevantes del vector store.'''
-        raw = self.vstore.query(qvec, k=k)
+        with span("vstore"):
+            raw = self.vstore.query(qvec, k=k, where=where)
+        return self._to_candidates(raw)
+
+    def _retrieve_many(
+        self, qvecs: Sequence[List[float]], k: int, where: Optional[QueryFilter] = None
+    ) -> List[List[RetrievalCandidate]]:
+        '''Búsqueda multi-vector (una sola llamada si el vector store implementa query_many).'''
+        query_many = getattr(self.vstore, "query_many", None)
+        with span("vstore"):
+            if query_many is not None:
+                raws = query_many(qvecs, k=k, where=where)
+            else:
+                raws = [self.vstore.query(q, k=k, where=where) for q in qvecs]
+        return [self._to_candidates(raw) for raw in raws]
+
+    def _metadata_many(self, filepaths: List[str]) -> List[Dict[str, Any]]:
+        '''Metadatos de varias rutas en una sola llamada al dataset si éste lo permite.'''
+        if not filepaths:
+            return []
+        many = getattr(self.dataset, "get_metadata_many", None)
+        with span("metadata"):
+            if many is not None:
+                return many(filepaths)
+            return [self.dataset.get_metadata(fp) for fp in filepaths]
+
+    def _to_candidates(self, raw: List[Dict[str, Any]]) -> List[RetrievalCandidate]:
+        # Sólo se consulta el dataset para los resultados cuyo payload no trae los metadatos
+        lookup = [r["filepath"] for r in raw if not _has_metadata(r)]
+        mds = dict(zip(lookup, self._metadata_many(lookup)))
         out: List[RetrievalCandidate] = []
         for r in raw:
             fp = r["filepath"]
             sim = float(r["score"])
-            md = self.dataset.get_metadata(fp)
+            md = dict(mds.get(fp) or {})
+            # Campos materializados en el indexado (payload del vector store) tienen prioridad
+            md.update({k: v for k, v in r.items() if k not in ("filepath", "score") and v is not None})
             out.append(RetrievalCandidate(id=fp, filepath=fp, similarity=sim, metadata=md))
         return out
 
-    def _rank(self, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    def _rank(self, items: List[Dict[str, Any]], cfg: Optional[AgentConfig] = None) -> List[Dict[str, Any]]:
         '''Clasifica los items enriquecidos según preferencia online, similitud y precio.'''
+        cfg = cfg or self.cfg
         def key_fn(x):
-            priority = 0 if (self.cfg.prefer_online and x.get("source") == "online") else 1
+            priority = 0 if (cfg.prefer_online and x.get("source") == "online") else 1
             sim = -float(x.get("similarity", 0.0))
-            price = float(x.get("price", 1e12))
+            price = x.get("price")
+            price = 1e12 if price is None else float(price)  # sin precio (p. ej. servicio caído) al final
             return (priority, sim, price)
         return sorted(items, key=key_fn)
 
-    def retrieve(self, query_image: str) -> AgentResponse:
-        '''Realiza la recuperación visual completa y devuelve la respuesta del agente.'''
-        self._ensure_index()
-        qvec = self.embedder.embed_image(query_image)
-        cands = self._retrieve(qvec, k=self.cfg.top_k)
-        items = [{"id": c.id, "filepath": c.filepath, "similarity": c.similarity, **c.metadata} for c in cands]
-        enriched = self.enricher.enrich(items)
-        ranked = self._rank(enriched)
+    def _needs_enrichment(self, item: Dict[str, Any]) -> bool:
+        '''
+        Un item necesita el enricher si éste tiene campos volátiles (p. ej. precio
+        en vivo) o si falta alguno de los campos que aporta. Sin `provides`
+        declarado, se enriquece siempre.
+        '''
+        provides = getattr(self.enricher, "provides", None)
+        if provides is None or getattr(self.enricher, "volatile", ()):
+            return True
+        return any(item.get(f) is None for f in provides)
+
+    def _enrich(self, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        '''Enriquece sólo los items que lo necesitan, conservando el orden.'''
+        idx = [i for i, x in enumerate(items) if self._needs_enrichment(x)]
+        if not idx:
+            return items
+        with span("enrich"):
+            done = self.enricher.enrich([items[i] for i in idx])
+        out = list(items)
+        for i, x in zip(idx, done):
+            out[i] = x
+        return out
+
+    def _plan(self, filters: QueryFilter, cfg: AgentConfig) -> Tuple[Optional[QueryFilter], int]:
+        '''
+        Decide el filtro delegado al vector store y cuántos candidatos pedir.
+        Los campos volátiles del enricher (p. ej. precio en vivo) nunca se delegan:
+        el store sólo tiene el valor del indexado. Sólo si queda un residuo no
+        delegable se sobre-pide.
+        '''
+        k = cfg.top_k
+        volatile = set(getattr(self.enricher, "volatile", ()))
+        pushed, residual = filters.split(lambda f: f not in volatile and self.vstore.supports_filter(f))
+        where = None if pushed.is_empty() else pushed
+        fetch = k if residual.is_empty() else min(k * cfg.overfetch_factor, cfg.max_fetch)
+        return where, fetch
+
+    def _filtered_candidates(
+        self,
+        qvec: List[float],
+        filters: QueryFilter,
+        cfg: AgentConfig,
+        first: Optional[List[RetrievalCandidate]] = None,
+    ) -> List[Dict[str, Any]]:
+        '''
+        Recupera y enriquece candidatos que cumplen `filters`, sobre-pidiendo de
+        forma adaptativa si hace falta. `first` permite reutilizar una primera
+        tanda de candidatos ya obtenida (p. ej. en una búsqueda por lotes).
+        '''
+        k = cfg.top_k
+        where, fetch = self._plan(filters, cfg)
+        cands = first if first is not None else self._retrieve(qvec, k=fetch, where=where)
+        enriched: List[Dict[str, Any]] = []
+        while True:
+            new = cands[len(enriched):]
+            items = [{"id": c.id, "filepath": c.filepath, "similarity": c.similarity, **c.metadata} for c in new]
+            enriched.extend(self._enrich(items))
+            kept = [x for x in enriched if filters.matches(x)]
+            if len(kept) >= k or len(cands) < fetch or fetch >= cfg.max_fetch:
+                return kept
+            fetch = min(fetch * cfg.overfetch_factor, cfg.max_fetch)
+            cands = self._retrieve(qvec, k=fetch, where=where)
+
+    def _graph_candidates(
+        self, queries: Sequence[ImageQuery], filters: Sequence[QueryFilter], cfgs: Sequence[AgentConfig]
+    ) -> Dict[int, List[RetrievalCandidate]]:
+        '''
+        Consultas sin filtros por items del catálogo respondidas desde el grafo
+        k-NN precalculado: ni embedder ni vector store. El resto (subidas, items
+        nuevos, filtros, top_k mayor que el grafo) va a la búsqueda en vivo.
+        '''
+        graph = self.knn_graph
+        if graph is None:
+            return {}
+        idxs = [
+            i for i, q in enumerate(queries)
+            if isinstance(q, str) and cfgs[i].use_knn_graph and filters[i].is_empty() and cfgs[i].top_k <= graph.k + 1
+        ]
+        if not idxs:
+            return {}
+        with span("knn_graph"):
+            raws = {i: graph.query(queries[i], k=cfgs[i].top_k) for i in idxs}
+        hits = {i: raw for i, raw in raws.items() if raw is not None}
+        CACHE_REQUESTS.labels(cache="knn_graph", result="hit").inc(len(hits))
+        CACHE_REQUESTS.labels(cache="knn_graph", result="miss").inc(len(idxs) - len(hits))
+        return {i: self._to_candidates(raw) for i, raw in hits.items()}
+
+    def _stored_vectors(self, queries: Sequence[ImageQuery], cfgs: Sequence[AgentConfig]) -> Dict[int, Any]:
+        '''
+        Vectores ya indexados de las consultas que son rutas del catálogo
+        ("más como esto"): se sirven del vector store sin pasar por el embedder.
+        '''
+        lookup = getattr(self.vstore, "get_vectors", None)
+        idxs = [i for i, q in enumerate(queries) if isinstance(q, str) and cfgs[i].reuse_indexed_vectors]
+        if lookup is None or not idxs:
+            return {}
+        with span("vector_lookup"):
+            try:
+                vecs = lookup([queries[i] for i in idxs])
+            except Exception:
+                return {}  # sólo es un atajo: el embedder cubre la consulta
+        found = {i: v for i, v in zip(idxs, vecs) if v is not None}
+        CACHE_REQUESTS.labels(cache="stored_vector", result="hit").inc(len(found))
+        CACHE_REQUESTS.labels(cache="stored_vector", result="miss").inc(len(idxs) - len(found))
+        return found
+
+    def _embed_queries(self, queries: Sequence[ImageQuery], cfgs: Sequence[AgentConfig]) -> List[Any]:
+        '''
+        Vector de cada consulta: primero el ya indexado; el resto se embebe con
+        un forward para las rutas y otro para los bytes.
+        '''
+        out: List[Any] = [None] * len(queries)
+        for i, vec in self._stored_vectors(queries, cfgs).items():
+            out[i] = vec
+        paths = [i for i, q in enumerate(queries) if out[i] is None and isinstance(q, str)]
+        blobs = [i for i, q in enumerate(queries) if out[i] is None and not isinstance(q, str)]
+        if paths or blobs:
+            with span("embed"):
+                for idxs, fn in ((paths, self.embedder.embed_images), (blobs, self.embedder.embed_images_bytes)):
+                    if idxs:
+                        for i, vec in zip(idxs, fn([queries[i] for i in idxs])):
+                            out[i] = vec
+        return out
+
+    def retrieve(
+        self,
+        query_image: ImageQuery,
+        filters: Optional[QueryFilter] = None,
+        config: Optional[AgentConfig] = None,
+    ) -> AgentResponse:
+        '''
+        Realiza la recuperación visual completa y devuelve la respuesta del agente.
+        `config` aplica sólo a esta llamada; `self.cfg` nunca se modifica.
+        '''
+        return self.retrieve_many([query_image], [filters], [config])[0]
+
+    def retrieve_many(
+        self,
+        query_images: Sequence[ImageQuery],
+        filters: Optional[Sequence[Optional[QueryFilter]]] = None,
+        configs: Optional[Sequence[Optional[AgentConfig]]] = None,
+    ) -> List[AgentResponse]:
+        '''
+        Recuperación por lotes: un único forward del embedder para todas las
+        imágenes y una búsqueda multi-vector por cada filtro delegado distinto.
+        Cada consulta puede ser una ruta o los bytes de la imagen; las rutas del
+        catálogo se responden del grafo k-NN (sin filtros) o reutilizan su vector
+        almacenado.
+        '''
+        t0 = time.perf_counter()
+        n = len(query_images)
+        filters = [f or QueryFilter() for f in (filters or [None] * n)]
+        cfgs = [c or self.cfg for c in (configs or [None] * n)]
+        QUERIES.inc(n)
+        BATCH_SIZE.labels(source="agent").observe(n)
+        with collect() as shared:
+            self._ensure_index()
+            first: List[Optional[List[RetrievalCandidate]]] = [None] * n
+            for i, cands in self._graph_candidates(query_images, filters, cfgs).items():
+                first[i] = cands
+            live = [i for i in range(n) if first[i] is None]
+            qvecs: List[Any] = [None] * n
+            if live:
+                vecs = self._embed_queries([query_images[i] for i in live], [cfgs[i] for i in live])
+                for i, vec in zip(live, vecs):
+                    qvecs[i] = vec
+
+            # Agrupa por filtro delegado: cada grupo es una sola búsqueda multi-vector
+            plans = {i: self._plan(filters[i], cfgs[i]) for i in live}
+            groups: Dict[Any, List[int]] = {}
+            for i, (where, _) in plans.items():
+                key = None if where is None else (where.color, where.max_price)
+                groups.setdefault(key, []).append(i)
+            for idxs in groups.values():
+                where = plans[idxs[0]][0]
+                k = max(plans[i][1] for i in idxs)
+                cands = self._retrieve_many([qvecs[i] for i in idxs], k=k, where=where)
+                for i, c in zip(idxs, cands):
+                    first[i] = c[:plans[i][1]]
+
+        out: List[AgentResponse] = []
+        for i, query_image in enumerate(query_images):
+            # desglose por consulta = etapas compartidas del lote + las suyas
+            with collect() as own:
+                kept = self._filtered_candidates(qvecs[i], filters[i], cfgs[i], first=first[i])
+                with span("rank"):
+                    ranked = self._rank(kept, cfgs[i])[:cfgs[i].top_k]
+            resp = self._respond(query_label(query_image), ranked)
+            if shared or own:
+                resp.timings = {k: shared.get(k, 0.0) + own.get(k, 0.0) for k in {**shared, **own}}
+                resp.timings["total"] = time.perf_counter() - t0
+            out.append(resp)
+        RETRIEVE_SECONDS.observe(time.perf_counter() - t0)
+        return out
+
+    def _respond(self, query_image: str, ranked: List[Dict[str, Any]]) -> AgentResponse:
         results = [
             EnrichedItem(
                 id=x["id"], filepath=x["filepath"], similarity=float(x["similarity"]),
                 title=x.get("title"), brand=x.get("brand"), color=x.get("color"),
                 price=x.get("price"), currency=x.get("currency", "EUR"),
-                source=x.get("source"), url=x.get("url")
+                source=x.get("source"), url=x.get("url"), available=x.get("available")
             )
             for x in ranked
         ]
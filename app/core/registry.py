@@ -0,0 +1,103 @@
+# app/core/registry.py
+from typing import Dict, Any, Callable, Generic, Optional, TypeVar
+import sys, time, importlib, threading
+
+"""
+Registro de backends de las herramientas (embedder, vector store, dataset, enricher).
+Cada backend se importa sólo cuando se selecciona, así el arranque de la API no
+paga torch/open_clip/weaviate si no se usan. `import_report()` resume qué se
+importó y cuánto costó.
+"""
+
+BACKENDS: Dict[str, Dict[str, str]] = {
+    "embedder": {
+        "mock": "app.core.tools.mock_embedder:MockEmbedder",
+        "clip": "app.core.tools.clip_embedder:CLIPEmbedder",
+    },
+    "vstore": {
+        "weaviate": "app.core.tools.weaviate_vector_store:WeaviateVectorStore",
+        "numpy": "app.core.tools.numpy_vector_store:NumpyVectorStore",
+        "quantized": "app.core.tools.quantized_vector_store:QuantizedVectorStore",
+        "sharded": "app.core.tools.sharded_vector_store:ShardedVectorStore",
+        "mock": "app.core.tools.mock_vector_store:MockVectorStore",
+    },
+    "dataset": {
+        "fs": "app.core.tools.fs_dataset:FSDataset",
+        "mock": "app.core.tools.mock_dataset:MockDataset",
+    },
+    "enricher": {
+        "mock": "app.core.tools.mock_enricher:MockEnricher",
+        "simple": "app.core.tools.enricher:SimpleEnricher",
+        "price_api": "app.core.tools.price_api_enricher:PriceAPIEnricher",
+    },
+}
+
+# Módulos pesados a vigilar en el informe
+HEAVY_MODULES = ("torch", "open_clip", "weaviate", "fiftyone", "onnxruntime", "httpx", "PIL")
+
+_import_times: Dict[str, float] = {}
+_lazies: Dict[str, "Lazy"] = {}
+
+def load_backend(kind: str, name: str):
+    '''Importa (la primera vez) y devuelve la clase del backend `name` para `kind`.'''
+    options = BACKENDS.get(kind, {})
+    if name not in options:
+        raise ValueError(f"Backend '{name}' desconocido para {kind}; opciones: {sorted(options)}")
+    module, attr = options[name].split(":")
+    t0 = time.perf_counter()
+    mod = importlib.import_module(module)
+    _import_times.setdefault(module, time.perf_counter() - t0)
+    return getattr(mod, attr)
+
+T = TypeVar("T")
+
+class Lazy(Generic[T]):
+    """
+    Proxy que construye la herramienta en el primer uso (import del backend,
+    carga del modelo, cliente de red). Si la construcción falla no se cachea
+    el error: el siguiente uso lo reintenta.
+    """
+    def __init__(self, name: str, factory: Callable[[], T], backend: str = ""):
+        self._name = name
+        self._backend = backend
+        self._factory = factory
+        self._target: Optional[T] = None
+        self._lock = threading.Lock()
+        self._build_s: Optional[float] = None
+        _lazies[name] = self
+
+    @property
+    def built(self) -> bool:
+        return self._target is not None
+
+    def get(self) -> T:
+        if self._target is None:
+            with self._lock:
+                if self._target is None:
+                    t0 = time.perf_counter()
+                    self._target = self._factory()
+                    self._build_s = time.perf_counter() - t0
+        return self._target
+
+    def __getattr__(self, attr: str) -> Any:
+        # sólo se llama para atributos que no son del proxy
+        return getattr(self.get(), attr)
+
+    def __len__(self) -> int:
+        return len(self.get())
+
+    def __repr__(self) -> str:
+        return f"Lazy({self._name}, built={self.built})"
+
+def unwrap(obj: Any) -> Any:
+    '''Objeto real detrás de un proxy Lazy (lo construye si hace falta).'''
+    return obj.get() if isinstance(obj, Lazy) else obj
+
+def import_report() -> Dict[str, Any]:
+    '''Backends seleccionados, coste de sus imports y construcciones, y módulos pesados cargados.'''
+    return {
+        "selected": {n: l._backend for n, l in _lazies.items()},
+        "backend_imports_s": {m: round(s, 4) for m, s in _import_times.items()},
+        "built_s": {n: (round(l._build_s, 4) if l.built else None) for n, l in _lazies.items()},
+        "heavy_modules_loaded": [m for m in HEAVY_MODULES if m in sys.modules],
+    }
@@ -0,0 +1,38 @@
+# app/core/snapshot.py
+from typing import List, Dict, Any, Tuple, Optional
+import os, json, time
+import numpy as np
+
+"""Snapshots en disco (.npz) de los vector stores en proceso: vectores + payloads."""
+
+def write_snapshot(path: str, vectors: np.ndarray, payloads: List[Dict[str, Any]], model_tag: str = "") -> None:
+    '''Escribe el snapshot de forma atómica (archivo temporal + os.replace).'''
+    meta = {"count": len(payloads), "dim": int(vectors.shape[1]) if vectors.ndim == 2 else 0,
+            "model_tag": model_tag, "created_at": time.time()}
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        np.savez(
+            f,
+            vectors=np.ascontiguousarray(vectors, dtype=np.float32),
+            payloads=np.frombuffer(json.dumps(payloads).encode("utf-8"), dtype=np.uint8),
+            meta=np.frombuffer(json.dumps(meta).encode("utf-8"), dtype=np.uint8),
+        )
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+def read_snapshot(path: str, model_tag: Optional[str] = None) -> Tuple[np.ndarray, List[Dict[str, Any]], Dict[str, Any]]:
+    '''
+    Lee un snapshot. Con `model_tag`, falla si fue construido con otro modelo
+    (los vectores no serían comparables con los de consulta).
+    '''
+    with np.load(path) as data:
+        meta = json.loads(data["meta"].tobytes().decode("utf-8"))
+        if model_tag and meta.get("model_tag") and meta["model_tag"] != model_tag:
+            raise ValueError(f"Snapshot {path} es de {meta['model_tag']}, esperado {model_tag}")
+        vectors = data["vectors"]
+        payloads = json.loads(data["payloads"].tobytes().decode("utf-8"))
+    if len(payloads) != vectors.shape[0]:
+        raise ValueError(f"Snapshot {path} corrupto: {vectors.shape[0]} vectores y {len(payloads)} payloads")
+    return vectors, payloads, meta
@@ -1,21 +1,32 @@
-from typing import Protocol, List, Dict, Any
+from typing import Protocol, List, Dict, Any, Sequence, Optional
+from ..types import QueryFilter
 
 """Definiciones de protocolos para las herramientas del agente visual."""   
 
 class EmbedderTool(Protocol):
-    """Herramienta para incrustar imágenes."""
+    """Herramienta para incrustar imágenes (por ruta o con el contenido ya en memoria)."""
     def embed_image(self, image_path: str) -> List[float]: ...
+    def embed_images(self, image_paths: Sequence[str], batch_size: Optional[int] = None) -> Sequence[Sequence[float]]: ...
+    def embed_image_bytes(self, data: bytes) -> List[float]: ...
+    def embed_images_bytes(self, blobs: Sequence[bytes], batch_size: Optional[int] = None) -> Sequence[Sequence[float]]: ...
 
 class DatasetTool(Protocol):
     """Herramienta para interactuar con el conjunto de datos."""
     def sample_paths(self, limit: int = 200) -> List[str]: ...
     def get_metadata(self, filepath: str) -> Dict[str, Any]: ...
+    def get_metadata_many(self, filepaths: Sequence[str]) -> List[Dict[str, Any]]: ...
 
 class VectorStoreTool(Protocol):
     """Herramienta para almacenar y recuperar vectores."""
     def index(self, vectors: List[List[float]], payloads: List[Dict[str, Any]]) -> None: ...
-    def query(self, vector: List[float], k: int = 10) -> List[Dict[str, Any]]: ...
+    def query(self, vector: List[float], k: int = 10, where: Optional[QueryFilter] = None) -> List[Dict[str, Any]]: ...
+    def supports_filter(self, field: str) -> bool: ...
+    def get_vectors(self, filepaths: Sequence[str]) -> List[Optional[Sequence[float]]]: ...
 
 class EnricherTool(Protocol):
-    """Herramienta para enriquecer los resultados de la recuperación visual."""
+    """
+    Herramienta para enriquecer los resultados de la recuperación visual.
+    Opcionalmente declara `provides` (campos que rellena) y `volatile` (campos
+    que cambian y deben refrescarse en cada consulta, p. ej. precio en vivo).
+    """
     def enrich(self, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]: ...
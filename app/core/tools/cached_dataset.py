@@ -0,0 +1,68 @@
+# app/core/tools/cached_dataset.py
+from typing import List, Dict, Any, Sequence
+from collections import OrderedDict
+import threading
+from ..metrics import CACHE_REQUESTS
+
+class CachedDataset:
+    """
+    Envoltorio de un DatasetTool con LRU en proceso para los metadatos.
+    Los fallos se resuelven en una sola llamada `get_metadata_many` del dataset
+    interno (o con `get_metadata` uno a uno si no la implementa).
+    Si el dataset interno expone `generation` (FSDataset), la caché se vacía
+    en cuanto cambia, es decir, tras un refresh del manifiesto con cambios.
+    """
+    def __init__(self, inner, maxsize: int = 50000):
+        self.inner = inner
+        self.maxsize = maxsize
+        self._lru: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._generation = getattr(inner, "generation", None)
+
+    def _check_generation(self) -> None:
+        gen = getattr(self.inner, "generation", None)
+        if gen != self._generation:
+            with self._lock:
+                self._lru.clear()
+                self._generation = gen
+
+    def sample_paths(self, limit: int = 200) -> List[str]:
+        paths = self.inner.sample_paths(limit=limit)
+        self._check_generation()
+        return paths
+
+    def get_metadata(self, filepath: str) -> Dict[str, Any]:
+        return self.get_metadata_many([filepath])[0]
+
+    def get_metadata_many(self, filepaths: Sequence[str]) -> List[Dict[str, Any]]:
+        self._check_generation()
+        found: Dict[str, Dict[str, Any]] = {}
+        with self._lock:
+            for fp in filepaths:
+                md = self._lru.get(fp)
+                if md is not None:
+                    self._lru.move_to_end(fp)
+                    found[fp] = md
+            missing = [fp for fp in dict.fromkeys(filepaths) if fp not in found]
+            self.hits += len(filepaths) - len(missing)
+            self.misses += len(missing)
+        CACHE_REQUESTS.labels(cache="metadata", result="hit").inc(len(filepaths) - len(missing))
+        CACHE_REQUESTS.labels(cache="metadata", result="miss").inc(len(missing))
+        if missing:
+            many = getattr(self.inner, "get_metadata_many", None)
+            mds = many(missing) if many is not None else [self.inner.get_metadata(fp) for fp in missing]
+            with self._lock:
+                for fp, md in zip(missing, mds):
+                    found[fp] = md
+                    self._lru[fp] = md
+                    self._lru.move_to_end(fp)
+                while len(self._lru) > self.maxsize:
+                    self._lru.popitem(last=False)
+        # copias: los llamadores mezclan campos del payload sobre el dict
+        return [dict(found[fp]) for fp in filepaths]
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._lru.clear()
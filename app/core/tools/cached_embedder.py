@@ -0,0 +1,218 @@
+# app/core/tools/cached_embedder.py
+from typing import Callable, List, Dict, Optional, Sequence
+from collections import OrderedDict
+import os, re, json, fcntl, hashlib, threading
+import numpy as np
+from ..utils import content_digest, model_tag_for
+from ..metrics import CACHE_REQUESTS
+
+_KEY_BYTES = 32  # sha256
+
+class VectorFile:
+    """
+    Almacén append-only en disco para vectores de una misma etiqueta de modelo:
+      - keys.bin: un digest de 32 bytes por fila
+      - vectors.f32: matriz float32 (filas, dim) leída por memmap
+    Las escrituras se serializan entre procesos con flock, así API e indexer
+    pueden compartir el mismo directorio.
+    """
+    def __init__(self, directory: str, dim: int, model_tag: str = ""):
+        os.makedirs(directory, exist_ok=True)
+        self.dim = int(dim)
+        self.keys_path = os.path.join(directory, "keys.bin")
+        self.vecs_path = os.path.join(directory, "vectors.f32")
+        self.lock_path = os.path.join(directory, ".lock")
+        meta_path = os.path.join(directory, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if int(meta.get("dim", self.dim)) != self.dim:
+                raise ValueError(f"Caché en {directory} tiene dim={meta['dim']}, esperado {self.dim}")
+        else:
+            with open(meta_path, "w") as f:
+                json.dump({"dim": self.dim, "model_tag": model_tag}, f)
+        for p in (self.keys_path, self.vecs_path):
+            open(p, "ab").close()
+        self._rows: Dict[bytes, int] = {}
+        self._keys_off = 0
+        self._mm: Optional[np.memmap] = None
+        self._lock = threading.Lock()
+        self.refresh()
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def refresh(self) -> None:
+        '''Carga las claves añadidas (por este u otro proceso) desde la última lectura.'''
+        with self._lock:
+            with open(self.keys_path, "rb") as f:
+                f.seek(self._keys_off)
+                data = f.read()
+            n = len(data) // _KEY_BYTES
+            base = self._keys_off // _KEY_BYTES
+            for i in range(n):
+                self._rows.setdefault(data[i * _KEY_BYTES:(i + 1) * _KEY_BYTES], base + i)
+            self._keys_off += n * _KEY_BYTES
+
+    def get(self, key: bytes) -> Optional[np.ndarray]:
+        row = self._rows.get(key)
+        if row is None:
+            return None
+        with self._lock:
+            if self._mm is None or row >= self._mm.shape[0]:
+                rows = os.path.getsize(self.vecs_path) // (self.dim * 4)
+                self._mm = np.memmap(self.vecs_path, dtype=np.float32, mode="r", shape=(rows, self.dim))
+            return np.array(self._mm[row])
+
+    def put_many(self, keys: Sequence[bytes], vectors: np.ndarray) -> None:
+        '''Añade vectores nuevos (las claves ya presentes se ignoran).'''
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(keys), self.dim)
+        with open(self.lock_path, "a") as lockf:
+            fcntl.flock(lockf, fcntl.LOCK_EX)
+            try:
+                self.refresh()
+                new, seen = [], set()
+                for i, k in enumerate(keys):
+                    if k not in self._rows and k not in seen:
+                        seen.add(k)
+                        new.append(i)
+                if not new:
+                    return
+                # Descarta un registro de clave incompleto (escritura interrumpida)
+                size = os.path.getsize(self.keys_path)
+                base = size // _KEY_BYTES
+                if size % _KEY_BYTES:
+                    os.truncate(self.keys_path, base * _KEY_BYTES)
+                # Primero los vectores, luego las claves: una clave visible siempre tiene su vector
+                with open(self.vecs_path, "r+b") as f:
+                    f.seek(base * self.dim * 4)
+                    f.write(np.ascontiguousarray(vectors[new]).tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+                with open(self.keys_path, "ab") as f:
+                    f.write(b"".join(keys[i] for i in new))
+                self.refresh()
+            finally:
+                fcntl.flock(lockf, fcntl.LOCK_UN)
+
+class CachedEmbedder:
+    """
+    Envuelve cualquier EmbedderTool con una caché direccionada por contenido.
+    Clave = sha256(contenido de la imagen) dentro de un directorio por etiqueta
+    de modelo (modelo/pesos/dim), así cambiar `model_name` nunca sirve vectores
+    de otro modelo. Delante del fichero memmap hay un LRU en memoria.
+    Las consultas por bytes usan la misma clave: subir una imagen ya indexada
+    es un acierto de caché.
+    """
+    def __init__(
+        self,
+        embedder,
+        cache_dir: str = "data/emb_cache",
+        model_tag: Optional[str] = None,
+        lru_size: int = 4096,
+    ):
+        self.embedder = embedder
+        self.model_tag = model_tag or model_tag_for(embedder)
+        safe = re.sub(r"[^A-Za-z0-9._-]+", "_", self.model_tag)[:64]
+        digest = hashlib.sha1(self.model_tag.encode("utf-8")).hexdigest()[:8]
+        self.directory = os.path.join(cache_dir, f"{safe}-{digest}")
+        self.lru_size = lru_size
+        self._lru: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._store: Optional[VectorFile] = None
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def dim(self) -> Optional[int]:
+        return getattr(self.embedder, "dim", None)
+
+    def _open_store(self, dim: int) -> VectorFile:
+        if self._store is None:
+            self._store = VectorFile(self.directory, dim, self.model_tag)
+        return self._store
+
+    def _lru_get(self, key: bytes) -> Optional[np.ndarray]:
+        with self._lock:
+            vec = self._lru.get(key)
+            if vec is not None:
+                self._lru.move_to_end(key)
+            return vec
+
+    def _lru_put(self, key: bytes, vec: np.ndarray) -> None:
+        with self._lock:
+            self._lru[key] = vec
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.lru_size:
+                self._lru.popitem(last=False)
+
+    def _lookup(self, key: bytes) -> Optional[np.ndarray]:
+        vec = self._lru_get(key)
+        if vec is None and self._store is not None:
+            vec = self._store.get(key)
+            if vec is not None:
+                self._lru_put(key, vec)
+        return vec
+
+    def embed_images(self, image_paths: Sequence[str], batch_size: Optional[int] = None) -> np.ndarray:
+        paths = list(image_paths)
+        return self._embed_keyed([content_digest(p) for p in paths], paths, self.embedder.embed_images, batch_size)
+
+    def embed_images_bytes(self, blobs: Sequence[bytes], batch_size: Optional[int] = None) -> np.ndarray:
+        blobs = list(blobs)
+        keys = [hashlib.sha256(b).digest() for b in blobs]
+        return self._embed_keyed(keys, blobs, self.embedder.embed_images_bytes, batch_size)
+
+    def embed_image_bytes(self, data: bytes) -> List[float]:
+        return self.embed_images_bytes([data])[0].tolist()
+
+    def _embed_keyed(self, keys: List[bytes], sources: list, compute: Callable, batch_size: Optional[int]) -> np.ndarray:
+        '''Sirve de caché lo que haya y calcula con `compute` sólo los contenidos únicos que falten.'''
+        if self._store is None and self.dim is not None:
+            self._open_store(self.dim)
+        found: Dict[int, np.ndarray] = {}
+        for i, k in enumerate(keys):
+            vec = self._lookup(k)
+            if vec is not None:
+                found[i] = vec
+        if len(found) < len(sources) and self._store is not None:
+            # Otro proceso (p. ej. el indexer) puede haber añadido vectores
+            self._store.refresh()
+            for i, k in enumerate(keys):
+                if i not in found:
+                    vec = self._lookup(k)
+                    if vec is not None:
+                        found[i] = vec
+        missing = [i for i in range(len(sources)) if i not in found]
+        self.hits += len(found)
+        self.misses += len(missing)
+        CACHE_REQUESTS.labels(cache="embedding", result="hit").inc(len(found))
+        CACHE_REQUESTS.labels(cache="embedding", result="miss").inc(len(missing))
+        if missing:
+            unique: Dict[bytes, int] = {}
+            for i in missing:
+                unique.setdefault(keys[i], i)
+            computed = np.asarray(
+                compute([sources[i] for i in unique.values()], batch_size=batch_size),
+                dtype=np.float32,
+            )
+            store = self._open_store(computed.shape[1])
+            store.put_many(list(unique.keys()), computed)
+            rows = {k: row for row, k in enumerate(unique.keys())}
+            for i in missing:
+                found[i] = computed[rows[keys[i]]]
+            for k, row in rows.items():
+                self._lru_put(k, computed[row])
+        dim = self.dim or (next(iter(found.values())).shape[0] if found else 0)
+        out = np.empty((len(sources), dim), dtype=np.float32)
+        for i, vec in found.items():
+            out[i] = vec
+        return out
+
+    def warmup(self) -> None:
+        warm = getattr(self.embedder, "warmup", None)
+        if warm is not None:
+            warm()
+
+    def embed_image(self, image_path: str) -> List[float]:
+        return self.embed_images([image_path])[0].tolist()
@@ -1,12 +1,25 @@
 # app/core/tools/clip_embedder.py
-from typing import List, Optional
+from typing import Dict, List, Optional, Sequence, Union
+from concurrent.futures import ThreadPoolExecutor
+import io, os
+import numpy as np
 import torch
 import open_clip
 from PIL import Image
+from . import clip_onnx
+from ..utils import clip_model_tag
+
+BACKENDS = ("torch", "torchscript", "onnx", "onnx-int8")
 
 class CLIPEmbedder:
     """
     Encoder de imágenes -> vector unitario (OpenCLIP).
+    Decodifica/preprocesa en un pool de hilos y ejecuta el modelo por lotes.
+    `backend` elige cómo se ejecuta el encoder en CPU:
+      - "torch": PyTorch eager (por defecto)
+      - "torchscript": grafo trazado y congelado
+      - "onnx" / "onnx-int8": ONNX Runtime, opcionalmente con pesos int8 (cuantización dinámica)
+    El .onnx se exporta a `onnx_path` la primera vez y se reutiliza después.
     """
     def __init__(
         self,
@@ -15,7 +28,17 @@ class CLIPEmbedder:
         device: Optional[str] = None,
         dtype: torch.dtype = torch.float32,
         normalize: bool = True,
+        batch_size: int = 32,
+        num_workers: int = 4,
+        backend: str = "torch",
+        onnx_path: Optional[str] = None,
+        intra_op_threads: int = 0,
+        inter_op_threads: int = 0,
     ):
+        if backend not in BACKENDS:
+            raise ValueError(f"backend debe ser uno de {BACKENDS}, no {backend!r}")
+        self.model_name = model_name
+        self.pretrained = pretrained
         self.device = torch.device(device or ("cuda" if torch.cuda.is_available() else "cpu"))
         self.model, _, self.preprocess = open_clip.create_model_and_transforms(
             model_name, pretrained=pretrained, device=self.device
@@ -23,22 +46,130 @@ class CLIPEmbedder:
         self.model.eval()
         self.dtype = dtype
         self.normalize = normalize
+        self.batch_size = batch_size
+        self._pool = ThreadPoolExecutor(max_workers=num_workers, thread_name_prefix="clip-decode")
+
+        # Dimensión desde la config del modelo; si no la expone, una pasada de prueba
+        self._dim = getattr(self.model.visual, "output_dim", None)
+        if self._dim is None:
+            self._dim = int(self._forward_dummy().shape[-1])
 
-        # Detecta dimensión (una sola pasada)
-        with torch.no_grad():
-            dummy = torch.zeros(1, 3, 224, 224, dtype=self.dtype, device=self.device)
-            out = self.model.encode_image(dummy)
-            self._dim = int(out.shape[-1])
+        self.backend = backend
+        self._script = None
+        self._onnx: Optional[clip_onnx.OnnxImageEncoder] = None
+        if backend != "torch" and self.device.type != "cpu":
+            raise ValueError(f"backend {backend!r} sólo está soportado en CPU")
+        if intra_op_threads > 0:
+            torch.set_num_threads(intra_op_threads)
+        if inter_op_threads > 0:
+            try:
+                torch.set_num_interop_threads(inter_op_threads)
+            except RuntimeError:
+                pass  # sólo se puede fijar antes del primer trabajo paralelo
+        if backend == "torchscript":
+            self._script = clip_onnx.export_torchscript(self.model)
+        elif backend.startswith("onnx"):
+            path = self._ensure_onnx(onnx_path, int8=backend == "onnx-int8")
+            self._onnx = clip_onnx.OnnxImageEncoder(path, intra_op_threads, inter_op_threads)
+        # los vectores int8 no son intercambiables con los fp32: huellas/cachés propias
+        self.model_tag = clip_model_tag(model_name, pretrained, self.dim, "int8" if backend == "onnx-int8" else "")
 
     @property
     def dim(self) -> int:
-        return self._dim
+        return int(self._dim)
+
+    def _ensure_onnx(self, onnx_path: Optional[str], int8: bool) -> str:
+        '''
+        Exporta (y cuantiza) el encoder si aún no existe; devuelve la ruta a cargar.
+        `onnx_path` es el export fp32; la variante int8 vive al lado (*.int8.onnx).
+        '''
+        base = onnx_path or os.path.join("data", "models", f"clip_{self.model_name}_{self.pretrained}.onnx")
+        target = base[:-len(".onnx")] + ".int8.onnx" if int8 else base
+        if os.path.exists(target):
+            return target
+        if not os.path.exists(base):
+            clip_onnx.export_onnx(self.model, base)
+        return clip_onnx.quantize_int8(base, target) if int8 else base
 
     @torch.inference_mode()
-    def embed_image(self, image_path: str) -> List[float]:
-        img = Image.open(image_path).convert("RGB")
-        pixel = self.preprocess(img).unsqueeze(0).to(self.device, dtype=self.dtype)
-        feats = self.model.encode_image(pixel).squeeze(0)
+    def _forward_dummy(self, batch: int = 1) -> torch.Tensor:
+        h, w = clip_onnx.image_size_of(self.model)
+        return self.model.encode_image(torch.zeros(batch, 3, h, w, dtype=self.dtype, device=self.device))
+
+    def warmup(self) -> None:
+        '''Pasada de prueba con un lote completo (asigna memoria / kernels antes del tráfico real).'''
+        h, w = clip_onnx.image_size_of(self.model)
+        self._encode(torch.zeros(self.batch_size, 3, h, w))
+
+    def _load(self, src: Union[str, bytes]) -> torch.Tensor:
+        '''
+        Abre, decodifica y preprocesa una imagen (ruta o bytes en memoria; se ejecuta en el pool).
+        En JPEG, `draft` decodifica directamente a 1/2..1/8 de escala sin bajar del
+        tamaño de entrada del modelo: una foto de móvil de 12 MP no se decodifica entera.
+        '''
+        with Image.open(io.BytesIO(src) if isinstance(src, (bytes, bytearray)) else src) as img:
+            img.draft("RGB", clip_onnx.image_size_of(self.model))
+            return self.preprocess(img.convert("RGB"))
+
+    def _submit(self, sources: Sequence[Union[str, bytes]]):
+        return [self._pool.submit(self._load, p) for p in sources]
+
+    @torch.inference_mode()
+    def _encode(self, pixels: torch.Tensor) -> np.ndarray:
+        if self._onnx is not None:
+            feats = torch.from_numpy(self._onnx(pixels.float().numpy()))
+        elif self._script is not None:
+            feats = self._script(pixels.float())
+        else:
+            feats = self.model.encode_image(pixels.to(self.device, dtype=self.dtype))
         if self.normalize:
-            feats = feats / (feats.norm(p=2) + 1e-12)
-        return feats.detach().cpu().tolist()
+            feats = feats / (feats.norm(p=2, dim=-1, keepdim=True) + 1e-12)
+        return feats.detach().float().cpu().numpy()
+
+    @torch.inference_mode()
+    def parity_check(self, image_paths: Optional[Sequence[str]] = None, n: int = 8, seed: int = 0) -> Dict[str, float]:
+        '''
+        Concordancia (coseno por fila) del backend activo con el modelo eager,
+        sobre `image_paths` o, si no se dan, `n` entradas aleatorias.
+        '''
+        if image_paths:
+            pixels = torch.stack([self._load(p) for p in image_paths])
+        else:
+            h, w = clip_onnx.image_size_of(self.model)
+            pixels = torch.randn(n, 3, h, w, generator=torch.Generator().manual_seed(seed))
+        ref = self.model.encode_image(pixels.to(self.device, dtype=self.dtype)).float().cpu().numpy()
+        report = clip_onnx.cosine_agreement(ref, self._encode(pixels))
+        report["backend"] = self.backend
+        return report
+
+    def _embed_sources(self, sources: Sequence[Union[str, bytes]], batch_size: Optional[int]) -> np.ndarray:
+        '''Mientras el modelo procesa un lote, el pool ya decodifica el siguiente.'''
+        sources = list(sources)
+        bs = max(int(batch_size or self.batch_size), 1)
+        out = np.empty((len(sources), self.dim), dtype=np.float32)
+        if not sources:
+            return out
+        starts = list(range(0, len(sources), bs))
+        pending = self._submit(sources[0:bs])
+        for n, start in enumerate(starts):
+            current = pending
+            if n + 1 < len(starts):
+                nxt = starts[n + 1]
+                pending = self._submit(sources[nxt:nxt + bs])
+            pixels = torch.stack([f.result() for f in current])
+            out[start:start + len(current)] = self._encode(pixels)
+        return out
+
+    def embed_images(self, image_paths: Sequence[str], batch_size: Optional[int] = None) -> np.ndarray:
+        '''Embebe una lista de imágenes -> matriz float32 (N, dim).'''
+        return self._embed_sources(image_paths, batch_size)
+
+    def embed_images_bytes(self, blobs: Sequence[bytes], batch_size: Optional[int] = None) -> np.ndarray:
+        '''Igual que `embed_images` pero con el contenido ya en memoria (p. ej. una subida HTTP).'''
+        return self._embed_sources(blobs, batch_size)
+
+    def embed_image_bytes(self, data: bytes) -> List[float]:
+        return self._embed_sources([data], batch_size=1)[0].tolist()
+
+    def embed_image(self, image_path: str) -> List[float]:
+        return self.embed_images([image_path], batch_size=1)[0].tolist()
@@ -0,0 +1,82 @@
+# app/core/tools/clip_onnx.py
+from typing import Dict, Optional, Sequence, Tuple
+import os
+import numpy as np
+import torch
+
+"""
+Backends de inferencia en CPU para el encoder de imagen de CLIP:
+  - export a TorchScript (trace + optimize_for_inference) u ONNX (batch dinámico)
+  - cuantización dinámica int8 de los pesos del grafo ONNX
+  - sesión de ONNX Runtime con hilos intra/inter-op configurables
+onnx/onnxruntime sólo se importan si se usa el backend ONNX.
+"""
+
+class _ImageEncoder(torch.nn.Module):
+    '''Envuelve model.encode_image para poder trazarlo/exportarlo como grafo.'''
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, pixels: torch.Tensor) -> torch.Tensor:
+        return self.model.encode_image(pixels)
+
+def image_size_of(model) -> Tuple[int, int]:
+    size = getattr(model.visual, "image_size", 224)
+    return tuple(size) if isinstance(size, (tuple, list)) else (size, size)
+
+def export_torchscript(model, batch: int = 1) -> torch.jit.ScriptModule:
+    h, w = image_size_of(model)
+    # no_grad y no inference_mode: los tensores de inferencia no deben quedar dentro del grafo
+    with torch.no_grad():
+        traced = torch.jit.trace(_ImageEncoder(model).eval(), torch.zeros(batch, 3, h, w))
+    return torch.jit.optimize_for_inference(torch.jit.freeze(traced.eval()))
+
+def export_onnx(model, path: str, opset: int = 17) -> str:
+    '''Exporta el encoder de imagen a ONNX con eje de batch dinámico.'''
+    h, w = image_size_of(model)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with torch.no_grad():
+        torch.onnx.export(
+            _ImageEncoder(model).eval(), torch.zeros(1, 3, h, w), tmp,
+            input_names=["pixels"], output_names=["features"],
+            dynamic_axes={"pixels": {0: "batch"}, "features": {0: "batch"}},
+            opset_version=opset, do_constant_folding=True,
+        )
+    os.replace(tmp, path)
+    return path
+
+def quantize_int8(src: str, dst: str) -> str:
+    '''Cuantización dinámica int8 (pesos int8, activaciones cuantizadas al vuelo).'''
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+    tmp = f"{dst}.tmp"
+    quantize_dynamic(src, tmp, weight_type=QuantType.QInt8)
+    os.replace(tmp, dst)
+    return dst
+
+class OnnxImageEncoder:
+    """Sesión de ONNX Runtime (CPU) para el encoder exportado: pixels (N,3,H,W) -> features (N,D)."""
+    def __init__(self, path: str, intra_op_threads: int = 0, inter_op_threads: int = 0):
+        import onnxruntime as ort
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra_op_threads > 0:
+            opts.intra_op_num_threads = intra_op_threads
+        if inter_op_threads > 0:
+            opts.inter_op_num_threads = inter_op_threads
+            opts.execution_mode = ort.ExecutionMode.ORT_PARALLEL
+        self.path = path
+        self.session = ort.InferenceSession(path, sess_options=opts, providers=["CPUExecutionProvider"])
+        self._input = self.session.get_inputs()[0].name
+
+    def __call__(self, pixels: np.ndarray) -> np.ndarray:
+        return self.session.run(None, {self._input: np.ascontiguousarray(pixels, dtype=np.float32)})[0]
+
+def cosine_agreement(a: np.ndarray, b: np.ndarray) -> Dict[str, float]:
+    '''Coseno fila a fila entre dos matrices de embeddings (min/media/p1).'''
+    a = a / (np.linalg.norm(a, axis=1, keepdims=True) + 1e-12)
+    b = b / (np.linalg.norm(b, axis=1, keepdims=True) + 1e-12)
+    cos = (a * b).sum(axis=1)
+    return {"n": int(cos.size), "cos_min": float(cos.min()), "cos_mean": float(cos.mean()),
+            "cos_p1": float(np.percentile(cos, 1))}
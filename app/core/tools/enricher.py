@@ -1,36 +1,63 @@
 # app/core/tools/enricher.py
-from typing import Dict, Any, List, Tuple
+from typing import Dict, Any, List, Optional
+from concurrent.futures import ProcessPoolExecutor
 from PIL import Image
-from collections import Counter
-import os, re, hashlib, math
+import multiprocessing as mp
+import numpy as np
+import os, re, hashlib, threading
 
 BASIC_COLORS = [
     "black","white","gray","red","green","blue","yellow","purple","orange","brown","pink","beige","navy"
 ]
 
-def _nearest_basic_color(rgb: Tuple[int,int,int]) -> str:
-    # distancia euclidiana a una paleta simple
-    palette = {
-        "black": (0,0,0), "white": (255,255,255), "gray": (128,128,128),
-        "red": (200,30,30), "green": (30,160,60), "blue": (40,80,200),
-        "yellow": (230,220,30), "purple": (140,60,160), "orange": (240,140,20),
-        "brown": (120,80,40), "pink": (240,160,200), "beige": (220,210,180), "navy": (20,40,100)
-    }
-    def dist(a,b): return math.sqrt(sum((a[i]-b[i])**2 for i in range(3)))
-    name, _ = min(palette.items(), key=lambda kv: dist(rgb, kv[1]))
-    return name
+PALETTE = {
+    "black": (0,0,0), "white": (255,255,255), "gray": (128,128,128),
+    "red": (200,30,30), "green": (30,160,60), "blue": (40,80,200),
+    "yellow": (230,220,30), "purple": (140,60,160), "orange": (240,140,20),
+    "brown": (120,80,40), "pink": (240,160,200), "beige": (220,210,180), "navy": (20,40,100)
+}
+_PALETTE_NAMES = list(PALETTE)
+_PALETTE_RGB = np.array([PALETTE[n] for n in _PALETTE_NAMES], dtype=np.float32)
+
+# Histograma RGB grueso: QUANT_BITS bits por canal -> 2**(3*QUANT_BITS) bins
+QUANT_BITS = 4
+_SHIFT = 8 - QUANT_BITS
+_THUMB = (64, 64)
+
+def _build_bin_lut() -> np.ndarray:
+    # centro de cada bin -> índice de la paleta más cercana (distancia euclidiana)
+    levels = (np.arange(1 << QUANT_BITS, dtype=np.float32) + 0.5) * (1 << _SHIFT)
+    r, g, b = np.meshgrid(levels, levels, levels, indexing="ij")
+    centers = np.stack([r.ravel(), g.ravel(), b.ravel()], axis=1)
+    d2 = ((centers[:, None, :] - _PALETTE_RGB[None, :, :]) ** 2).sum(axis=2)
+    return d2.argmin(axis=1).astype(np.uint8)
+
+_BIN_TO_COLOR = _build_bin_lut()
+
+def _load_thumbnail(path: str) -> np.ndarray:
+    with Image.open(path) as img:
+        # JPEG: decodifica directamente a escala reducida (1/2..1/8) en vez de a resolución completa
+        img.draft("RGB", _THUMB)
+        img = img.convert("RGB")
+        img.thumbnail(_THUMB)
+        return np.asarray(img, dtype=np.uint8)
 
 def _dominant_color(path: str) -> str:
     try:
-        img = Image.open(path).convert("RGB")
-        img.thumbnail((64,64))
-        pixels = list(img.getdata())
-        # mayor frecuencia
-        common = Counter(pixels).most_common(1)[0][0]
-        return _nearest_basic_color(common)
+        px = _load_thumbnail(path).reshape(-1, 3) >> _SHIFT
+        bins = (px[:, 0].astype(np.int32) << (2 * QUANT_BITS)) | (px[:, 1].astype(np.int32) << QUANT_BITS) | px[:, 2]
+        # bin de mayor frecuencia -> color básico vía tabla precalculada
+        hist = np.bincount(bins, minlength=len(_BIN_TO_COLOR))
+        return _PALETTE_NAMES[_BIN_TO_COLOR[int(hist.argmax())]]
     except Exception:
         return None
 
+def dominant_colors(paths: List[str], pool: Optional[ProcessPoolExecutor] = None, chunksize: int = 16) -> List[Optional[str]]:
+    """Color dominante de varias imágenes; reparte entre procesos si se pasa un pool."""
+    if pool is None or len(paths) < 2:
+        return [_dominant_color(p) for p in paths]
+    return list(pool.map(_dominant_color, paths, chunksize=chunksize))
+
 def _guess_brand_from_path(path: str) -> str:
     # heurística: carpeta o prefijo en el filename
     fname = os.path.basename(path).lower()
@@ -53,23 +80,57 @@ def _deterministic_price(path: str, min_p=15, max_p=120) -> float:
 class SimpleEnricher:
     """
     Enriquecedor sin dependencias externas:
-      - color dominante (PIL)
+      - color dominante (PIL + histograma NumPy; en paralelo con `color_workers` procesos)
       - brand por heurística de path
       - precio determinista
       - url sintética
+    Sólo rellena campos ausentes (None), así sirve tanto en el indexado
+    (materializa los campos) como en consulta (no repite trabajo ya hecho).
     """
-    def __init__(self, base_url: str = "https://shop.example/item"):
+    provides = ("brand", "color", "price", "source", "url")
+    volatile = ()
+
+    def __init__(self, base_url: str = "https://shop.example/item", color_workers: int = 0):
         self.base_url = base_url
+        self.color_workers = color_workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+
+    def _color_pool(self) -> Optional[ProcessPoolExecutor]:
+        if self.color_workers > 0 and self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    # spawn: fork desde un servidor con hilos puede heredar locks tomados
+                    self._pool = ProcessPoolExecutor(max_workers=self.color_workers, mp_context=mp.get_context("spawn"))
+        return self._pool
+
+    def close(self) -> None:
+        '''Para el pool de procesos del color dominante (si se creó).'''
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=True)
+                self._pool = None
 
     def enrich_batch(self, payloads: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        # sólo se decodifican las imágenes que aún no traen color
+        need = [i for i, p in enumerate(payloads) if p.get("color") is None]
+        colors = dict(zip(need, dominant_colors([payloads[i].get("filepath") for i in need], self._color_pool())))
         out = []
-        for p in payloads:
+        for i, p in enumerate(payloads):
             fp = p.get("filepath")
             md = {**p}
-            md.setdefault("brand", _guess_brand_from_path(fp))
-            md.setdefault("color", _dominant_color(fp))
-            md.setdefault("price", _deterministic_price(fp))
-            md.setdefault("source", "online")
-            md.setdefault("url", f"{self.base_url}?q={hashlib.md5(fp.encode()).hexdigest()[:10]}")
+            if md.get("brand") is None:
+                md["brand"] = _guess_brand_from_path(fp)
+            if i in colors:
+                md["color"] = colors[i]
+            if md.get("price") is None:
+                md["price"] = _deterministic_price(fp)
+            if md.get("source") is None:
+                md["source"] = "online"
+            if md.get("url") is None:
+                md["url"] = f"{self.base_url}?q={hashlib.md5(fp.encode()).hexdigest()[:10]}"
             out.append(md)
         return out
+
+    def enrich(self, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return self.enrich_batch(items)
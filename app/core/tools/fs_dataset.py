@@ -0,0 +1,197 @@
+# app/core/tools/fs_dataset.py
+from typing import List, Dict, Any, Optional, Sequence, Tuple
+import os, time, sqlite3, threading, zlib
+
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".webp")
+COLOR_WORDS = (
+    "black","white","gray","grey","red","green","blue","yellow","purple","orange","brown","pink","beige","navy"
+)
+_FIELDS = ("title", "brand", "color", "source", "url", "price")
+_SQL_VARS = 900  # por debajo del límite de parámetros de SQLite
+
+def path_metadata(filepath: str) -> Dict[str, Any]:
+    '''Metadatos derivados sólo de la ruta; deterministas entre procesos (crc32, no hash()).'''
+    base = os.path.basename(filepath)
+    tokens = os.path.splitext(filepath.lower())[0].replace("-", "_").replace(os.sep, "_").split("_")
+    color = next((t for t in tokens if t in COLOR_WORDS), None)
+    return {
+        "title": f"Item {base}",
+        "brand": None,
+        "color": "gray" if color == "grey" else color,
+        "source": "online" if zlib.crc32(filepath.encode("utf-8")) % 2 == 0 else "store",
+        "url": None,
+        "price": None,
+    }
+
+class FSDataset:
+    """
+    Dataset sobre un árbol de imágenes en disco con manifiesto persistente (SQLite).
+      - el recorrido es perezoso (os.scandir, sin listas del árbol completo)
+      - el manifiesto guarda por archivo: ruta, tamaño, mtime y metadatos
+      - por directorio se guarda su mtime: si no cambió, no se vuelve a listar
+        ni a hacer stat de sus archivos (sólo se baja a sus subdirectorios)
+      - sample_paths/get_metadata se sirven desde el manifiesto
+    Un archivo reescrito in situ no cambia el mtime del directorio:
+    `refresh(full=True)` fuerza el stat de todo el árbol.
+    """
+    def __init__(
+        self,
+        root_dir: str = "data/images",
+        manifest_path: Optional[str] = None,
+        refresh_every_s: float = 0.0,
+        batch_size: int = 1000,
+    ):
+        self.root_dir = os.path.abspath(root_dir)
+        # un manifiesto por raíz: cambiar DATASET_DIR no mezcla catálogos
+        tag = f"{zlib.crc32(self.root_dir.encode('utf-8')):08x}"
+        self.manifest_path = manifest_path or os.path.join("data", "manifests", f"fs_dataset_{tag}.sqlite")
+        self.refresh_every_s = refresh_every_s  # 0 = sólo en el primer acceso
+        self.batch_size = batch_size
+        self._last_refresh = 0.0
+        self.generation = 0  # sube cada vez que un refresh cambia el manifiesto (ver CachedDataset)
+        self._lock = threading.RLock()
+        os.makedirs(os.path.dirname(os.path.abspath(self.manifest_path)), exist_ok=True)
+        self._db = sqlite3.connect(self.manifest_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS dirs (
+                path TEXT PRIMARY KEY, parent TEXT, mtime_ns INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS dirs_parent ON dirs(parent);
+            CREATE TABLE IF NOT EXISTS items (
+                path TEXT PRIMARY KEY, dir TEXT, size INTEGER, mtime_ns INTEGER,
+                title TEXT, brand TEXT, color TEXT, source TEXT, url TEXT, price REAL
+            );
+            CREATE INDEX IF NOT EXISTS items_dir ON items(dir);
+        """)
+        self._db.commit()
+
+    # ------- manifiesto -------
+    def _ensure_fresh(self) -> None:
+        now = time.monotonic()
+        if self._last_refresh == 0.0 or (self.refresh_every_s > 0 and now - self._last_refresh > self.refresh_every_s):
+            self.refresh()
+
+    def _scan_dir(self, d: str) -> Tuple[Dict[str, Tuple[int, int]], List[str]]:
+        files: Dict[str, Tuple[int, int]] = {}
+        subdirs: List[str] = []
+        with os.scandir(d) as it:
+            for e in it:
+                try:
+                    if e.is_dir(follow_symlinks=False):
+                        subdirs.append(e.path)
+                    elif e.name.lower().endswith(IMAGE_EXTS) and e.is_file():
+                        st = e.stat()
+                        files[e.path] = (st.st_size, st.st_mtime_ns)
+                except OSError:
+                    continue
+        return files, subdirs
+
+    def _drop_tree(self, d: str) -> int:
+        prefix = d + os.sep
+        n = self._db.execute(
+            "DELETE FROM items WHERE dir = ? OR substr(dir, 1, ?) = ?", (d, len(prefix), prefix)
+        ).rowcount
+        self._db.execute("DELETE FROM dirs WHERE path = ? OR substr(path, 1, ?) = ?", (d, len(prefix), prefix))
+        return n
+
+    def refresh(self, full: bool = False) -> Dict[str, int]:
+        '''Sincroniza el manifiesto con el disco; sólo lista los directorios que cambiaron.'''
+        with self._lock:
+            stats = {"dirs_scanned": 0, "dirs_skipped": 0, "added": 0, "updated": 0, "removed": 0}
+            known = {p: m for p, m in self._db.execute("SELECT path, mtime_ns FROM dirs")}
+            children: Dict[str, List[str]] = {}
+            for p, parent in self._db.execute("SELECT path, parent FROM dirs"):
+                children.setdefault(parent, []).append(p)
+
+            stack = [self.root_dir]
+            pending = 0
+            while stack:
+                d = stack.pop()
+                try:
+                    mtime_ns = os.stat(d).st_mtime_ns
+                except OSError:
+                    stats["removed"] += self._drop_tree(d)
+                    continue
+                if not full and known.get(d) == mtime_ns:
+                    stats["dirs_skipped"] += 1
+                    stack.extend(children.get(d, []))
+                    continue
+
+                stats["dirs_scanned"] += 1
+                files, subdirs = self._scan_dir(d)
+                old = {p: (s, m) for p, s, m in self._db.execute(
+                    "SELECT path, size, mtime_ns FROM items WHERE dir = ?", (d,)
+                )}
+                rows = []
+                for p, (size, mt) in files.items():
+                    if old.get(p) == (size, mt):
+                        continue
+                    stats["updated" if p in old else "added"] += 1
+                    md = path_metadata(p)
+                    rows.append((p, d, size, mt, *(md[f] for f in _FIELDS)))
+                if rows:
+                    self._db.executemany(
+                        "INSERT OR REPLACE INTO items VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows
+                    )
+                gone = [(p,) for p in old if p not in files]
+                if gone:
+                    self._db.executemany("DELETE FROM items WHERE path = ?", gone)
+                    stats["removed"] += len(gone)
+                for sub in set(children.get(d, [])) - set(subdirs):
+                    stats["removed"] += self._drop_tree(sub)
+                self._db.execute(
+                    "INSERT OR REPLACE INTO dirs VALUES (?, ?, ?)", (d, os.path.dirname(d), mtime_ns)
+                )
+                stack.extend(subdirs)
+
+                pending += len(rows) + len(gone) + 1
+                if pending >= self.batch_size:
+                    self._db.commit()
+                    pending = 0
+            self._db.commit()
+            self._last_refresh = time.monotonic()
+            if stats["added"] or stats["updated"] or stats["removed"]:
+                self.generation += 1
+            print(f"[FSDataset] manifiesto {self.manifest_path}: {stats}")
+            return stats
+
+    # ------- DatasetTool -------
+    def sample_paths(self, limit: int = 200) -> List[str]:
+        self._ensure_fresh()
+        with self._lock:
+            rows = self._db.execute("SELECT path FROM items ORDER BY path LIMIT ?", (int(limit),)).fetchall()
+        return [p for (p,) in rows]
+
+    def get_metadata(self, filepath: str) -> Dict[str, Any]:
+        self._ensure_fresh()
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT {', '.join(_FIELDS)} FROM items WHERE path = ?", (filepath,)
+            ).fetchone()
+        if row is None:
+            # fuera del manifiesto (p. ej. imagen de consulta): metadatos por ruta
+            return path_metadata(filepath)
+        return dict(zip(_FIELDS, row))
+
+    def get_metadata_many(self, filepaths: Sequence[str]) -> List[Dict[str, Any]]:
+        '''Metadatos de varias rutas con una consulta IN por bloque (en vez de una por ruta).'''
+        self._ensure_fresh()
+        found: Dict[str, Dict[str, Any]] = {}
+        uniq = list(dict.fromkeys(filepaths))
+        with self._lock:
+            for start in range(0, len(uniq), _SQL_VARS):
+                chunk = uniq[start:start + _SQL_VARS]
+                rows = self._db.execute(
+                    f"SELECT path, {', '.join(_FIELDS)} FROM items WHERE path IN ({', '.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+                for row in rows:
+                    found[row[0]] = dict(zip(_FIELDS, row[1:]))
+        return [dict(found[fp]) if fp in found else path_metadata(fp) for fp in filepaths]
+
+    def __len__(self) -> int:
+        self._ensure_fresh()
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM items").fetchone()[0]
@@ -1,5 +1,5 @@
-import os
-from typing import List, Dict, Any
+import os, zlib
+from typing import List, Dict, Any, Sequence
 
 class MockDataset:
     """
@@ -32,6 +32,9 @@ class MockDataset:
             "title": f"Item {base}",
             "brand": "MockBrand",
             "color": "black" if "black" in filepath.lower() else "grey",
-            "source": "online" if hash(filepath) % 2 == 0 else "store",
+            "source": "online" if zlib.crc32(filepath.encode("utf-8")) % 2 == 0 else "store",
             "url": None,
         }
+
+    def get_metadata_many(self, filepaths: Sequence[str]) -> List[Dict[str, Any]]:
+        return [self.get_metadata(fp) for fp in filepaths]
@@ -1,4 +1,5 @@
-from typing import List
+from typing import List, Sequence, Optional
+import hashlib
 from ..utils import deterministic_vector
 
 class MockEmbedder:
@@ -12,3 +13,13 @@ class MockEmbedder:
 
     def embed_image(self, image_path: str) -> List[float]:
         return deterministic_vector(image_path, self.dim)
+
+    def embed_images(self, image_paths: Sequence[str], batch_size: Optional[int] = None) -> List[List[float]]:
+        return [self.embed_image(p) for p in image_paths]
+
+    def embed_image_bytes(self, data: bytes) -> List[float]:
+        # clave = hash del contenido (los bytes no tienen ruta)
+        return deterministic_vector(hashlib.sha256(data).hexdigest(), self.dim)
+
+    def embed_images_bytes(self, blobs: Sequence[bytes], batch_size: Optional[int] = None) -> List[List[float]]:
+        return [self.embed_image_bytes(b) for b in blobs]
@@ -5,7 +5,11 @@ class MockEnricher:
     """
     Enriquecedor de precios/disponibilidad simulado.
     Cambiar por API real (REST/CSV).
+    El precio simula un dato "en vivo" (volátil): se recalcula en cada consulta.
     """
+    provides = ("price", "currency", "source", "url")
+    volatile = ("price",)
+
     def __init__(self, seed: int = 123):
         self.rnd = random.Random(seed)
 
@@ -1,5 +1,6 @@
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Tuple, Optional, Sequence
 from ..utils import cosine_similarity
+from ..types import QueryFilter
 
 class MockVectorStore:
     """
@@ -9,15 +10,30 @@ class MockVectorStore:
     def __init__(self):
         self._vecs: List[List[float]] = []
         self._payloads: List[Dict[str, Any]] = []
+        self._rows: Dict[str, int] = {}
 
     def index(self, vectors: List[List[float]], payloads: List[Dict[str, Any]]) -> None:
         assert len(vectors) == len(payloads)
-        self._vecs.extend(vectors)
-        self._payloads.extend(payloads)
+        for v, p in zip(vectors, payloads):
+            self._rows[p["filepath"]] = len(self._vecs)
+            self._vecs.append(v)
+            self._payloads.append(p)
 
-    def query(self, vector: List[float], k: int = 10) -> List[Dict[str, Any]]:
+    def get_vectors(self, filepaths: Sequence[str]) -> List[Optional[List[float]]]:
+        out = []
+        for fp in filepaths:
+            row = self._rows.get(fp)
+            out.append(None if row is None else self._vecs[row])
+        return out
+
+    def supports_filter(self, field: str) -> bool:
+        return bool(self._payloads) and all(field in p for p in self._payloads)
+
+    def query(self, vector: List[float], k: int = 10, where: Optional[QueryFilter] = None) -> List[Dict[str, Any]]:
         scores: List[Tuple[int, float]] = []
         for i, v in enumerate(self._vecs):
+            if where is not None and not where.matches(self._payloads[i]):
+                continue
             sim = cosine_similarity(vector, v)
             scores.append((i, sim))
         scores.sort(key=lambda x: x[1], reverse=True)
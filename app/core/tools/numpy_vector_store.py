@@ -0,0 +1,238 @@
+# app/core/tools/numpy_vector_store.py
+from typing import List, Dict, Any, Optional, Sequence, Tuple
+import numpy as np
+from ..types import QueryFilter
+from ..snapshot import write_snapshot, read_snapshot
+
+def _as_matrix(vectors: Sequence[Sequence[float]]) -> np.ndarray:
+    '''Convierte una lista de vectores en una matriz float32 (N, dim).'''
+    mat = np.asarray(vectors, dtype=np.float32)
+    if mat.ndim == 1:
+        mat = mat.reshape(1, -1)
+    return mat
+
+def _normalize_rows(mat: np.ndarray) -> np.ndarray:
+    '''Normaliza cada fila a norma 1 (las filas nulas quedan a cero).'''
+    norms = np.linalg.norm(mat, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return mat / norms
+
+def topk_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    '''
+    Índices top-k (orden descendente) por fila con argpartition.
+    Acepta un vector (n,) o una matriz (m, n).
+    '''
+    n = scores.shape[-1]
+    k = min(k, n)
+    if k <= 0:
+        return np.empty(scores.shape[:-1] + (0,), dtype=np.int64)
+    if k < n:
+        part = np.argpartition(-scores, k - 1, axis=-1)[..., :k]
+    else:
+        part = np.broadcast_to(np.arange(n), scores.shape[:-1] + (n,))
+    part_scores = np.take_along_axis(scores, part, axis=-1)
+    order = np.argsort(-part_scores, axis=-1, kind="stable")
+    return np.take_along_axis(part, order, axis=-1)
+
+class NumpyVectorStore:
+    """
+    Vector store exacto en memoria sobre NumPy.
+    Guarda los vectores normalizados en una matriz float32 contigua
+    que crece por bloques (amortizado); la similitud coseno es un
+    producto matriz-vector y el top-k se obtiene con argpartition.
+    `index` es un upsert por filepath (re-indexar sobrescribe la fila).
+    """
+    def __init__(self, dim: Optional[int] = None, initial_capacity: int = 1024, growth: float = 2.0):
+        self._growth = max(growth, 1.1)
+        self._initial_capacity = max(int(initial_capacity), 1)
+        self._reset(dim)
+
+    def _reset(self, dim: Optional[int]) -> None:
+        '''Vacía el índice (las subclases limpian aquí su propio estado).'''
+        self._dim = dim
+        self._mat: Optional[np.ndarray] = None
+        self._n = 0
+        self._payloads: List[Dict[str, Any]] = []
+        self._rows: Dict[str, int] = {}
+        self._field_counts: Dict[str, int] = {}
+        self._colors: List[str] = []
+        self._prices: List[float] = []
+        self._columns: Optional[Dict[str, np.ndarray]] = None
+
+    def __len__(self) -> int:
+        return self._n
+
+    @property
+    def dim(self) -> Optional[int]:
+        return self._dim
+
+    @property
+    def vectors(self) -> np.ndarray:
+        '''Vista (N, dim) de los vectores normalizados indexados.'''
+        if self._mat is None:
+            return np.empty((0, self._dim or 0), dtype=np.float32)
+        return self._mat[:self._n]
+
+    def _reserve(self, needed: int) -> None:
+        '''Asegura capacidad para `needed` filas (crecimiento geométrico).'''
+        if self._mat is not None and needed <= self._mat.shape[0]:
+            return
+        cap = self._initial_capacity if self._mat is None else self._mat.shape[0]
+        while cap < needed:
+            cap = int(cap * self._growth) + 1
+        self._resize(cap)
+
+    def _resize(self, cap: int) -> None:
+        new = np.empty((cap, self._dim), dtype=np.float32)
+        if self._mat is not None:
+            new[:self._n] = self._mat[:self._n]
+        self._mat = new
+
+    def _set_rows(self, rows: np.ndarray, mat: np.ndarray) -> None:
+        '''Escribe vectores ya normalizados en las filas `rows`.'''
+        self._mat[rows] = mat
+
+    def _move_row(self, src: int, dst: int) -> None:
+        self._mat[dst] = self._mat[src]
+
+    # ------- VisualAgent API -------
+    def index(self, vectors: List[List[float]], payloads: List[Dict[str, Any]]) -> None:
+        assert len(vectors) == len(payloads), "vectors y payloads deben tener igual longitud"
+        if len(vectors) == 0:
+            return
+        mat = _as_matrix(vectors)
+        if self._dim is None:
+            self._dim = int(mat.shape[1])
+        if mat.shape[1] != self._dim:
+            raise ValueError(f"Dimensión {mat.shape[1]} != {self._dim}")
+        mat = _normalize_rows(mat)
+        self._reserve(self._n + mat.shape[0])
+        rows = np.empty(len(payloads), dtype=np.int64)
+        for j, p in enumerate(payloads):
+            fp = p.get("filepath")
+            row = self._rows.get(fp) if fp is not None else None
+            if row is None:
+                row = self._n
+                self._n += 1
+                self._payloads.append(p)
+                self._colors.append("")
+                self._prices.append(np.nan)
+            else:
+                self._count_fields(self._payloads[row], -1)
+                self._payloads[row] = p
+            if fp is not None:
+                self._rows[fp] = row
+            rows[j] = row
+            self._set_columns(row, p)
+            self._count_fields(p, +1)
+        self._set_rows(rows, mat)
+        self._columns = None
+
+    def _count_fields(self, payload: Dict[str, Any], delta: int) -> None:
+        for f in payload:
+            self._field_counts[f] = self._field_counts.get(f, 0) + delta
+
+    def _set_columns(self, row: int, payload: Dict[str, Any]) -> None:
+        self._colors[row] = (payload.get("color") or "").lower()
+        price = payload.get("price")
+        self._prices[row] = float(price) if price is not None else np.nan
+
+    def get_vectors(self, filepaths: Sequence[str]) -> List[Optional[np.ndarray]]:
+        '''Vector indexado (normalizado) de cada filepath, None si no está: O(1) por item.'''
+        out: List[Optional[np.ndarray]] = []
+        for fp in filepaths:
+            row = self._rows.get(fp)
+            out.append(None if row is None else np.array(self._mat[row]))
+        return out
+
+    # ------- Indexado incremental -------
+    def fingerprints(self) -> Dict[str, Optional[str]]:
+        '''{filepath: fingerprint} de los items indexados.'''
+        return {fp: self._payloads[row].get("fingerprint") for fp, row in self._rows.items()}
+
+    def delete(self, filepaths: List[str]) -> int:
+        '''Borra items moviendo la última fila al hueco (O(1) por borrado).'''
+        deleted = 0
+        for fp in filepaths:
+            row = self._rows.pop(fp, None)
+            if row is None:
+                continue
+            last = self._n - 1
+            self._count_fields(self._payloads[row], -1)
+            if row != last:
+                moved = self._payloads[last]
+                self._move_row(last, row)
+                self._payloads[row] = moved
+                self._colors[row] = self._colors[last]
+                self._prices[row] = self._prices[last]
+                if moved.get("filepath") is not None:
+                    self._rows[moved["filepath"]] = row
+            self._payloads.pop()
+            self._colors.pop()
+            self._prices.pop()
+            self._n -= 1
+            deleted += 1
+        self._columns = None
+        return deleted
+
+    # ------- Snapshot -------
+    def save(self, path: str, model_tag: str = "") -> None:
+        '''Guarda vectores (ya normalizados) y payloads en un snapshot .npz.'''
+        write_snapshot(path, self.vectors, self._payloads[:self._n], model_tag=model_tag)
+
+    def load(self, path: str, model_tag: Optional[str] = None) -> int:
+        '''Reemplaza el contenido por el de un snapshot, sin re-embeber. Devuelve el nº de items.'''
+        vectors, payloads, _ = read_snapshot(path, model_tag=model_tag)
+        self._reset(int(vectors.shape[1]))
+        self._reserve(len(payloads))
+        self.index(vectors, payloads)
+        return self._n
+
+    def supports_filter(self, field: str) -> bool:
+        '''Un campo es filtrable si todos los payloads indexados lo traen.'''
+        return self._n > 0 and self._field_counts.get(field, 0) == self._n
+
+    def _mask(self, where: Optional[QueryFilter]) -> Optional[np.ndarray]:
+        '''Máscara booleana (N,) de filas que cumplen el filtro (None = todas).'''
+        if where is None or where.is_empty():
+            return None
+        if self._columns is None:
+            self._columns = {
+                "color": np.asarray(self._colors, dtype=object),
+                "price": np.asarray(self._prices, dtype=np.float64),
+            }
+        mask = np.ones(self._n, dtype=bool)
+        if where.color:
+            mask &= self._columns["color"] == where.color.lower()
+        if where.max_price is not None:
+            with np.errstate(invalid="ignore"):
+                mask &= self._columns["price"] <= where.max_price
+        return mask
+
+    def query(self, vector: List[float], k: int = 10, where: Optional[QueryFilter] = None) -> List[Dict[str, Any]]:
+        return self.query_many([vector], k=k, where=where)[0]
+
+    def query_many(
+        self, vectors: List[List[float]], k: int = 10, where: Optional[QueryFilter] = None
+    ) -> List[List[Dict[str, Any]]]:
+        '''Resuelve un bloque de consultas con un único matmul (M, dim) x (dim, N).'''
+        if len(vectors) == 0:
+            return []
+        mask = self._mask(where)
+        rows = np.flatnonzero(mask) if mask is not None else None
+        if self._n == 0 or (rows is not None and rows.size == 0):
+            return [[] for _ in range(len(vectors))]
+        qs = _normalize_rows(_as_matrix(vectors))
+        hits, top = self._search(qs, rows, k)
+        return [
+            [{**self._payloads[i], "score": float(sc)} for i, sc in zip(h, t)]
+            for h, t in zip(hits, top)
+        ]
+
+    def _search(self, qs: np.ndarray, rows: Optional[np.ndarray], k: int) -> Tuple[np.ndarray, np.ndarray]:
+        '''Top-k exacto: (filas (M, k), scores (M, k)) restringido a `rows` si se indica.'''
+        mat = self.vectors if rows is None else self.vectors[rows]
+        scores = qs @ mat.T
+        idx = topk_indices(scores, k)
+        top = np.take_along_axis(scores, idx, axis=-1)
+        return (idx if rows is None else rows[idx]), top
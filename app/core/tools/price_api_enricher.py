@@ -0,0 +1,151 @@
+# app/core/tools/price_api_enricher.py
+from typing import List, Dict, Any, Optional, Tuple
+from collections import OrderedDict
+import asyncio, threading, time
+import httpx
+from ..metrics import CACHE_REQUESTS, ENRICH_ERRORS
+
+class PriceAPIEnricher:
+    """
+    Enriquecedor contra un servicio HTTP de precios/disponibilidad.
+      - una petición bulk por consulta: POST {base_url}{path} {"ids": [...]}
+        -> {"items": {id: {"price", "currency", "available", "source", "url"}}}
+      - cliente httpx.AsyncClient con pool de conexiones, en un event loop propio
+      - caché TTL por id de item (sólo se piden los ids caducados/ausentes); los
+        ids que el servicio no devuelve se cachean vacíos `negative_ttl` segundos
+        para no volver a pedirlos en cada consulta
+      - timeout por llamada: si el servicio falla o tarda, los items se
+        devuelven sin precio en vez de propagar el error (degradación suave)
+    """
+    provides = ("price", "currency", "source", "url")
+    volatile = ("price",)
+
+    def __init__(
+        self,
+        base_url: str,
+        path: str = "/prices",
+        api_key: str = "",
+        timeout: float = 0.3,
+        ttl: float = 60.0,
+        negative_ttl: Optional[float] = None,
+        cache_size: int = 10000,
+        max_connections: int = 50,
+    ):
+        self.url = base_url.rstrip("/") + path
+        self.headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+        self.timeout = timeout
+        self.ttl = ttl
+        self.negative_ttl = ttl if negative_ttl is None else min(negative_ttl, ttl)
+        self.cache_size = cache_size
+        self.max_connections = max_connections
+        self._cache: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_lock = threading.Lock()
+        self._client: Optional[httpx.AsyncClient] = None
+        self.failures = 0
+
+    # ------- event loop / cliente -------
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="price-api-loop", daemon=True).start()
+        return self._loop
+
+    def _get_client(self) -> httpx.AsyncClient:
+        # se crea dentro del loop propio: el pool de conexiones vive ahí
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout),
+                limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections),
+                headers=self.headers,
+            )
+        return self._client
+
+    def close(self) -> None:
+        if self._loop is None:
+            return
+        if self._client is not None:
+            asyncio.run_coroutine_threadsafe(self._client.aclose(), self._loop).result()
+            self._client = None
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._loop = None
+
+    # ------- caché TTL -------
+    def _cache_get(self, key: str, now: float) -> Optional[Dict[str, Any]]:
+        with self._cache_lock:
+            hit = self._cache.get(key)
+            if hit is None or hit[0] < now:
+                return None
+            self._cache.move_to_end(key)
+            return hit[1]
+
+    def _cache_put(self, key: str, value: Dict[str, Any], now: float, ttl: Optional[float] = None) -> None:
+        with self._cache_lock:
+            self._cache[key] = (now + (self.ttl if ttl is None else ttl), value)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    # ------- enriquecimiento -------
+    async def _fetch(self, ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        resp = await self._get_client().post(self.url, json={"ids": ids})
+        resp.raise_for_status()
+        return resp.json().get("items") or {}
+
+    async def _aenrich(self, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        now = time.monotonic()
+        found: Dict[str, Dict[str, Any]] = {}
+        missing: List[str] = []
+        for it in items:
+            key = str(it.get("id") or it.get("filepath"))
+            hit = self._cache_get(key, now)
+            if hit is not None:
+                found[key] = hit
+            elif key not in missing:
+                missing.append(key)
+        CACHE_REQUESTS.labels(cache="price", result="hit").inc(len(found))
+        CACHE_REQUESTS.labels(cache="price", result="miss").inc(len(missing))
+        if missing:
+            try:
+                fetched = await asyncio.wait_for(self._fetch(missing), timeout=self.timeout)
+            except Exception as e:
+                self.failures += 1
+                ENRICH_ERRORS.labels(enricher="price_api").inc()
+                print(f"[PriceAPIEnricher] servicio no disponible ({type(e).__name__}: {e}); sin precios")
+                fetched = None
+            if fetched is not None:
+                for key in missing:
+                    data = fetched.get(key)
+                    if data is None:
+                        # respuesta válida sin este id: caché negativa (sin precio)
+                        self._cache_put(key, {}, now, self.negative_ttl)
+                    else:
+                        self._cache_put(key, data, now)
+                        found[key] = data
+        out: List[Dict[str, Any]] = []
+        for it in items:
+            data = found.get(str(it.get("id") or it.get("filepath"))) or {}
+            out.append({
+                **it,
+                "price": data.get("price"),
+                "currency": data.get("currency") or it.get("currency") or "EUR",
+                "available": data.get("available", it.get("available")),
+                "source": it.get("source") or data.get("source"),
+                "url": it.get("url") or data.get("url"),
+            })
+        return out
+
+    async def aenrich(self, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        '''Versión async: usable desde cualquier event loop.'''
+        loop = self._ensure_loop()
+        fut = asyncio.run_coroutine_threadsafe(self._aenrich(items), loop)
+        return await asyncio.wrap_future(fut)
+
+    def enrich(self, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        '''Contrato síncrono de EnricherTool (se llama desde los hilos de /retrieve).'''
+        if not items:
+            return []
+        fut = asyncio.run_coroutine_threadsafe(self._aenrich(items), self._ensure_loop())
+        return fut.result()
@@ -0,0 +1,212 @@
+# app/core/tools/quantized_vector_store.py
+from typing import List, Dict, Any, Optional, Tuple
+import os, tempfile
+import numpy as np
+from .numpy_vector_store import NumpyVectorStore, _normalize_rows, topk_indices
+
+def _kmeans(x: np.ndarray, k: int, iters: int, rng: np.random.Generator) -> np.ndarray:
+    '''k-means (Lloyd) sencillo en NumPy; devuelve los centroides (k, d).'''
+    cent = x[rng.choice(len(x), size=k, replace=False)].copy()
+    for _ in range(iters):
+        d2 = (x * x).sum(1)[:, None] - 2.0 * x @ cent.T + (cent * cent).sum(1)[None, :]
+        assign = d2.argmin(1)
+        sums = np.zeros_like(cent)
+        np.add.at(sums, assign, x)
+        counts = np.bincount(assign, minlength=k)
+        empty = counts == 0
+        cent[~empty] = sums[~empty] / counts[~empty, None]
+        if empty.any():
+            cent[empty] = x[rng.choice(len(x), size=int(empty.sum()), replace=False)]
+    return cent
+
+class QuantizedVectorStore(NumpyVectorStore):
+    """
+    Variante comprimida del NumpyVectorStore:
+      - `mode="int8"`: cuantización escalar por dimensión (1 byte/dim, 4x menos que float32)
+      - `mode="pq"`: product quantization, `pq_m` subespacios x 256 centroides (pq_m bytes/vector)
+    Los candidatos se puntúan sobre los códigos y sólo una shortlist de
+    `k * rerank_factor` se re-ordena con el coseno exacto contra los float32,
+    que con `raw_path` viven en un memmap en disco (el SO pagina lo que se toca).
+    Ese fichero es privado de cada proceso: un temporal anónimo en el directorio
+    de `raw_path`, así varios workers de uvicorn con la misma ruta no se pisan.
+    El cuantizador se entrena al llegar a `train_size` vectores (o al llamar a
+    `train()`); antes de eso se busca en exacto.
+    """
+    def __init__(
+        self,
+        dim: Optional[int] = None,
+        mode: str = "int8",
+        raw_path: Optional[str] = None,
+        rerank_factor: int = 4,
+        pq_m: int = 16,
+        train_size: int = 20000,
+        scan_chunk: int = 16384,
+        seed: int = 0,
+        initial_capacity: int = 1024,
+        growth: float = 2.0,
+    ):
+        if mode not in ("int8", "pq"):
+            raise ValueError(f"mode debe ser 'int8' o 'pq', no {mode!r}")
+        self.mode = mode
+        self.raw_path = raw_path
+        self.rerank_factor = max(int(rerank_factor), 1)
+        self.pq_m = pq_m
+        self.train_size = train_size
+        self.scan_chunk = scan_chunk
+        self.seed = seed
+        super().__init__(dim=dim, initial_capacity=initial_capacity, growth=growth)
+
+    def _reset(self, dim: Optional[int]) -> None:
+        super()._reset(dim)
+        self._codes: Optional[np.ndarray] = None
+        self._scale: Optional[np.ndarray] = None      # int8: escala por dimensión
+        self._codebooks: Optional[np.ndarray] = None  # pq: (m, 256, dsub)
+        raw_file = getattr(self, "_raw_file", None)
+        if raw_file is not None:
+            raw_file.close()
+        self._raw_file = None
+
+    @property
+    def trained(self) -> bool:
+        return self._scale is not None or self._codebooks is not None
+
+    # ------- Almacenamiento -------
+    def _code_width(self) -> int:
+        return self._dim if self.mode == "int8" else self.pq_m
+
+    def _resize(self, cap: int) -> None:
+        if self.raw_path:
+            # el fichero crece in situ: las filas ya escritas se conservan
+            if self._mat is not None:
+                self._mat.flush()
+            if self._raw_file is None:
+                # temporal sin nombre: nadie más lo abre y desaparece al cerrarse
+                folder = os.path.dirname(os.path.abspath(self.raw_path))
+                os.makedirs(folder, exist_ok=True)
+                self._raw_file = tempfile.TemporaryFile(dir=folder, prefix=os.path.basename(self.raw_path) + ".")
+            self._raw_file.truncate(cap * self._dim * 4)
+            self._mat = np.memmap(self._raw_file, dtype=np.float32, mode="r+", shape=(cap, self._dim))
+        else:
+            super()._resize(cap)
+        if self._codes is not None:
+            codes = np.zeros((cap, self._codes.shape[1]), dtype=self._codes.dtype)
+            codes[:self._n] = self._codes[:self._n]
+            self._codes = codes
+
+    def _set_rows(self, rows: np.ndarray, mat: np.ndarray) -> None:
+        super()._set_rows(rows, mat)
+        if self.trained:
+            self._codes[rows] = self._encode(mat)
+
+    def _move_row(self, src: int, dst: int) -> None:
+        super()._move_row(src, dst)
+        if self._codes is not None:
+            self._codes[dst] = self._codes[src]
+
+    def index(self, vectors: List[List[float]], payloads: List[Dict[str, Any]]) -> None:
+        super().index(vectors, payloads)
+        if not self.trained and self._n >= self.train_size:
+            self.train()
+
+    # ------- Cuantizador -------
+    def train(self, sample: Optional[np.ndarray] = None) -> None:
+        '''Entrena el cuantizador (por defecto con hasta `train_size` vectores indexados) y codifica todo.'''
+        if self._n == 0:
+            return
+        rng = np.random.default_rng(self.seed)
+        if sample is None:
+            take = rng.choice(self._n, size=min(self._n, self.train_size), replace=False)
+            sample = np.asarray(self._mat[np.sort(take)])
+        sample = _normalize_rows(np.asarray(sample, dtype=np.float32))
+        if self.mode == "int8":
+            scale = np.abs(sample).max(axis=0) / 127.0
+            scale[scale == 0] = 1.0
+            self._scale = scale.astype(np.float32)
+        else:
+            if self._dim % self.pq_m:
+                raise ValueError(f"dim={self._dim} no es divisible por pq_m={self.pq_m}")
+            dsub = self._dim // self.pq_m
+            k = min(256, len(sample))
+            self._codebooks = np.stack([
+                _kmeans(sample[:, m * dsub:(m + 1) * dsub], k, iters=15, rng=rng) for m in range(self.pq_m)
+            ]).astype(np.float32)
+        cap = self._mat.shape[0]
+        self._codes = np.zeros((cap, self._code_width()), dtype=np.int8 if self.mode == "int8" else np.uint8)
+        for start in range(0, self._n, self.scan_chunk):
+            stop = min(start + self.scan_chunk, self._n)
+            self._codes[start:stop] = self._encode(np.asarray(self._mat[start:stop]))
+
+    def _encode(self, mat: np.ndarray) -> np.ndarray:
+        if self.mode == "int8":
+            return np.clip(np.rint(mat / self._scale), -127, 127).astype(np.int8)
+        dsub = self._dim // self.pq_m
+        codes = np.empty((mat.shape[0], self.pq_m), dtype=np.uint8)
+        for m in range(self.pq_m):
+            sub = mat[:, m * dsub:(m + 1) * dsub]
+            cb = self._codebooks[m]
+            d2 = -2.0 * sub @ cb.T + (cb * cb).sum(1)[None, :]
+            codes[:, m] = d2.argmin(1)
+        return codes
+
+    def _approx_scores(self, qs: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        '''Producto escalar aproximado (M, n) de las consultas contra un bloque de códigos.'''
+        if self.mode == "int8":
+            return (qs * self._scale) @ codes.T.astype(np.float32)
+        dsub = self._dim // self.pq_m
+        # tablas de distancia asimétrica: (M, m, 256)
+        luts = np.einsum("qmd,mkd->qmk", qs.reshape(len(qs), self.pq_m, dsub), self._codebooks)
+        out = np.zeros((len(qs), codes.shape[0]), dtype=np.float32)
+        for m in range(self.pq_m):
+            out += luts[:, m, codes[:, m]]
+        return out
+
+    # ------- Búsqueda -------
+    def _search(self, qs: np.ndarray, rows: Optional[np.ndarray], k: int) -> Tuple[np.ndarray, np.ndarray]:
+        if not self.trained:
+            # pocos items (p. ej. el índice lazy de arranque): un codebook entrenado
+            # con ellos quedaría mal ajustado para siempre; se busca en exacto
+            return super()._search(qs, rows, k)
+        n_rows = self._n if rows is None else len(rows)
+        short = min(k * self.rerank_factor, n_rows)
+        # 1) shortlist por bloques sobre los códigos (memoria temporal acotada)
+        best_idx = np.empty((len(qs), 0), dtype=np.int64)
+        best_sc = np.empty((len(qs), 0), dtype=np.float32)
+        for start in range(0, n_rows, self.scan_chunk):
+            stop = min(start + self.scan_chunk, n_rows)
+            ids = np.arange(start, stop) if rows is None else rows[start:stop]
+            sc = self._approx_scores(qs, self._codes[ids])
+            cand = np.concatenate([best_sc, sc], axis=1)
+            cand_ids = np.concatenate([best_idx, np.broadcast_to(ids, sc.shape)], axis=1)
+            top = topk_indices(cand, short)
+            best_sc = np.take_along_axis(cand, top, axis=1)
+            best_idx = np.take_along_axis(cand_ids, top, axis=1)
+        # 2) re-rank exacto: una sola lectura de las filas float32 de toda la shortlist
+        uniq, inv = np.unique(best_idx, return_inverse=True)
+        raw = np.asarray(self._mat[uniq])
+        exact = np.take_along_axis(qs @ raw.T, inv.reshape(best_idx.shape), axis=1)
+        order = topk_indices(exact, k)
+        return np.take_along_axis(best_idx, order, axis=1), np.take_along_axis(exact, order, axis=1)
+
+    # ------- Informes -------
+    def memory_report(self) -> Dict[str, Any]:
+        '''Bytes en RAM de códigos y vectores float32 (o en disco si están en memmap).'''
+        n, dim = self._n, self._dim or 0
+        codes_b = 0 if self._codes is None else n * self._codes.shape[1]
+        raw_b = n * dim * 4
+        return {
+            "mode": self.mode,
+            "items": n,
+            "codes_bytes": codes_b,
+            "raw_bytes_ram": 0 if self.raw_path else raw_b,
+            "raw_bytes_disk": raw_b if self.raw_path else 0,
+            "float32_bytes": raw_b,
+            "ram_ratio_vs_float32": round((codes_b + (0 if self.raw_path else raw_b)) / raw_b, 4) if raw_b else None,
+        }
+
+    def recall(self, queries: np.ndarray, k: int = 10) -> float:
+        '''Recall@k frente a la búsqueda exacta sobre los float32.'''
+        qs = _normalize_rows(np.asarray(queries, dtype=np.float32))
+        approx, _ = self._search(qs, None, k)
+        exact, _ = NumpyVectorStore._search(self, qs, None, k)
+        hits = sum(len(set(a.tolist()) & set(e.tolist())) for a, e in zip(approx, exact))
+        return hits / float(exact.size) if exact.size else 1.0
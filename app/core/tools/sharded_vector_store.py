@@ -0,0 +1,451 @@
+# app/core/tools/sharded_vector_store.py
+from typing import List, Dict, Any, Optional, Sequence, Tuple
+from concurrent.futures import ProcessPoolExecutor
+import os, re, json, time, zlib, heapq, fcntl, itertools, shutil, tempfile
+import multiprocessing as mp
+import numpy as np
+from ..types import QueryFilter
+from ..snapshot import write_snapshot, read_snapshot
+from ..metrics import SHARD_SECONDS, span, record
+from .numpy_vector_store import _as_matrix, _normalize_rows, topk_indices
+
+# Variables de hilos de BLAS: cada worker usa `worker_threads` para no sobre-suscribir los cores
+_BLAS_THREAD_VARS = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS")
+_PRIVATE_DIR = re.compile(r"proc-(\d+)-")
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:  # existe, pero es de otro usuario
+        return True
+    return True
+
+def _color_code(color: Optional[str]) -> int:
+    '''Color -> uint32 (crc32 del nombre en minúsculas; 0 = sin color).'''
+    if not color:
+        return 0
+    return zlib.crc32(color.lower().encode("utf-8")) or 1
+
+# ------- Lado worker (proceso del pool) -------
+# Mapas abiertos por este proceso: prefijo del shard -> (capacidad, vectores, precios, colores)
+_maps: Dict[str, Tuple[int, np.memmap, np.memmap, np.memmap]] = {}
+
+def _open_shard(prefix: str, cap: int, dim: int):
+    cached = _maps.get(prefix)
+    if cached is None or cached[0] != cap:
+        cached = _maps[prefix] = (
+            cap,
+            np.memmap(f"{prefix}.f32", dtype=np.float32, mode="r", shape=(cap, dim)),
+            np.memmap(f"{prefix}.price", dtype=np.float64, mode="r", shape=(cap,)),
+            np.memmap(f"{prefix}.color", dtype=np.uint32, mode="r", shape=(cap,)),
+        )
+    return cached
+
+def _ping(_: int) -> int:
+    '''Tarea vacía: fuerza a cada worker a importar este módulo (numpy incluido).'''
+    return os.getpid()
+
+def search_shard(
+    prefix: str, cap: int, dim: int, n: int, qs: np.ndarray, k: int,
+    color: int = 0, max_price: Optional[float] = None,
+) -> Tuple[np.ndarray, np.ndarray, float]:
+    '''Top-k exacto dentro de un shard: (filas (M, k'), scores (M, k'), segundos).'''
+    t0 = time.perf_counter()
+    _, vecs, prices, colors = _open_shard(prefix, cap, dim)
+    rows = None
+    if color or max_price is not None:
+        mask = np.ones(n, dtype=bool)
+        if color:
+            mask &= colors[:n] == color
+        if max_price is not None:
+            with np.errstate(invalid="ignore"):
+                mask &= prices[:n] <= max_price
+        rows = np.flatnonzero(mask)
+    mat = vecs[:n] if rows is None else vecs[rows]
+    if mat.shape[0] == 0:
+        empty = np.empty((len(qs), 0))
+        return empty.astype(np.int64), empty.astype(np.float32), time.perf_counter() - t0
+    scores = qs @ np.asarray(mat).T
+    idx = topk_indices(scores, k)
+    top = np.take_along_axis(scores, idx, axis=-1)
+    hits = idx if rows is None else rows[idx]
+    return hits, top, time.perf_counter() - t0
+
+# ------- Lado API (proceso que posee el store) -------
+class _Shard:
+    '''Estado de un shard en el proceso dueño: ficheros memmap + payloads.'''
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+        self.cap = 0
+        self.n = 0
+        self.payloads: List[Dict[str, Any]] = []
+        self.vecs: Optional[np.memmap] = None
+        self.prices: Optional[np.memmap] = None
+        self.colors: Optional[np.memmap] = None
+
+    def map(self, dim: int) -> None:
+        self.vecs = np.memmap(f"{self.prefix}.f32", dtype=np.float32, mode="r+", shape=(self.cap, dim))
+        self.prices = np.memmap(f"{self.prefix}.price", dtype=np.float64, mode="r+", shape=(self.cap,))
+        self.colors = np.memmap(f"{self.prefix}.color", dtype=np.uint32, mode="r+", shape=(self.cap,))
+
+    def resize(self, cap: int, dim: int) -> None:
+        '''Los ficheros crecen in situ: las filas ya escritas se conservan.'''
+        for suffix, width in ((".f32", dim * 4), (".price", 8), (".color", 4)):
+            with open(self.prefix + suffix, "ab") as f:
+                f.truncate(cap * width)
+        self.cap = cap
+        self.map(dim)
+
+    def flush(self) -> None:
+        for mm in (self.vecs, self.prices, self.colors):
+            if mm is not None:
+                mm.flush()
+
+class ShardedVectorStore:
+    """
+    Vector store exacto particionado en `shards` (crc32(filepath) % shards).
+    Cada shard vive en ficheros memmap (vectores float32 normalizados +
+    columnas precio/color para filtrar). Una consulta se reparte a un pool de
+    `workers` procesos (scatter), cada uno devuelve su top-k y los resultados
+    se combinan con un heap (gather). Con workers=0 los shards se recorren en
+    el propio proceso. El tiempo de cada shard va a `visual_shard_seconds` y a
+    `shard_stats()`, para dimensionar shards/workers por pod.
+
+    Quién escribe qué bajo `root`:
+      - `snap-<mtime>-<tamaño>-<shards>/`: shards de un snapshot concreto. Los
+        construye el primer worker que hace `load(snapshot)` (bajo flock) y
+        nadie los modifica después; el resto de workers se adjunta y comparte
+        las páginas (una sola copia en la page cache).
+      - `proc-<pid>-*/`: shards privados de un proceso (índice construido en
+        él, sin snapshot). Se crea en la primera escritura; si el proceso está
+        adjunto a un snapshot, antes copia sus shards aquí. `close()` lo borra
+        y, al abrir el store, se borran los de PIDs que ya no existen (tras un
+        cierre sucio). Por eso `root` no debe compartirse entre contenedores
+        con espacios de PIDs distintos.
+    Los `snap-*` de snapshots anteriores se pueden borrar cuando ningún
+    worker los use.
+    """
+    def __init__(
+        self,
+        shards: int = 4,
+        root: str = "data/shards",
+        workers: Optional[int] = None,
+        worker_threads: int = 1,
+        dim: Optional[int] = None,
+        initial_capacity: int = 1024,
+        growth: float = 2.0,
+    ):
+        self.n_shards = max(int(shards), 1)
+        self.root = root
+        self.workers = self.n_shards if workers is None else max(int(workers), 0)
+        self.worker_threads = max(int(worker_threads), 1)
+        self._growth = max(growth, 1.1)
+        self._initial_capacity = max(int(initial_capacity), 1)
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._seconds = np.zeros(self.n_shards, dtype=np.float64)
+        self._calls = np.zeros(self.n_shards, dtype=np.int64)
+        self._sweep_stale()
+        self._reset(dim)
+
+    def _sweep_stale(self) -> None:
+        '''Borra los `proc-<pid>-*` de procesos que murieron sin `close()`.'''
+        if not os.path.isdir(self.root):
+            return
+        for name in os.listdir(self.root):
+            m = _PRIVATE_DIR.match(name)
+            if m and not _pid_alive(int(m.group(1))):
+                shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+                print(f"[ShardedVectorStore] borrado {name}: su proceso ya no existe")
+
+    def _reset(self, dim: Optional[int], folder: Optional[str] = None) -> None:
+        '''Vacía el índice; sin `folder`, el directorio privado se crea en la primera escritura.'''
+        self._drop_private()
+        os.makedirs(self.root, exist_ok=True)
+        self._dim = dim
+        self._folder = folder  # None = aún sin ficheros
+        self._attached = False  # True = shards compartidos de un snapshot (sólo lectura)
+        # los ficheros se (re)dimensionan en la primera escritura; filas viejas más allá de `n` no se leen
+        self._shards = [_Shard(os.path.join(folder or "", f"shard_{s:03d}")) for s in range(self.n_shards)]
+        self._rows: Dict[str, Tuple[int, int]] = {}
+        self._field_counts: Dict[str, int] = {}
+
+    def _drop_private(self) -> None:
+        private = getattr(self, "_private", None)
+        self._private = None
+        if private:
+            shutil.rmtree(private, ignore_errors=True)
+
+    def _detach(self) -> None:
+        '''Crea el directorio privado antes de la primera escritura (copiando los shards compartidos, si los hay).'''
+        folder = self._folder = self._private = tempfile.mkdtemp(prefix=f"proc-{os.getpid()}-", dir=self.root)
+        for sh in self._shards:
+            prefix = os.path.join(folder, os.path.basename(sh.prefix))
+            if sh.cap:
+                for suffix in (".f32", ".price", ".color"):
+                    shutil.copyfile(sh.prefix + suffix, prefix + suffix)
+            sh.prefix = prefix
+            if sh.cap:
+                sh.map(self._dim)
+        if self._attached:
+            print(f"[ShardedVectorStore] escritura sobre shards compartidos: copia privada en {folder}")
+        self._attached = False
+
+    def __len__(self) -> int:
+        return sum(sh.n for sh in self._shards)
+
+    @property
+    def dim(self) -> Optional[int]:
+        return self._dim
+
+    def _shard_of(self, filepath: str) -> int:
+        return zlib.crc32(filepath.encode("utf-8")) % self.n_shards
+
+    # ------- Pool de procesos -------
+    def _executor(self) -> Optional[ProcessPoolExecutor]:
+        if self.workers == 0:
+            return None
+        if self._pool is None:
+            # spawn: los workers no heredan hilos ni estado del proceso de la API.
+            # Se lanzan todos ya, con el entorno de hilos de BLAS fijado sólo para ellos.
+            saved = {v: os.environ.get(v) for v in _BLAS_THREAD_VARS}
+            os.environ.update({v: str(self.worker_threads) for v in _BLAS_THREAD_VARS})
+            try:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=mp.get_context("spawn"))
+                list(self._pool.map(_ping, range(self.workers)))
+            finally:
+                for v, old in saved.items():
+                    if old is None:
+                        os.environ.pop(v, None)
+                    else:
+                        os.environ[v] = old
+        return self._pool
+
+    def warmup(self) -> None:
+        '''Arranca los procesos del pool (spawn + imports) antes del primer /retrieve.'''
+        self._executor()
+
+    def close(self) -> None:
+        '''Para el pool y borra los shards privados de este proceso.'''
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+        self._drop_private()
+
+    # ------- VisualAgent API -------
+    def index(self, vectors: List[List[float]], payloads: List[Dict[str, Any]]) -> None:
+        '''Upsert por filepath: cada item va siempre al mismo shard y re-indexar sobrescribe su fila.'''
+        assert len(vectors) == len(payloads), "vectors y payloads deben tener igual longitud"
+        if len(vectors) == 0:
+            return
+        mat = _as_matrix(vectors)
+        if self._dim is None:
+            self._dim = int(mat.shape[1])
+        if mat.shape[1] != self._dim:
+            raise ValueError(f"Dimensión {mat.shape[1]} != {self._dim}")
+        mat = _normalize_rows(mat)
+        if self._attached or self._folder is None:
+            self._detach()
+        by_shard: Dict[int, List[int]] = {}
+        for j, p in enumerate(payloads):
+            by_shard.setdefault(self._shard_of(p["filepath"]), []).append(j)
+        for s, js in by_shard.items():
+            sh = self._shards[s]
+            needed = sh.n + len(js)
+            if needed > sh.cap:
+                cap = sh.cap or self._initial_capacity
+                while cap < needed:
+                    cap = int(cap * self._growth) + 1
+                sh.resize(cap, self._dim)
+            rows = np.empty(len(js), dtype=np.int64)
+            for t, j in enumerate(js):
+                p = payloads[j]
+                loc = self._rows.get(p["filepath"])
+                if loc is None:
+                    row = sh.n
+                    sh.n += 1
+                    sh.payloads.append(p)
+                else:
+                    row = loc[1]
+                    self._count_fields(sh.payloads[row], -1)
+                    sh.payloads[row] = p
+                self._rows[p["filepath"]] = (s, row)
+                self._count_fields(p, +1)
+                price = p.get("price")
+                sh.prices[row] = float(price) if price is not None else np.nan
+                sh.colors[row] = _color_code(p.get("color"))
+                rows[t] = row
+            sh.vecs[rows] = mat[js]
+
+    def _count_fields(self, payload: Dict[str, Any], delta: int) -> None:
+        for f in payload:
+            self._field_counts[f] = self._field_counts.get(f, 0) + delta
+
+    def supports_filter(self, field: str) -> bool:
+        '''Sólo color y precio tienen columna en los shards; filtrable si todos los payloads lo traen.'''
+        n = len(self)
+        return field in ("color", "price") and n > 0 and self._field_counts.get(field, 0) == n
+
+    def get_vectors(self, filepaths: Sequence[str]) -> List[Optional[np.ndarray]]:
+        out: List[Optional[np.ndarray]] = []
+        for fp in filepaths:
+            loc = self._rows.get(fp)
+            out.append(None if loc is None else np.array(self._shards[loc[0]].vecs[loc[1]]))
+        return out
+
+    def query(self, vector: List[float], k: int = 10, where: Optional[QueryFilter] = None) -> List[Dict[str, Any]]:
+        return self.query_many([vector], k=k, where=where)[0]
+
+    def query_many(
+        self, vectors: List[List[float]], k: int = 10, where: Optional[QueryFilter] = None
+    ) -> List[List[Dict[str, Any]]]:
+        '''Scatter del bloque de consultas a todos los shards y gather de los top-k con un heap.'''
+        if len(vectors) == 0:
+            return []
+        live = [s for s, sh in enumerate(self._shards) if sh.n > 0]
+        if not live:
+            return [[] for _ in range(len(vectors))]
+        qs = _normalize_rows(_as_matrix(vectors))
+        color = _color_code(where.color) if where is not None else 0
+        max_price = where.max_price if where is not None else None
+        pool = self._executor()
+        # memmaps compartidos (MAP_SHARED): los workers ven las escrituras sin flush
+        args = [
+            (self._shards[s].prefix, self._shards[s].cap, self._dim, self._shards[s].n, qs, k, color, max_price)
+            for s in live
+        ]
+        if pool is None:
+            parts = [search_shard(*a) for a in args]
+        else:
+            parts = [f.result() for f in [pool.submit(search_shard, *a) for a in args]]
+        slowest = 0.0
+        for s, (_, _, dt) in zip(live, parts):
+            SHARD_SECONDS.labels(shard=s).observe(dt)
+            self._seconds[s] += dt
+            self._calls[s] += 1
+            slowest = max(slowest, dt)
+        record("shard_max", slowest)
+
+        with span("gather"):
+            out: List[List[Dict[str, Any]]] = []
+            for m in range(len(qs)):
+                # cada lista de shard ya viene ordenada: merge perezoso y corte en k
+                streams = [
+                    zip(-top[m], itertools.repeat(s), hits[m])
+                    for s, (hits, top, _) in zip(live, parts)
+                ]
+                merged = itertools.islice(heapq.merge(*streams), k)
+                out.append([{**self._shards[s].payloads[int(r)], "score": float(-neg)} for neg, s, r in merged])
+        return out
+
+    def shard_stats(self) -> List[Dict[str, Any]]:
+        '''Items y latencia media de búsqueda por shard (desde el arranque).'''
+        return [
+            {"shard": s, "items": sh.n,
+             "searches": int(self._calls[s]),
+             "mean_ms": round(float(self._seconds[s] / self._calls[s]) * 1000, 3) if self._calls[s] else None}
+            for s, sh in enumerate(self._shards)
+        ]
+
+    # ------- Indexado incremental -------
+    def fingerprints(self) -> Dict[str, Optional[str]]:
+        return {fp: self._shards[s].payloads[row].get("fingerprint") for fp, (s, row) in self._rows.items()}
+
+    def delete(self, filepaths: List[str]) -> int:
+        '''Borra items moviendo la última fila de su shard al hueco.'''
+        if self._attached and any(fp in self._rows for fp in filepaths):
+            self._detach()
+        deleted = 0
+        for fp in filepaths:
+            loc = self._rows.pop(fp, None)
+            if loc is None:
+                continue
+            s, row = loc
+            sh = self._shards[s]
+            last = sh.n - 1
+            self._count_fields(sh.payloads[row], -1)
+            if row != last:
+                sh.vecs[row] = sh.vecs[last]
+                sh.prices[row] = sh.prices[last]
+                sh.colors[row] = sh.colors[last]
+                sh.payloads[row] = sh.payloads[last]
+                self._rows[sh.payloads[row]["filepath"]] = (s, row)
+            sh.payloads.pop()
+            sh.n -= 1
+            deleted += 1
+        return deleted
+
+    # ------- Snapshot / adjuntarse a los shards de otro proceso -------
+    def _shared_dir(self, snapshot_path: str) -> str:
+        '''Directorio de shards de esta versión del snapshot (cambia si se reescribe).'''
+        st = os.stat(snapshot_path)
+        return os.path.join(self.root, f"snap-{st.st_mtime_ns}-{st.st_size}-{self.n_shards}")
+
+    def _write_meta(self, folder: str, model_tag: str) -> None:
+        meta = {
+            "dim": self._dim, "shards": self.n_shards, "model_tag": model_tag,
+            "caps": [sh.cap for sh in self._shards], "counts": [sh.n for sh in self._shards],
+        }
+        for sh in self._shards:
+            sh.flush()
+            with open(f"{sh.prefix}.payloads.json", "w") as f:
+                json.dump(sh.payloads, f)
+        # meta.json se escribe el último: su presencia marca los shards como completos
+        tmp = os.path.join(folder, "meta.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp, os.path.join(folder, "meta.json"))
+
+    def _attach(self, folder: str, meta: Dict[str, Any]) -> None:
+        '''Usa los shards ya escritos en disco (sin copiar vectores).'''
+        self._reset(int(meta["dim"]), folder)
+        for s, sh in enumerate(self._shards):
+            sh.cap, sh.n = int(meta["caps"][s]), int(meta["counts"][s])
+            with open(f"{sh.prefix}.payloads.json") as f:
+                sh.payloads = json.load(f)
+            if sh.cap:
+                sh.map(self._dim)
+            for row, p in enumerate(sh.payloads):
+                self._rows[p["filepath"]] = (s, row)
+                self._count_fields(p, +1)
+        self._attached = True
+
+    def save(self, path: str, model_tag: str = "") -> None:
+        '''Snapshot .npz estándar (vectores + payloads); los shards compartidos se crean en `load`.'''
+        vectors = [np.asarray(sh.vecs[:sh.n]) for sh in self._shards if sh.n]
+        vectors = np.concatenate(vectors) if vectors else np.empty((0, self._dim or 0), dtype=np.float32)
+        payloads = [p for sh in self._shards for p in sh.payloads]
+        write_snapshot(path, vectors, payloads, model_tag=model_tag)
+
+    def load(self, path: str, model_tag: Optional[str] = None) -> int:
+        '''
+        Se adjunta a los shards compartidos de este snapshot; si aún no existen,
+        los construye. Con varios workers arrancando a la vez, el primero que
+        toma el flock construye y el resto se adjunta.
+        '''
+        os.makedirs(self.root, exist_ok=True)
+        folder = self._shared_dir(path)
+        meta_path = os.path.join(folder, "meta.json")
+        with open(os.path.join(self.root, ".lock"), "a") as lockf:
+            fcntl.flock(lockf, fcntl.LOCK_EX)
+            try:
+                meta = None
+                if os.path.exists(meta_path):
+                    with open(meta_path) as f:
+                        meta = json.load(f)
+                if meta and model_tag and meta.get("model_tag") and meta["model_tag"] != model_tag:
+                    raise ValueError(f"Shards de {path} son de {meta['model_tag']}, esperado {model_tag}")
+                if meta:
+                    self._attach(folder, meta)
+                else:
+                    vectors, payloads, smeta = read_snapshot(path, model_tag=model_tag)
+                    shutil.rmtree(folder, ignore_errors=True)  # restos de una construcción interrumpida
+                    os.makedirs(folder)
+                    self._reset(int(vectors.shape[1]), folder)
+                    self.index(vectors, payloads)
+                    self._write_meta(folder, smeta.get("model_tag", ""))
+                    self._attached = True
+            finally:
+                fcntl.flock(lockf, fcntl.LOCK_UN)
+        return len(self)
@@ -1,14 +1,125 @@
 # app/core/tools/weaviate_vector_store.py
-from typing import List, Dict, Any, Optional
-import uuid
+from typing import List, Dict, Any, Optional, Set, Tuple, Callable, TypeVar
+import time, random
+import requests
 import weaviate
+from weaviate.config import Config, ConnectionConfig
+from weaviate.exceptions import UnexpectedStatusCodeException
+from weaviate.data.replication import ConsistencyLevel
+from ..types import QueryFilter
+from ..utils import object_uuid
+from ..metrics import VSTORE_ERRORS, VSTORE_RETRIES
+
+T = TypeVar("T")
+
+# Propiedades de la clase en Weaviate (compartidas con app/indexer.py)
+SCHEMA_PROPERTIES = [
+    {"name": "filepath",    "dataType": ["text"]},
+    {"name": "title",       "dataType": ["text"]},
+    {"name": "brand",       "dataType": ["text"]},
+    {"name": "color",       "dataType": ["text"]},
+    {"name": "source",      "dataType": ["text"]},
+    {"name": "url",         "dataType": ["text"]},
+    {"name": "price",       "dataType": ["number"]},  # materializado en el indexado (enrich_batch)
+    {"name": "fingerprint", "dataType": ["text"]},  # huella contenido+modelo (indexado incremental)
+]
+
+def _is_transient(e: Exception) -> bool:
+    '''Errores que merecen reintento: red, timeouts, 429 y 5xx.'''
+    if isinstance(e, (requests.ConnectionError, requests.Timeout)):
+        return True
+    if isinstance(e, UnexpectedStatusCodeException):
+        return e.status_code == 429 or e.status_code >= 500
+    return False
+
+def ensure_class(client: weaviate.Client, class_name: str) -> Optional[List[str]]:
+    '''
+    Crea la clase si no existe (devuelve None); si existe, le añade las
+    propiedades de SCHEMA_PROPERTIES que le falten y devuelve sus nombres.
+    '''
+    classes = {c["class"]: c for c in (client.schema.get().get("classes") or [])}
+    if class_name not in classes:
+        client.schema.create_class({
+            "class": class_name,
+            "vectorizer": "none",
+            "properties": SCHEMA_PROPERTIES,
+        })
+        return None
+    have = {p["name"] for p in (classes[class_name].get("properties") or [])}
+    added = []
+    for prop in SCHEMA_PROPERTIES:
+        if prop["name"] not in have:
+            client.schema.property.create(class_name, prop)
+            added.append(prop["name"])
+    return added
+
+def fetch_fingerprints(client: weaviate.Client, class_name: str, page_size: int = 1000) -> Dict[str, Dict[str, str]]:
+    '''Recorre la clase con la cursor API -> {filepath: {"id", "fingerprint"}}.'''
+    out: Dict[str, Dict[str, str]] = {}
+    after = None
+    while True:
+        q = (
+            client.query.get(class_name, ["filepath", "fingerprint"])
+            .with_additional(["id"])
+            .with_limit(page_size)
+        )
+        if after:
+            q = q.with_after(after)
+        data = (q.do().get("data") or {}).get("Get", {}).get(class_name) or []
+        for d in data:
+            oid = d["_additional"]["id"]
+            if d.get("filepath"):
+                out[d["filepath"]] = {"id": oid, "fingerprint": d.get("fingerprint")}
+            after = oid
+        if len(data) < page_size:
+            return out
+
+def fetch_vectors(
+    client: weaviate.Client, class_name: str, page_size: int = 1000
+) -> Tuple[List[Dict[str, Any]], List[List[float]]]:
+    '''Recorre la clase con la cursor API -> (payloads, vectores) de todos los objetos.'''
+    props = [p["name"] for p in SCHEMA_PROPERTIES]
+    payloads: List[Dict[str, Any]] = []
+    vecs: List[List[float]] = []
+    after = None
+    while True:
+        q = (
+            client.query.get(class_name, props)
+            .with_additional(["id", "vector"])
+            .with_limit(page_size)
+        )
+        if after:
+            q = q.with_after(after)
+        data = (q.do().get("data") or {}).get("Get", {}).get(class_name) or []
+        for d in data:
+            extra = d.pop("_additional")
+            if d.get("filepath") and extra.get("vector"):
+                payloads.append(d)
+                vecs.append(extra["vector"])
+            after = extra["id"]
+        if len(data) < page_size:
+            return payloads, vecs
+
+def delete_objects(client: weaviate.Client, class_name: str, ids: List[str]) -> int:
+    '''Borra objetos por UUID; devuelve cuántos se borraron.'''
+    deleted = 0
+    for oid in ids:
+        try:
+            client.data_object.delete(oid, class_name=class_name)
+            deleted += 1
+        except Exception as e:
+            print(f"[WeaviateVectorStore] No se pudo borrar {oid}: {e}")
+    return deleted
 
 class WeaviateVectorStore:
     """
     VectorStore para VisualAgent sobre Weaviate con vectorizer='none'.
     Implementa:
       - index(vectors, payloads)
-      - query(vector, k)
+      - query(vector, k, where)
+      - query_many(vectors, k, where): varias nearVector en un solo documento GraphQL (alias)
+    El cliente usa un pool de conexiones HTTP keep-alive de tamaño explícito,
+    timeouts (connect, read) y reintentos con backoff exponencial.
     """
     def __init__(
         self,
@@ -17,74 +128,178 @@ class WeaviateVectorStore:
         class_name: str = "FashionItem",
         text_props: Optional[List[str]] = None,
         consistency_level: Optional[str] = None,
+        timeout: Tuple[float, float] = (5.0, 30.0),
+        pool_connections: int = 20,
+        pool_maxsize: int = 50,
+        max_retries: int = 3,
+        backoff: float = 0.2,
+        max_queries_per_request: int = 32,
     ):
         auth = weaviate.AuthApiKey(api_key=api_key) if api_key else None
-        self.client = weaviate.Client(url=url, auth_client_secret=auth)
+        self.url = url
+        self.client = weaviate.Client(
+            url=url,
+            auth_client_secret=auth,
+            timeout_config=timeout,
+            additional_config=Config(connection_config=ConnectionConfig(
+                session_pool_connections=pool_connections,
+                session_pool_maxsize=pool_maxsize,
+            )),
+        )
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_queries_per_request = max(int(max_queries_per_request), 1)
         self.class_name = class_name
-        self.text_props = text_props or ["filepath", "title", "brand", "color", "source", "url"]
-        self.consistency_level = consistency_level
+        self.text_props = text_props or ["filepath", "title", "brand", "color", "source", "url", "price"]
+        # "ONE" | "QUORUM" | "ALL": el cliente v3 espera el enum (batch y GraphQL)
+        self.consistency_level = ConsistencyLevel(consistency_level) if consistency_level else None
+        self.client.batch.consistency_level = self.consistency_level
+        self._props: Optional[Set[str]] = None
 
     # ------- Schema helpers -------
     def ensure_schema(self):
-        schema = self.client.schema.get()
-        classes = {c["class"] for c in (schema.get("classes") or [])}
-        if self.class_name in classes:
-            return
-        self.client.schema.create_class({
-            "class": self.class_name,
-            "vectorizer": "none",
-            "properties": [
-                {"name": "filepath", "dataType": ["text"]},
-                {"name": "title",    "dataType": ["text"]},
-                {"name": "brand",    "dataType": ["text"]},
-                {"name": "color",    "dataType": ["text"]},
-                {"name": "source",   "dataType": ["text"]},
-                {"name": "url",      "dataType": ["text"]},
-            ],
-        })
+        if ensure_class(self.client, self.class_name) != []:
+            self._props = None  # clase nueva o con propiedades añadidas
 
     def drop_class(self):
         try:
             self.client.schema.delete_class(self.class_name)
         except Exception:
             pass
+        self._props = None
+
+    def _schema_props(self) -> Set[str]:
+        '''Propiedades de la clase en Weaviate (cacheadas tras la primera lectura).'''
+        if self._props is None:
+            try:
+                cls = self.client.schema.get(self.class_name)
+                self._props = {p["name"] for p in (cls.get("properties") or [])}
+            except Exception:
+                return set()
+        return self._props
+
+    def _with_retry(self, fn: Callable[[], T]) -> T:
+        '''Ejecuta `fn` reintentando errores transitorios con backoff exponencial (+ jitter).'''
+        for attempt in range(self.max_retries + 1):
+            try:
+                return fn()
+            except Exception as e:
+                transient = _is_transient(e)
+                VSTORE_ERRORS.labels(store="weaviate", transient=transient).inc()
+                if attempt >= self.max_retries or not transient:
+                    raise
+                VSTORE_RETRIES.labels(store="weaviate").inc()
+                time.sleep(self.backoff * (2 ** attempt) * (1.0 + 0.1 * random.random()))
+
+    def warmup(self) -> None:
+        '''Abre conexiones del pool y cachea el schema antes del primer /retrieve.'''
+        if not self._with_retry(self.client.is_ready):
+            raise RuntimeError(f"Weaviate en {self.url} no está listo")
+        self._schema_props()
+
+    def _query_props(self) -> List[str]:
+        '''Propiedades a pedir: las de `text_props` presentes en el schema (clases antiguas sin `price`).'''
+        props = self._schema_props()
+        return [p for p in self.text_props if not props or p in props]
+
+    # ------- Filtros -------
+    def supports_filter(self, field: str) -> bool:
+        return field in self._schema_props()
+
+    @staticmethod
+    def build_where(where: Optional[QueryFilter]) -> Optional[Dict[str, Any]]:
+        '''Traduce un QueryFilter a un filtro `where` de GraphQL.'''
+        if where is None:
+            return None
+        operands = []
+        if where.color:
+            operands.append({"path": ["color"], "operator": "Equal", "valueText": where.color})
+        if where.max_price is not None:
+            operands.append({"path": ["price"], "operator": "LessThanEqual", "valueNumber": float(where.max_price)})
+        if not operands:
+            return None
+        if len(operands) == 1:
+            return operands[0]
+        return {"operator": "And", "operands": operands}
+
+    # ------- Indexado incremental -------
+    def fingerprints(self) -> Dict[str, str]:
+        '''{filepath: fingerprint} de los objetos ya indexados.'''
+        existing = self._with_retry(lambda: fetch_fingerprints(self.client, self.class_name))
+        return {fp: d.get("fingerprint") for fp, d in existing.items()}
+
+    def delete(self, filepaths: List[str]) -> int:
+        '''Borra los items de esos filepaths (el UUID se deriva del filepath).'''
+        return delete_objects(self.client, self.class_name, [object_uuid(fp) for fp in filepaths])
+
+    def get_vectors(self, filepaths: List[str]) -> List[Optional[List[float]]]:
+        '''
+        Vector almacenado de cada filepath (None si no está): fetch por UUID con
+        `_additional { id vector }`, `max_queries_per_request` objetos por petición.
+        '''
+        ids = [object_uuid(fp) for fp in filepaths]
+        found: Dict[str, List[float]] = {}
+        step = self.max_queries_per_request
+        for start in range(0, len(ids), step):
+            chunk = ids[start:start + step]
+            operands = [{"path": ["id"], "operator": "Equal", "valueText": oid} for oid in chunk]
+            q = (
+                self.client.query.get(self.class_name, ["filepath"])
+                .with_additional(["id", "vector"])
+                .with_where(operands[0] if len(operands) == 1 else {"operator": "Or", "operands": operands})
+                .with_limit(len(chunk))
+            )
+            if self.consistency_level:
+                q = q.with_consistency_level(self.consistency_level)
+            res = self._with_retry(q.do)
+            for d in (res.get("data") or {}).get("Get", {}).get(self.class_name) or []:
+                extra = d.get("_additional") or {}
+                if extra.get("vector"):
+                    found[extra["id"]] = extra["vector"]
+        return [found.get(oid) for oid in ids]
 
     # ------- VisualAgent API -------
     def index(self, vectors: List[List[float]], payloads: List[Dict[str, Any]]) -> None:
+        '''Upsert idempotente: el UUID es uuid5(filepath), re-indexar sobrescribe.'''
         assert len(vectors) == len(payloads), "vectors y payloads deben tener igual longitud"
         with self.client.batch as batch:
             # batch.batch_size = 128  # opcional
             for v, p in zip(vectors, payloads):
                 props = {
-                    "filepath": p.get("filepath"),
-                    "title":    p.get("title"),
-                    "brand":    p.get("brand"),
-                    "color":    p.get("color"),
-                    "source":   p.get("source"),
-                    "url":      p.get("url"),
+                    "filepath":    p.get("filepath"),
+                    "title":       p.get("title"),
+                    "brand":       p.get("brand"),
+                    "color":       p.get("color"),
+                    "source":      p.get("source"),
+                    "url":         p.get("url"),
+                    "price":       p.get("price"),
+                    "fingerprint": p.get("fingerprint"),
                 }
                 batch.add_data_object(
                     data_object=props,
                     class_name=self.class_name,
-                    uuid=uuid.uuid4(),
+                    uuid=object_uuid(p["filepath"]),
                     vector=v,
-                    consistency_level=self.consistency_level,
                 )
 
-    def query(self, vector: List[float], k: int = 10) -> List[Dict[str, Any]]:
+    def _get_builder(self, vector: List[float], k: int, where: Optional[QueryFilter] = None):
         q = (
             self.client.query
-            .get(self.class_name, self.text_props)
-            .with_near_vector({"vector": vector})
+            .get(self.class_name, self._query_props())
+            .with_near_vector({"vector": [float(x) for x in vector]})
             .with_additional(["distance"])
             .with_limit(k)
         )
+        where_clause = self.build_where(where)
+        if where_clause:
+            q = q.with_where(where_clause)
         if self.consistency_level:
             q = q.with_consistency_level(self.consistency_level)
-        res = q.do()
-        data = res.get("data", {}).get("Get", {}).get(self.class_name, []) or []
+        return q
+
+    def _parse(self, data: Optional[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
         items = []
-        for d in data:
+        for d in data or []:
             dist = (d.get("_additional") or {}).get("distance")
             score = None
             if isinstance(dist, (int, float)):
@@ -95,3 +310,27 @@ class WeaviateVectorStore:
                 item[prop] = d.get(prop)
             items.append(item)
         return items
+
+    def query(self, vector: List[float], k: int = 10, where: Optional[QueryFilter] = None) -> List[Dict[str, Any]]:
+        res = self._with_retry(self._get_builder(vector, k, where).do)
+        data = res.get("data", {}).get("Get", {}).get(self.class_name, []) or []
+        return self._parse(data)
+
+    def query_many(
+        self, vectors: List[List[float]], k: int = 10, where: Optional[QueryFilter] = None
+    ) -> List[List[Dict[str, Any]]]:
+        '''
+        Varias búsquedas nearVector en un único documento GraphQL, una por alias
+        (q0, q1, ...), troceado en `max_queries_per_request` consultas por petición.
+        '''
+        out: List[List[Dict[str, Any]]] = []
+        step = self.max_queries_per_request
+        for start in range(0, len(vectors), step):
+            chunk = vectors[start:start + step]
+            builders = [self._get_builder(v, k, where).with_alias(f"q{i}") for i, v in enumerate(chunk)]
+            res = self._with_retry(self.client.query.multi_get(builders).do)
+            got = (res.get("data") or {}).get("Get") or {}
+            if not got and res.get("errors"):
+                raise RuntimeError(f"Weaviate multi_get falló: {res['errors']}")
+            out.extend(self._parse(got.get(f"q{i}")) for i in range(len(chunk)))
+        return out
@@ -1,5 +1,5 @@
 from dataclasses import dataclass, field
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Callable, Tuple
 
 @dataclass
 class RetrievalCandidate:
@@ -26,6 +26,7 @@ class EnrichedItem:
     currency: str = "EUR"
     source: Optional[str] = None
     url: Optional[str] = None
+    available: Optional[bool] = None
 
 @dataclass
 class AgentResponse:
@@ -34,9 +35,50 @@ class AgentResponse:
     '''
     query_image: str
     results: List[EnrichedItem]
+    timings: Dict[str, float] = field(default_factory=dict)  # segundos por etapa (si hay métricas)
 
 @dataclass
 class AgentConfig:
     '''Configuración del agente visual.'''
     top_k: int = 10
     prefer_online: bool = True
+    overfetch_factor: int = 3   # multiplicador cuando un filtro no se puede delegar al vector store
+    max_fetch: int = 200        # tope de candidatos por consulta al sobre-pedir
+    reuse_indexed_vectors: bool = True  # consultas por ruta ya indexada: vector del store, sin embedder
+    use_knn_graph: bool = True          # consultas sin filtros por items del catálogo: grafo k-NN precalculado
+
+@dataclass
+class QueryFilter:
+    '''Filtro estructurado de la búsqueda (color exacto y precio máximo).'''
+    color: Optional[str] = None
+    max_price: Optional[float] = None
+
+    def fields(self) -> List[str]:
+        '''Campos del payload sobre los que actúa el filtro.'''
+        out = []
+        if self.color:
+            out.append("color")
+        if self.max_price is not None:
+            out.append("price")
+        return out
+
+    def is_empty(self) -> bool:
+        return not self.fields()
+
+    def matches(self, item: Dict[str, Any]) -> bool:
+        if self.color and (item.get("color") or "").lower() != self.color.lower():
+            return False
+        if self.max_price is not None:
+            price = item.get("price")
+            if price is None or float(price) > self.max_price:
+                return False
+        return True
+
+    def split(self, can_push: Callable[[str], bool]) -> Tuple["QueryFilter", "QueryFilter"]:
+        '''Separa el filtro en (parte delegable al vector store, parte residual).'''
+        pushed, residual = QueryFilter(), QueryFilter()
+        if self.color:
+            (pushed if can_push("color") else residual).color = self.color
+        if self.max_price is not None:
+            (pushed if can_push("price") else residual).max_price = self.max_price
+        return pushed, residual
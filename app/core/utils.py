@@ -1,9 +1,11 @@
 
 # app/core/utils.py
 import math
+import uuid
 import random
 import hashlib
-from typing import List
+from typing import List, Optional
+from .registry import unwrap
 
 """Funciones utilitarias para la recuperación visual."""    
 
@@ -30,3 +32,73 @@ def normalize(v: List[float]) -> List[float]:
     """Normaliza un vector a longitud 1."""
     n = math.sqrt(sum(x*x for x in v)) or 1.0
     return [x / n for x in v]
+
+# Namespace fijo para derivar UUIDs de objeto a partir del filepath
+OBJECT_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "visual-agent-rag/object")
+
+def object_uuid(filepath: str) -> str:
+    """UUID determinista (uuid5) de un item: re-indexar el mismo filepath lo sobrescribe."""
+    return str(uuid.uuid5(OBJECT_NAMESPACE, filepath))
+
+def content_digest(image_path: str, chunk_size: int = 1 << 20) -> bytes:
+    """
+    Hash sha256 del contenido de la imagen. Si la ruta no existe (rutas
+    sintéticas del MockDataset) se usa la propia ruta como contenido.
+    """
+    h = hashlib.sha256()
+    try:
+        with open(image_path, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                h.update(chunk)
+    except OSError:
+        h.update(b"path:" + image_path.encode("utf-8"))
+    return h.digest()
+
+# Modelos CLIP del zoo de FiftyOne (indexador offline) -> (modelo OpenCLIP, pesos, dim)
+FIFTYONE_CLIP_MODELS = {
+    "clip-vit-base32-torch": ("ViT-B-32", "openai", 512),
+}
+
+def clip_model_tag(model_name: str, pretrained: str, dim: int, variant: str = "") -> str:
+    """
+    Etiqueta de un encoder CLIP. La comparten CLIPEmbedder (API) y el indexador
+    offline: con los mismos pesos, las huellas de uno valen para el otro.
+    """
+    parts = ["CLIPEmbedder", model_name, pretrained, dim] + ([variant] if variant else [])
+    return "/".join(str(p) for p in parts)
+
+def fiftyone_model_tag(zoo_model: str) -> str:
+    """Etiqueta del modelo del zoo de FiftyOne (la de CLIP si hay equivalente OpenCLIP)."""
+    spec = FIFTYONE_CLIP_MODELS.get(zoo_model)
+    return clip_model_tag(*spec) if spec else f"fiftyone/{zoo_model}"
+
+def model_tag_for(embedder) -> str:
+    """Etiqueta de modelo (clase/modelo/pesos/dim) de un embedder."""
+    embedder = unwrap(embedder)
+    tag = getattr(embedder, "model_tag", None)
+    if tag:
+        return tag
+    parts = [
+        type(embedder).__name__,
+        getattr(embedder, "model_name", None),
+        getattr(embedder, "pretrained", None),
+        getattr(embedder, "dim", None),
+    ]
+    return "/".join(str(p) for p in parts if p is not None)
+
+# Versión de los campos materializados al indexar (brand/color/price/url).
+# Subirla fuerza a re-subir los objetos indexados con una versión anterior.
+ENRICH_VERSION = "enrich-v1"
+
+def fingerprint(filepath: str, model_tag: str, digest: Optional[bytes] = None, payload: str = "") -> str:
+    """
+    Huella contenido+modelo de un item: si cambia, hay que re-embeber y re-subir.
+    `digest` evita releer el archivo si ya se conoce su sha256 (ver DigestCache).
+    `payload` (p. ej. ENRICH_VERSION) identifica cómo se construyó el payload.
+    """
+    h = hashlib.sha256(digest if digest is not None else content_digest(filepath))
+    h.update(b"\0" + model_tag.encode("utf-8"))
+    if payload:
+        h.update(b"\0" + payload.encode("utf-8"))
+    return h.hexdigest()[:32]
+
@@ -1,30 +1,116 @@
+import os, time
+
+_t0 = time.perf_counter()
+
 from app.core.orchestrator import VisualAgent
+from app.core.batcher import MicroBatcher
 from app.core.types import AgentConfig
-from app.core.tools.mock_embedder import MockEmbedder
-from app.core.tools.mock_dataset import MockDataset
-from app.core.tools.mock_vector_store import MockVectorStore
-from app.core.tools.mock_enricher import MockEnricher
-from app.core.tools.weaviate_vector_store import WeaviateVectorStore
-from app.core.tools.clip_embedder import CLIPEmbedder
-from app.core.tools.enricher import SimpleEnricher
-
-import os
+from app.core.registry import Lazy, load_backend, import_report
 
 WEAVIATE_URL = os.getenv("WEAVIATE_URL", "http://localhost:8080")
 WEAVIATE_API_KEY = os.getenv("WEAVIATE_API_KEY", "")
 WVT_CLASS = os.getenv("WVT_CLASS", "FashionItem")   
+EMB_CACHE_DIR = os.getenv("EMB_CACHE_DIR", "")  # vacío = sin caché de embeddings
+RETRIEVE_BATCH_WINDOW_MS = float(os.getenv("RETRIEVE_BATCH_WINDOW_MS", "0"))  # 0 = sin micro-batching
+RETRIEVE_MAX_BATCH = int(os.getenv("RETRIEVE_MAX_BATCH", "16"))
+PRICE_API_URL = os.getenv("PRICE_API_URL", "")  # vacío = MockEnricher
+DATASET_DIR = os.getenv("DATASET_DIR", "")  # vacío = dataset inyectado en runtime
+
+# Selección de backends (ver app/core/registry.py); sólo se importa el elegido
+EMBEDDER = os.getenv("EMBEDDER", "mock")            # mock | clip
+VECTOR_STORE = os.getenv("VECTOR_STORE", "weaviate")  # weaviate | numpy | quantized | sharded | mock
+DATASET = os.getenv("DATASET", "fs" if DATASET_DIR else "none")  # fs | mock | none
+ENRICHER = os.getenv("ENRICHER", "price_api" if PRICE_API_URL else "mock")  # mock | price_api | simple
+
+
+def _make_embedder():
+    if EMBEDDER == "clip":
+        emb = load_backend("embedder", "clip")(
+            model_name=os.getenv("CLIP_MODEL", "ViT-B-32"),
+            pretrained=os.getenv("CLIP_PRETRAINED", "openai"),
+            device=os.getenv("CLIP_DEVICE") or None,
+            backend=os.getenv("CLIP_BACKEND", "torch"),  # torch | torchscript | onnx | onnx-int8
+            onnx_path=os.getenv("CLIP_ONNX_PATH") or None,
+            intra_op_threads=int(os.getenv("CLIP_INTRA_THREADS", "0")),
+            inter_op_threads=int(os.getenv("CLIP_INTER_THREADS", "0")),
+        )
+    else:
+        emb = load_backend("embedder", EMBEDDER)(dim=128)
+    if EMB_CACHE_DIR:
+        from app.core.tools.cached_embedder import CachedEmbedder
+        emb = CachedEmbedder(emb, cache_dir=EMB_CACHE_DIR)
+    return emb
+
+def _make_vstore():
+    cls = load_backend("vstore", VECTOR_STORE)
+    if VECTOR_STORE == "weaviate":
+        return cls(url=WEAVIATE_URL, api_key=WEAVIATE_API_KEY, class_name=WVT_CLASS)
+    if VECTOR_STORE == "quantized":
+        return cls(
+            mode=os.getenv("QUANT_MODE", "int8"),  # int8 | pq
+            raw_path=os.getenv("QUANT_RAW_PATH") or None,  # float32 en memmap para el re-rank
+            rerank_factor=int(os.getenv("QUANT_RERANK_FACTOR", "4")),
+            pq_m=int(os.getenv("QUANT_PQ_M", "16")),
+        )
+    if VECTOR_STORE == "sharded":
+        return cls(
+            shards=int(os.getenv("SHARD_COUNT", "4")),
+            # memmaps: snap-*/ compartidos entre workers (los construye el primer load del snapshot), proc-*/ privados
+            root=os.getenv("SHARD_DIR", "data/shards"),
+            workers=int(os.getenv("SHARD_WORKERS", os.getenv("SHARD_COUNT", "4"))),  # 0 = en proceso
+            worker_threads=int(os.getenv("SHARD_WORKER_THREADS", "1")),
+        )
+    return cls()
 
+def _make_dataset():
+    if DATASET == "fs":
+        from app.core.tools.cached_dataset import CachedDataset
+        fs = load_backend("dataset", "fs")(DATASET_DIR or "data/images", manifest_path=os.getenv("DATASET_MANIFEST") or None)
+        return CachedDataset(fs)
+    return load_backend("dataset", DATASET)()
 
-# Singletons simples para evitar reindexación constante
-_embedder = MockEmbedder(dim=128)
+def _make_enricher():
+    if ENRICHER == "price_api":
+        return load_backend("enricher", "price_api")(
+            base_url=PRICE_API_URL,
+            path=os.getenv("PRICE_API_PATH", "/prices"),
+            api_key=os.getenv("PRICE_API_KEY", ""),
+            timeout=float(os.getenv("PRICE_API_TIMEOUT_S", "0.3")),
+            ttl=float(os.getenv("PRICE_API_TTL_S", "60")),
+            negative_ttl=float(os.getenv("PRICE_API_NEGATIVE_TTL_S", "10")),  # ids que el servicio no conoce
+        )
+    if ENRICHER == "mock":
+        return load_backend("enricher", "mock")(seed=42)
+    return load_backend("enricher", ENRICHER)()
 
-_vstore   = WeaviateVectorStore(url=WEAVIATE_URL, api_key=WEAVIATE_API_KEY, class_name=WVT_CLASS)
-_enricher = MockEnricher(seed=42)
+
+# Singletons simples para evitar reindexación constante.
+# Se construyen en el primer uso (warmup de arranque o primer request), no al importar.
+_embedder = Lazy("embedder", _make_embedder, backend=EMBEDDER)
+_vstore   = Lazy("vstore", _make_vstore, backend=VECTOR_STORE)
+_enricher = Lazy("enricher", _make_enricher, backend=ENRICHER)
+_dataset  = Lazy("dataset", _make_dataset, backend=DATASET) if DATASET != "none" else None
+
+# Enriquecimiento en el indexado (/admin/index): brand/color/price/url se materializan una vez
+index_enricher = Lazy(
+    "index_enricher",
+    lambda: load_backend("enricher", "simple")(color_workers=int(os.getenv("ENRICH_WORKERS", "0"))),
+    backend="simple",
+)
 
 agent_singleton = VisualAgent(
     embedder=_embedder,
-    dataset=None,# placeholder, se inyecta en runtime
+    dataset=_dataset,  # sin DATASET se inyecta en runtime
     vstore=_vstore,
     enricher=_enricher,
     config=AgentConfig(top_k=12, prefer_online=True),
 )
+
+# Agrupa /retrieve concurrentes en lotes (opcional)
+retrieve_batcher = (
+    MicroBatcher(agent_singleton, max_batch=RETRIEVE_MAX_BATCH, max_wait_ms=RETRIEVE_BATCH_WINDOW_MS)
+    if RETRIEVE_BATCH_WINDOW_MS > 0 else None
+)
+
+DEPS_IMPORT_S = time.perf_counter() - _t0
+print(f"[deps] import {DEPS_IMPORT_S * 1000:.1f} ms; {import_report()}")
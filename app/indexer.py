@@ -1,9 +1,16 @@
 # app/indexer.py
-import os, uuid
+import os, time, queue, argparse, threading
+import numpy as np
 import fiftyone as fo
 import fiftyone.zoo as foz
 import fiftyone.brain as fob
 import weaviate
+from typing import Optional
+from app.core.utils import object_uuid, fingerprint, fiftyone_model_tag, ENRICH_VERSION
+from app.core.tools.weaviate_vector_store import ensure_class, fetch_fingerprints, delete_objects
+from app.core.checkpoint import Checkpoint, listing_digest
+from app.core.digest_cache import DigestCache
+from app.core.tools.enricher import SimpleEnricher
 
 DATASET_NAME = os.getenv("FO_DATASET_NAME", "fashion_demo")
 USE_EXISTING  = os.getenv("FO_USE_EXISTING", "false").lower() == "true"
@@ -13,30 +20,30 @@ MAX_SAMPLES   = int(os.getenv("FO_MAX_SAMPLES", "1000"))
 
 EMB_FIELD     = os.getenv("FO_EMB_FIELD", "clip_embedding")
 CLIP_MODEL    = os.getenv("FO_CLIP_MODEL", "clip-vit-base32-torch")
+MODEL_TAG     = fiftyone_model_tag(CLIP_MODEL)  # misma etiqueta que CLIPEmbedder en la API
 
 WEAVIATE_URL  = os.getenv("WEAVIATE_URL", "http://weaviate:8080")
 WEAVIATE_API_KEY = os.getenv("WEAVIATE_API_KEY", "")
 WVT_CLASS     = os.getenv("WVT_CLASS", "FashionItem")
 BATCH_SIZE    = int(os.getenv("BATCH_SIZE", "128"))
+INCREMENTAL   = os.getenv("INCREMENTAL", "true").lower() == "true"
+CHUNK_SIZE    = int(os.getenv("CHUNK_SIZE", str(BATCH_SIZE)))   # objetos por bloque/batch
+UPSERT_WORKERS = int(os.getenv("UPSERT_WORKERS", "4"))          # hilos enviando a Weaviate
+QUEUE_CHUNKS  = int(os.getenv("QUEUE_CHUNKS", "8"))             # bloques en vuelo (memoria acotada)
+ENRICH_AT_INDEX = os.getenv("ENRICH_AT_INDEX", "true").lower() == "true"
+ENRICH_WORKERS  = int(os.getenv("ENRICH_WORKERS", "2"))          # procesos para el color dominante
+CHECKPOINT_PATH  = os.getenv("CHECKPOINT_PATH", "data/checkpoints/indexer.json")
+CHECKPOINT_EVERY = int(os.getenv("CHECKPOINT_EVERY", "10"))     # bloques entre guardados
+DIGEST_CACHE_PATH = os.getenv("DIGEST_CACHE_PATH", "data/manifests/content_digests.sqlite")  # sha256 por (tamaño, mtime)
 
 def ensure_schema(client: weaviate.Client, class_name: str):
-    existing = {c["class"] for c in (client.schema.get().get("classes") or [])}
-    if class_name in existing:
+    added = ensure_class(client, class_name)
+    if added is None:
+        print(f"[Indexer] Clase creada: {class_name}")
+    elif added:
+        print(f"[Indexer] Clase {class_name}: propiedades añadidas {added}")
+    else:
         print(f"[Indexer] Clase ya existe: {class_name}")
-        return
-    client.schema.create_class({
-        "class": class_name,
-        "vectorizer": "none",
-        "properties": [
-            {"name": "filepath", "dataType": ["text"]},
-            {"name": "title",    "dataType": ["text"]},
-            {"name": "brand",    "dataType": ["text"]},
-            {"name": "color",    "dataType": ["text"]},
-            {"name": "source",   "dataType": ["text"]},
-            {"name": "url",      "dataType": ["text"]},
-        ],
-    })
-    print(f"[Indexer] Clase creada: {class_name}")
 
 def load_dataset() -> fo.Dataset:
     if USE_EXISTING:
@@ -50,18 +57,17 @@ def load_dataset() -> fo.Dataset:
     return ds
 
 def compute_embeddings(ds: fo.Dataset):
-    need = EMB_FIELD not in ds.get_field_schema().keys()
-    if not need:
-        for s in ds.take(5):
-            if s.get(EMB_FIELD, None) is None:
-                need = True
-                break
-
-    if not need:
+    # Sólo las muestras sin embedding (nuevas) pasan por el modelo
+    view = ds
+    if EMB_FIELD in ds.get_field_schema().keys():
+        view = ds.exists(EMB_FIELD, False)
+    pending = len(view)
+
+    if not pending:
         print(f"[Indexer] Usando embeddings existentes en '{EMB_FIELD}'")
         return
 
-    print(f"[Indexer] Calculando embeddings vía FiftyOne Brain (modelo={CLIP_MODEL})")
+    print(f"[Indexer] Calculando embeddings vía FiftyOne Brain (modelo={CLIP_MODEL}) para {pending} muestras")
     # En algunas versiones no existe fob.compute_embeddings; usa compute_similarity con compute_embeddings=True
     import fiftyone.brain as fob
     try:
@@ -69,7 +75,7 @@ def compute_embeddings(ds: fo.Dataset):
         compute_embeddings = getattr(fob, "compute_embeddings", None)
         if compute_embeddings is not None:
             compute_embeddings(
-                ds,
+                view,
                 embeddings_field=EMB_FIELD,
                 model=CLIP_MODEL,
                 # device="cpu"  # o "cuda"
@@ -77,7 +83,7 @@ def compute_embeddings(ds: fo.Dataset):
         else:
      
             fob.compute_similarity(
-                ds,
+                view,
                 brain_key="clip_sim_tmp",
                 model=CLIP_MODEL,
                 embeddings_field=EMB_FIELD,
@@ -90,61 +96,199 @@ def compute_embeddings(ds: fo.Dataset):
         raise RuntimeError(f"No se pudieron calcular embeddings con FiftyOne Brain: {e}")
 
 
-def upsert(ds: fo.Dataset, client: weaviate.Client):
-    ensure_schema(client, WVT_CLASS)
-    total, pushed = len(ds), 0
+def make_client() -> weaviate.Client:
+    auth = weaviate.AuthApiKey(api_key=WEAVIATE_API_KEY) if WEAVIATE_API_KEY else None
+    return weaviate.Client(url=WEAVIATE_URL, auth_client_secret=auth)
 
-    import numpy as np
 
-    with client.batch as batch:
-        batch.batch_size = BATCH_SIZE
-        for s in ds:
-            # ----- OBTENER EMBEDDING -----
-            if not s.has_field(EMB_FIELD):
-                continue
-            vec = getattr(s, EMB_FIELD) 
-            if vec is None:
-                continue
-            
-            if not isinstance(vec, list):
-                vec = np.asarray(vec).ravel().astype(float).tolist()
-            if not vec:
-                continue
+def iter_chunks(ds: fo.Dataset, chunk_size: int):
+    """
+    Recorre el dataset por columnas en bloques de `chunk_size`:
+    (filepaths, labels, colors, embeddings) vía select_fields()/values(),
+    sin materializar documentos Sample completos.
+    """
+    schema = ds.get_field_schema()
+    fields = ["filepath", EMB_FIELD]
+    if "ground_truth" in schema:
+        fields.append("ground_truth.label")
+    if "attributes" in schema:
+        fields.append("attributes")
+    ids = ds.values("id")
+    for start in range(0, len(ids), chunk_size):
+        view = ds.select(ids[start:start + chunk_size]).select_fields(
+            [f for f in (EMB_FIELD, "ground_truth", "attributes") if f in schema]
+        )
+        cols = dict(zip(fields, view.values(fields)))
+        n = len(cols["filepath"])
+        yield (
+            cols["filepath"],
+            cols.get("ground_truth.label") or [None] * n,
+            [a.get("color") if isinstance(a, dict) else None for a in (cols.get("attributes") or [None] * n)],
+            cols[EMB_FIELD],
+        )
+
 
-            # ----- METADATOS -----
-            props = {
-                "filepath": s.filepath,
-                "title": None,
-                "brand": None,
-                "color": None,
-                "source": "online",
-                "url": None,
-            }
-            if hasattr(s, "ground_truth") and hasattr(s.ground_truth, "label"):
-                props["title"] = s.ground_truth.label
-
-            if hasattr(s, "attributes") and isinstance(getattr(s, "attributes"), dict):
-                props["color"] = s.attributes.get("color") or props["color"]
-
-            # ----- UPSERT -----
-            batch.add_data_object(
+def _send_chunk(client: weaviate.Client, objs) -> int:
+    """
+    Envía un bloque con la batch API y devuelve el nº de objetos fallidos.
+    El batch del cliente sólo se vacía si el envío tiene éxito: se vacía siempre
+    para que un bloque fallido no se reenvíe junto con el siguiente.
+    """
+    try:
+        for props, vec in objs:
+            client.batch.add_data_object(
                 data_object=props,
                 class_name=WVT_CLASS,
-                uuid=uuid.uuid4(),
+                uuid=object_uuid(props["filepath"]),
                 vector=vec,
             )
-            pushed += 1
+        results = client.batch.create_objects() or []
+    finally:
+        client.batch.empty_objects()
+    return sum(1 for r in results if (r.get("result") or {}).get("errors"))
+
+
+def upsert(ds: fo.Dataset, client: weaviate.Client, ckpt: Optional[Checkpoint] = None):
+    """
+    Productor/consumidor: el hilo principal lee bloques columnares del dataset y
+    los encola (cola acotada => memoria acotada); UPSERT_WORKERS hilos, cada uno
+    con su propio cliente, los envían a Weaviate en paralelo.
+    Con `ckpt` se saltan los bloques ya hechos y se registran los fallidos.
+    """
+    ensure_schema(client, WVT_CLASS)
+    total = len(ds)
+    stats = {"pushed": 0, "failed": 0, "skipped": 0, "resumed": 0, "batches": 0}
+    lock = threading.Lock()
+    t0 = time.monotonic()
 
-    print(f"[Indexer] Upsert a Weaviate completado. {pushed}/{total} objetos")
+    # Incremental: huellas ya indexadas {filepath: {"id", "fingerprint"}}
+    existing = fetch_fingerprints(client, WVT_CLASS) if INCREMENTAL else {}
+    seen = set()
+    digests = DigestCache(DIGEST_CACHE_PATH)  # sólo se releen los archivos con tamaño/mtime nuevos
 
+    q: "queue.Queue" = queue.Queue(maxsize=QUEUE_CHUNKS)
+    # Materializa brand/color/price/url una vez aquí (no en cada consulta)
+    enricher = SimpleEnricher(color_workers=ENRICH_WORKERS) if ENRICH_AT_INDEX else None
+    payload = ENRICH_VERSION if enricher is not None else ""
+
+    def worker():
+        try:
+            wclient = make_client()
+        except Exception as e:
+            # sin cliente el worker sigue drenando la cola y marca sus bloques como fallidos
+            print(f"[Indexer] worker sin conexión a Weaviate: {e}")
+            wclient = None
+        while True:
+            item = q.get()
+            if item is None:
+                return
+            n_batch, objs = item
+            tb = time.monotonic()
+            error = None
+            try:
+                if wclient is None:
+                    raise RuntimeError("sin cliente Weaviate")
+                failed = _send_chunk(wclient, objs)
+                if failed:
+                    error = f"{failed} objetos con error"
+            except Exception as e:
+                print(f"[Indexer] batch {n_batch}: error enviando {len(objs)} objetos: {e}")
+                failed, error = len(objs), e
+            if ckpt is not None:
+                if error is None:
+                    ckpt.mark_done(n_batch)
+                else:
+                    ckpt.mark_failed(n_batch, error)
+            dt = time.monotonic() - tb
+            with lock:
+                stats["pushed"] += len(objs) - failed
+                stats["failed"] += failed
+                stats["batches"] += 1
+                rate = stats["pushed"] / max(time.monotonic() - t0, 1e-9)
+            print(f"[Indexer] batch {n_batch}: {len(objs) - failed}/{len(objs)} ok, "
+                  f"fallidos={failed}, {len(objs) / max(dt, 1e-9):.0f} obj/s (global {rate:.0f} obj/s)")
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(UPSERT_WORKERS)]
+    for t in threads:
+        t.start()
+
+    try:
+        for n_batch, (paths, labels, colors, vecs) in enumerate(iter_chunks(ds, CHUNK_SIZE)):
+            seen.update(paths)
+            if ckpt is not None and ckpt.is_done(n_batch):
+                stats["resumed"] += len(paths)
+                continue
+            objs = []
+            known = digests.digests(paths)
+            for path, label, color, vec in zip(paths, labels, colors, vecs):
+                if vec is None:
+                    continue
+                fp = fingerprint(path, MODEL_TAG, known.get(path), payload)
+                if (existing.get(path) or {}).get("fingerprint") == fp:
+                    stats["skipped"] += 1
+                    continue
+                vec = np.asarray(vec, dtype=np.float32).ravel().tolist()
+                if not vec:
+                    continue
+                props = {
+                    "filepath": path,
+                    "title": label,
+                    "brand": None,
+                    "color": color,
+                    "source": "online",
+                    "url": None,
+                    "price": None,
+                    "fingerprint": fp,
+                }
+                objs.append((props, vec))
+            if objs and enricher is not None:
+                enriched = enricher.enrich_batch([props for props, _ in objs])
+                objs = [(props, vec) for props, (_, vec) in zip(enriched, objs)]
+            if objs:
+                q.put((n_batch, objs))
+            elif ckpt is not None:
+                ckpt.mark_done(n_batch)
+    finally:
+        for _ in threads:
+            q.put(None)
+        for t in threads:
+            t.join()
+        digests.close()
+        if enricher is not None:
+            enricher.close()
+
+    deleted = 0
+    if INCREMENTAL and not stats["failed"]:
+        vanished = [d["id"] for f, d in existing.items() if f not in seen]
+        deleted = delete_objects(client, WVT_CLASS, vanished)
+
+    elapsed = time.monotonic() - t0
+    print(f"[Indexer] Upsert a Weaviate completado. {stats['pushed']}/{total} objetos "
+          f"(sin cambios: {stats['skipped']}, ya hechos: {stats['resumed']}, fallidos: {stats['failed']}, "
+          f"borrados: {deleted}) en {elapsed:.1f}s, {stats['pushed'] / max(elapsed, 1e-9):.0f} obj/s")
+    if ckpt is not None:
+        ckpt.finish()
+        if ckpt.failed:
+            print(f"[Indexer] Bloques fallidos {sorted(ckpt.failed)}: relanza con --resume para reintentarlos")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Indexa un dataset FiftyOne en Weaviate")
+    parser.add_argument("--resume", action="store_true", help="reanuda desde el checkpoint y reintenta los bloques fallidos")
+    parser.add_argument("--checkpoint", default=CHECKPOINT_PATH, help="ruta del checkpoint JSON")
+    parser.add_argument("--checkpoint-every", type=int, default=CHECKPOINT_EVERY, help="bloques entre guardados")
+    args = parser.parse_args(argv)
 
-def main():
     print("[Indexer] Iniciando indexado REAL (FiftyOne + Weaviate)")
     ds = load_dataset()
     compute_embeddings(ds)
-    auth = weaviate.AuthApiKey(api_key=WEAVIATE_API_KEY) if WEAVIATE_API_KEY else None
-    client = weaviate.Client(url=WEAVIATE_URL, auth_client_secret=auth)
-    upsert(ds, client)
+    client = make_client()
+    ckpt = Checkpoint.open(
+        args.checkpoint, resume=args.resume, job=f"indexer:{ds.name}:{WVT_CLASS}",
+        chunk_size=CHUNK_SIZE, total=len(ds), every=args.checkpoint_every,
+        listing=listing_digest(ds.values("id")),  # iter_chunks recorre los bloques en este orden
+    )
+    upsert(ds, client, ckpt)
     print("[Indexer] DONE")
 
 if __name__ == "__main__":
@@ -0,0 +1,74 @@
+# app/knn_job.py
+import os, time, argparse
+import numpy as np
+from app.core.knn_graph import build_knn_graph, write_knn_graph
+from app.core.snapshot import read_snapshot
+from app.core.utils import clip_model_tag
+
+"""
+Job offline: precalcula el grafo k-NN del catálogo para "artículos similares".
+
+    python -m app.knn_job --snapshot data/snapshots/index.npz --k 50
+    python -m app.knn_job --weaviate --k 50
+
+Lee los vectores del snapshot del índice en proceso (INDEX_SNAPSHOT_PATH) o
+de Weaviate y escribe KNN_GRAPH_PATH. Hay que relanzarlo tras re-indexar:
+el grafo refleja el índice del momento en que se calculó.
+"""
+
+KNN_GRAPH_PATH = os.getenv("KNN_GRAPH_PATH", "data/knn/graph.npz")
+INDEX_SNAPSHOT_PATH = os.getenv("INDEX_SNAPSHOT_PATH", "")
+WEAVIATE_URL = os.getenv("WEAVIATE_URL", "http://weaviate:8080")
+WEAVIATE_API_KEY = os.getenv("WEAVIATE_API_KEY", "")
+WVT_CLASS = os.getenv("WVT_CLASS", "FashionItem")
+# embedder de la API que consumirá el grafo (mismas variables que app/deps.py)
+EMBEDDER = os.getenv("EMBEDDER", "mock")
+CLIP_MODEL = os.getenv("CLIP_MODEL", "ViT-B-32")
+CLIP_PRETRAINED = os.getenv("CLIP_PRETRAINED", "openai")
+CLIP_BACKEND = os.getenv("CLIP_BACKEND", "torch")
+
+def load_from_weaviate():
+    import weaviate
+    from app.core.tools.weaviate_vector_store import fetch_vectors
+    auth = weaviate.AuthApiKey(api_key=WEAVIATE_API_KEY) if WEAVIATE_API_KEY else None
+    client = weaviate.Client(url=WEAVIATE_URL, auth_client_secret=auth)
+    payloads, vecs = fetch_vectors(client, WVT_CLASS)
+    return payloads, np.asarray(vecs, dtype=np.float32)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Precalcula el grafo k-NN del catálogo")
+    src = parser.add_mutually_exclusive_group()
+    src.add_argument("--snapshot", default=INDEX_SNAPSHOT_PATH, help="snapshot .npz del índice en proceso")
+    src.add_argument("--weaviate", action="store_true", help="lee los vectores de la clase WVT_CLASS en Weaviate")
+    parser.add_argument("--out", default=KNN_GRAPH_PATH, help="ruta del grafo .npz")
+    parser.add_argument("--k", type=int, default=50, help="vecinos por item")
+    parser.add_argument("--tile", type=int, default=4096, help="filas por bloque del matmul (memoria ~ tile^2 * 4 bytes)")
+    parser.add_argument("--model-tag", default="",
+                        help="etiqueta del modelo (por defecto la del snapshot; con --weaviate, la de CLIP_MODEL/CLIP_PRETRAINED)")
+    args = parser.parse_args(argv)
+
+    t0 = time.perf_counter()
+    if args.weaviate:
+        if not args.model_tag and EMBEDDER != "clip":
+            parser.error("con --weaviate y EMBEDDER distinto de clip hay que indicar --model-tag")
+        payloads, vectors = load_from_weaviate()
+        # Weaviate no guarda el modelo: se asume el CLIP configurado para la API
+        model_tag = args.model_tag or clip_model_tag(
+            CLIP_MODEL, CLIP_PRETRAINED, vectors.shape[1] if vectors.ndim == 2 else 0,
+            "int8" if CLIP_BACKEND == "onnx-int8" else "",
+        )
+    elif args.snapshot:
+        vectors, payloads, meta = read_snapshot(args.snapshot)
+        model_tag = args.model_tag or meta.get("model_tag", "")
+    else:
+        parser.error("indica --snapshot (o INDEX_SNAPSHOT_PATH) o --weaviate")
+    print(f"[knn] {len(payloads)} vectores (dim={vectors.shape[1] if vectors.ndim == 2 else 0}) en {time.perf_counter() - t0:.1f}s")
+
+    t0 = time.perf_counter()
+    neighbors, scores = build_knn_graph(vectors, k=args.k, tile=args.tile, log_every=10)
+    print(f"[knn] grafo {neighbors.shape} en {time.perf_counter() - t0:.1f}s")
+    write_knn_graph(args.out, payloads, neighbors, scores, model_tag=model_tag)
+    print(f"[knn] escrito {args.out} ({os.path.getsize(args.out) / 1e6:.1f} MB)")
+
+if __name__ == "__main__":
+    main()
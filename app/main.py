@@ -1,10 +1,24 @@
-import os, json
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import JSONResponse
+import os, io, json, asyncio, threading
+from typing import Optional, Tuple
+from dataclasses import replace
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import JSONResponse, PlainTextResponse
+from pydantic import ValidationError
+from PIL import Image, UnidentifiedImageError
 from dotenv import load_dotenv
 
-from app.deps import agent_singleton
-from app.models import RetrieveRequest, RetrieveResponse, EnrichedItemOut, AskRequest
+from app.deps import agent_singleton, retrieve_batcher, index_enricher
+from app.core.types import QueryFilter
+from app.core.indexing import index_paths
+from app.core.checkpoint import Checkpoint, listing_digest
+from app.core.digest_cache import DigestCache
+from app.core.orchestrator import ImageQuery, query_label
+from app.core.utils import model_tag_for
+from app.core.registry import import_report, Lazy, unwrap
+from app.core import metrics
+from app.models import RetrieveOptions, RetrieveRequest, RetrieveResponse, EnrichedItemOut, AskRequest
 from app.agent_runtime import build_agent
 
 from fastapi import BackgroundTasks
@@ -13,27 +27,170 @@ from app.models import IndexRequest
 load_dotenv()
 app = FastAPI(title="Visual Agents API", version="0.1.0")
 
+# Pool acotado para el trabajo bloqueante de /retrieve (embed, Weaviate, enrich)
+RETRIEVE_WORKERS = int(os.getenv("RETRIEVE_WORKERS", "8"))
+_retrieve_pool = ThreadPoolExecutor(max_workers=RETRIEVE_WORKERS, thread_name_prefix="retrieve")
+
+INDEX_CHECKPOINT_PATH = os.getenv("INDEX_CHECKPOINT_PATH", "data/checkpoints/admin_index.json")
+CHECKPOINT_EVERY = int(os.getenv("CHECKPOINT_EVERY", "10"))  # bloques entre guardados
+DIGEST_CACHE_PATH = os.getenv("DIGEST_CACHE_PATH", "data/manifests/content_digests.sqlite")  # sha256 por (tamaño, mtime)
+INDEX_SNAPSHOT_PATH = os.getenv("INDEX_SNAPSHOT_PATH", "")  # vacío = sin snapshot del índice en proceso
+KNN_GRAPH_PATH = os.getenv("KNN_GRAPH_PATH", "")  # grafo k-NN precalculado (python -m app.knn_job)
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "1") == "1"
+TIMING_HEADERS = os.getenv("TIMING_HEADERS", "0") == "1"  # desglose por etapa en Server-Timing
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(10 << 20)))  # tamaño máximo de imagen subida a /retrieve
+
+# Estado del calentamiento (lo consulta /ready)
+_warmup = {"status": "pending", "error": None, "timings": {}}
+
+def _run_warmup():
+    _warmup["status"] = "warming"
+    try:
+        _warmup["timings"] = agent_singleton.warmup(
+            snapshot_path=INDEX_SNAPSHOT_PATH or None, knn_graph_path=KNN_GRAPH_PATH or None
+        )
+        _warmup["status"] = "ready"
+        print(f"[warmup] listo: {_warmup['timings']}")
+    except Exception as e:
+        _warmup["status"] = "error"
+        _warmup["error"] = str(e)
+        print(f"[warmup] falló: {e}")
+    finally:
+        _warmup["imports"] = import_report()
+
+@app.on_event("startup")
+def start_warmup():
+    """Calienta modelo, conexión e índice en background: el servidor acepta conexiones ya."""
+    if WARMUP_ON_STARTUP:
+        threading.Thread(target=_run_warmup, name="warmup", daemon=True).start()
+    else:
+        _warmup["status"] = "ready"
+
+@app.on_event("shutdown")
+def close_tools():
+    """Para el micro-batcher y libera pools de procesos y ficheros privados de las herramientas ya construidas."""
+    if retrieve_batcher is not None:
+        retrieve_batcher.close()
+    for tool in (agent_singleton.vstore, agent_singleton.enricher, index_enricher):
+        if isinstance(tool, Lazy) and not tool.built:
+            continue
+        close = getattr(unwrap(tool), "close", None)
+        if close is not None:
+            close()
+
 @app.get("/health")
 def health():
     return {"status": "ok"}
 
-@app.post("/retrieve", response_model=RetrieveResponse)
-def retrieve(req: RetrieveRequest):
+@app.get("/ready")
+def ready():
+    """Readiness: 200 sólo cuando el calentamiento terminó (503 mientras tanto o si falló)."""
+    code = 200 if _warmup["status"] == "ready" else 503
+    return JSONResponse(_warmup, status_code=code)
+
+@app.get("/metrics")
+def metrics_endpoint():
+    """Métricas en formato Prometheus (histogramas por etapa, consultas, cachés, errores, lotes)."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+# Documentación del cuerpo de /retrieve (se parsea a mano según el Content-Type)
+_RETRIEVE_BODY = {"requestBody": {"required": True, "content": {
+    "application/json": {"schema": RetrieveRequest.model_json_schema()},
+    "multipart/form-data": {"schema": {
+        "type": "object", "required": ["file"],
+        "properties": {"file": {"type": "string", "format": "binary"},
+                       **RetrieveOptions.model_json_schema()["properties"]},
+    }},
+    "image/*": {"schema": {"type": "string", "format": "binary"}},
+}}}
+
+def _too_large() -> HTTPException:
+    return HTTPException(status_code=413, detail=f"La imagen supera {UPLOAD_MAX_BYTES} bytes")
+
+async def _read_body(request: Request) -> bytes:
+    '''Lee el cuerpo crudo cortando en cuanto supera UPLOAD_MAX_BYTES.'''
+    if int(request.headers.get("content-length") or 0) > UPLOAD_MAX_BYTES:
+        raise _too_large()
+    buf = bytearray()
+    async for chunk in request.stream():
+        buf += chunk
+        if len(buf) > UPLOAD_MAX_BYTES:
+            raise _too_large()
+    return bytes(buf)
+
+async def _parse_retrieve(request: Request) -> Tuple[ImageQuery, str, RetrieveOptions]:
+    '''
+    /retrieve admite tres formas de consulta:
+      - JSON {"query_image": "<ruta en el servidor>", ...}
+      - multipart/form-data con la imagen en `file` y las opciones como campos
+      - cuerpo crudo image/* u application/octet-stream, opciones en la query string
+    Las imágenes subidas se decodifican en memoria: nada se escribe en disco.
+    Devuelve (consulta, etiqueta para la respuesta, opciones).
+    '''
+    ctype = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    filename: Optional[str] = None
     try:
-   
-        agent_singleton.cfg.top_k = req.top_k
-        agent_singleton.cfg.prefer_online = req.prefer_online
-
-        resp = agent_singleton.retrieve(req.query_image)
-        items = []
-        for r in resp.results:
-            if req.filter_color and (r.color or "").lower() != req.filter_color.lower():
-                continue
-            if req.max_price is not None and (r.price is None or r.price > req.max_price):
-                continue
-            items.append(EnrichedItemOut(**r.__dict__))
-        items = items[:req.top_k]
-        return RetrieveResponse(query_image=req.query_image, count=len(items), results=items)
+        if ctype == "multipart/form-data":
+            form = await request.form()
+            upload = form.get("file")
+            if upload is None or isinstance(upload, str):
+                raise HTTPException(status_code=422, detail="Falta la imagen en el campo 'file'")
+            data = await upload.read(UPLOAD_MAX_BYTES + 1)
+            if len(data) > UPLOAD_MAX_BYTES:
+                raise _too_large()
+            filename = upload.filename
+            opts = RetrieveOptions(**{k: v for k, v in form.items() if k != "file"})
+        elif ctype.startswith("image/") or ctype == "application/octet-stream":
+            data = await _read_body(request)
+            opts = RetrieveOptions(**request.query_params)
+        else:
+            body = json.loads(await request.body() or b"{}")
+            if not isinstance(body, dict):
+                raise HTTPException(status_code=422, detail="El cuerpo JSON debe ser un objeto")
+            req = RetrieveRequest(**body)
+            return req.query_image, req.query_image, req
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=json.loads(e.json(include_url=False)))
+    except ValueError as e:  # JSON mal formado
+        raise HTTPException(status_code=422, detail=str(e))
+    if not data:
+        raise HTTPException(status_code=422, detail="Imagen vacía")
+    _check_image(data)
+    return data, filename or query_label(data), opts
+
+def _bad_image(e: Exception) -> HTTPException:
+    reason = "formato no reconocido" if isinstance(e, UnidentifiedImageError) else f"{type(e).__name__}: {e}"
+    return HTTPException(status_code=422, detail=f"La imagen subida no se puede decodificar ({reason})")
+
+def _check_image(data: bytes) -> None:
+    '''Rechaza con 422 lo que no es una imagen (sólo cabecera + verify, sin decodificar píxeles).'''
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            img.verify()
+    except (UnidentifiedImageError, OSError, SyntaxError, ValueError) as e:
+        raise _bad_image(e)
+
+@app.post("/retrieve", response_model=RetrieveResponse, openapi_extra=_RETRIEVE_BODY)
+async def retrieve(request: Request, response: Response):
+    query, label, req = await _parse_retrieve(request)
+    try:
+        cfg = replace(agent_singleton.cfg, top_k=req.top_k, prefer_online=req.prefer_online)
+        filters = QueryFilter(color=req.filter_color, max_price=req.max_price)
+        if retrieve_batcher is not None:
+            resp = await asyncio.wrap_future(retrieve_batcher.submit(query, filters, cfg))
+        else:
+            loop = asyncio.get_running_loop()
+            resp = await loop.run_in_executor(
+                _retrieve_pool, partial(agent_singleton.retrieve, query, filters=filters, config=cfg)
+            )
+        items = [EnrichedItemOut(**r.__dict__) for r in resp.results][:req.top_k]
+        if TIMING_HEADERS and resp.timings:
+            response.headers["Server-Timing"] = metrics.server_timing(resp.timings)
+        return RetrieveResponse(query_image=label, count=len(items), results=items)
+    except (UnidentifiedImageError, OSError) as e:
+        if isinstance(query, bytes):  # p. ej. JPEG truncado: la cabecera era válida
+            raise _bad_image(e)
+        raise HTTPException(status_code=500, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -57,6 +214,8 @@ def admin_index(req: IndexRequest, bg: BackgroundTasks):
     Dispara el proceso de indexación:
       - opcionalmente borra/recrea el schema en Weaviate
       - recorre el dataset -> embed -> upsert batch en Weaviate
+        (incremental: sólo items nuevos/cambiados, IDs deterministas)
+      - guarda un checkpoint por bloques; con `resume` reintenta sólo lo pendiente/fallido
     Corre en background para no bloquear la request.
     """
     def _job():
@@ -64,32 +223,40 @@ def admin_index(req: IndexRequest, bg: BackgroundTasks):
         embedder = agent_singleton.embedder
         dataset = agent_singleton.dataset
 
-        # 1) schema
-        if req.rebuild_schema:
+        # 1) schema (sólo stores con schema, p. ej. Weaviate; al reanudar no se vuelve a borrar lo ya indexado)
+        drop_class = getattr(vstore, "drop_class", None)
+        ensure_schema = getattr(vstore, "ensure_schema", None)
+        if req.rebuild_schema and not req.resume and drop_class is not None:
             try:
-                vstore.drop_class()
+                drop_class()
             except Exception:
                 pass
-        vstore.ensure_schema()
+        if ensure_schema is not None:
+            ensure_schema()
 
-        # 2) data
+        # 2) data + 3) upsert
         paths = dataset.sample_paths(limit=req.limit)
-        vectors = [embedder.embed_image(p) for p in paths]
-
-        payloads = []
-        for p in paths:
-            md = dataset.get_metadata(p)
-            payloads.append({
-                "filepath": p,
-                "title": md.get("title"),
-                "brand": md.get("brand"),
-                "color": md.get("color"),
-                "source": md.get("source"),
-                "url": md.get("url"),
-            })
-
-        # 3) upsert
-        vstore.index(vectors, payloads)
+        incremental = req.incremental and not (req.rebuild_schema or req.reset_data)
+        ckpt = Checkpoint.open(
+            INDEX_CHECKPOINT_PATH, resume=req.resume, job="admin_index",
+            chunk_size=req.chunk_size, total=len(paths), every=CHECKPOINT_EVERY, listing=listing_digest(paths),
+        )
+        # sólo se borran los desaparecidos si el listado no se truncó por `limit`
+        digests = DigestCache(DIGEST_CACHE_PATH)
+        try:
+            index_paths(
+                vstore, embedder, dataset, paths, incremental=incremental, prune=len(paths) < req.limit,
+                chunk_size=req.chunk_size, checkpoint=ckpt, enricher=index_enricher, digests=digests,
+            )
+        finally:
+            digests.close()
+        # 4) snapshot del índice en proceso para el próximo arranque
+        if INDEX_SNAPSHOT_PATH and hasattr(vstore, "save"):
+            vstore.save(INDEX_SNAPSHOT_PATH, model_tag=model_tag_for(embedder))
+        # 5) el grafo k-NN refleja el índice anterior: búsqueda en vivo hasta recalcularlo
+        if agent_singleton.knn_graph is not None:
+            agent_singleton.knn_graph = None
+            print("[admin/index] grafo k-NN descartado; relanza `python -m app.knn_job` y reinicia")
 
     bg.add_task(_job)
     return {"status": "started", "message": "Indexación lanzada en background"}
\ No newline at end of file
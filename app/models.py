@@ -1,13 +1,16 @@
 from pydantic import BaseModel, Field
 from typing import Optional, List
 
-class RetrieveRequest(BaseModel):
-    query_image: str = Field(..., description="Ruta o identificador de la imagen de consulta")
+class RetrieveOptions(BaseModel):
+    """Parámetros de /retrieve; con subida de imagen llegan como campos del form o query string."""
     top_k: int = Field(10, ge=1, le=30)
     prefer_online: bool = True
     filter_color: Optional[str] = None
     max_price: Optional[float] = Field(None, ge=0)
 
+class RetrieveRequest(RetrieveOptions):
+    query_image: str = Field(..., description="Ruta o identificador de la imagen de consulta")
+
 class EnrichedItemOut(BaseModel):
     id: str
     filepath: str
@@ -19,6 +22,7 @@ class EnrichedItemOut(BaseModel):
     currency: str = "EUR"
     source: Optional[str] = None
     url: Optional[str] = None
+    available: Optional[bool] = None
 
 class RetrieveResponse(BaseModel):
     query_image: str
@@ -34,4 +38,7 @@ from pydantic import BaseModel, Field
 class IndexRequest(BaseModel):
     limit: int = Field(1000, ge=1, le=100000, description="Cantidad de items indexar")
     rebuild_schema: bool = Field(False, description="Si true, borra y recrea la clase en Weaviate")
-    reset_data: bool = Field(False, description="Si true, borra y reindexa todo desde el dataset")
\ No newline at end of file
+    reset_data: bool = Field(False, description="Si true, borra y reindexa todo desde el dataset")
+    incremental: bool = Field(True, description="Si true, sólo embebe/sube items nuevos o cambiados y borra los desaparecidos")
+    resume: bool = Field(False, description="Si true, reanuda desde el último checkpoint y reintenta sólo los bloques fallidos")
+    chunk_size: int = Field(256, ge=1, le=10000, description="Items por bloque (unidad de checkpoint)")
\ No newline at end of file
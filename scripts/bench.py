@@ -0,0 +1,304 @@
+# scripts/bench.py
+"""
+Micro-benchmarks de componentes sobre catálogos sintéticos (offline, CPU).
+
+    python -m scripts.bench --sizes 1000,10000,100000 --out data/bench/run.json
+    python -m scripts.bench --sizes 1000 --compare data/bench/base.json
+
+Mide: throughput del embedder, construcción del índice, latencia de consulta
+simple/por lotes/filtrada (p50/p95/p99), coste del enriquecimiento por item,
+coste de `_rank` y `VisualAgent.retrieve` extremo a extremo, para cada vector
+store. Weaviate sólo se mide con --weaviate-url (el resto no usa red); `sharded`
+reparte las consultas a --shard-workers procesos y reporta el tiempo por shard.
+Con --clip-backends torch,onnx-int8 mide además el encoder CLIP real por
+backend (necesita torch/open_clip/onnxruntime) y su paridad con el eager.
+El JSON resultante incluye el commit para comparar ejecuciones.
+"""
+from typing import List, Dict, Any, Callable, Optional
+import os, sys, json, time, argparse, platform, subprocess, zlib
+from dataclasses import replace
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.core.orchestrator import VisualAgent
+from app.core.types import QueryFilter
+from app.core.tools.mock_embedder import MockEmbedder
+from app.core.tools.mock_dataset import MockDataset
+from app.core.tools.mock_enricher import MockEnricher
+from app.core.tools.enricher import SimpleEnricher, BASIC_COLORS
+from app.core.tools.numpy_vector_store import NumpyVectorStore
+from app.core.tools.quantized_vector_store import QuantizedVectorStore
+from app.core.tools.sharded_vector_store import ShardedVectorStore
+from app.core.tools.mock_vector_store import MockVectorStore
+
+# ------- utilidades -------
+def percentiles(samples_s: List[float]) -> Dict[str, float]:
+    ms = np.asarray(samples_s, dtype=np.float64) * 1000.0
+    return {
+        "samples": int(ms.size),
+        "mean_ms": round(float(ms.mean()), 4),
+        "p50_ms": round(float(np.percentile(ms, 50)), 4),
+        "p95_ms": round(float(np.percentile(ms, 95)), 4),
+        "p99_ms": round(float(np.percentile(ms, 99)), 4),
+    }
+
+def timed(fn: Callable[[], Any], repeat: int, warmup: int = 3) -> List[float]:
+    for _ in range(warmup):
+        fn()
+    out = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        out.append(time.perf_counter() - t0)
+    return out
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return None
+
+# ------- catálogo sintético -------
+def synthetic_payloads(n: int) -> List[Dict[str, Any]]:
+    out = []
+    for i in range(n):
+        fp = f"SYNTH/img_{i:07d}.jpg"
+        h = zlib.crc32(fp.encode("utf-8"))
+        out.append({
+            "filepath": fp,
+            "title": f"Item img_{i:07d}.jpg",
+            "brand": "MockBrand",
+            "color": BASIC_COLORS[h % len(BASIC_COLORS)],
+            "source": "online" if h % 2 == 0 else "store",
+            "url": None,
+            "price": round(15.0 + (h % 10500) / 100.0, 2),
+        })
+    return out
+
+def synthetic_vectors(embedder: MockEmbedder, payloads: List[Dict[str, Any]]) -> np.ndarray:
+    '''Vectores deterministas del MockEmbedder (mismo vector que verá la consulta).'''
+    vecs = np.empty((len(payloads), embedder.dim), dtype=np.float32)
+    for start in range(0, len(payloads), 10000):
+        chunk = payloads[start:start + 10000]
+        vecs[start:start + len(chunk)] = embedder.embed_images([p["filepath"] for p in chunk])
+    return vecs
+
+def make_store(name: str, args) -> Any:
+    if name == "numpy":
+        return NumpyVectorStore()
+    if name == "mock":
+        return MockVectorStore()
+    if name in ("int8", "pq"):
+        raw = os.path.join(args.scratch_dir, f"bench_{name}.f32")
+        return QuantizedVectorStore(mode=name, raw_path=raw, pq_m=args.pq_m, rerank_factor=args.rerank_factor)
+    if name == "sharded":
+        return ShardedVectorStore(shards=args.shards, root=os.path.join(args.scratch_dir, "bench_shards"),
+                                  workers=args.shard_workers)
+    if name == "weaviate":
+        from app.core.tools.weaviate_vector_store import WeaviateVectorStore
+        vs = WeaviateVectorStore(url=args.weaviate_url, class_name="BenchItem")
+        vs.drop_class()
+        vs.ensure_schema()
+        return vs
+    raise ValueError(f"vector store desconocido: {name}")
+
+# ------- benchmarks -------
+def bench_components(args, embedder: MockEmbedder) -> List[Dict[str, Any]]:
+    results = []
+    paths = [f"SYNTH/img_{i:07d}.jpg" for i in range(args.embed_items)]
+    t0 = time.perf_counter()
+    embedder.embed_images(paths)
+    dt = time.perf_counter() - t0
+    results.append({"bench": "embed", "embedder": "MockEmbedder", "items": len(paths),
+                    "seconds": round(dt, 4), "items_per_s": round(len(paths) / dt, 1)})
+
+    items = [{**p, "id": p["filepath"], "similarity": 0.5, "price": None} for p in synthetic_payloads(1000)]
+    for name, fn in (
+        ("MockEnricher", MockEnricher(seed=1).enrich),
+        # color ya presente: mide el coste por item sin decodificar imágenes
+        ("SimpleEnricher", SimpleEnricher().enrich),
+    ):
+        lat = timed(lambda: fn(items), repeat=args.repeat_small)
+        results.append({"bench": "enrich", "enricher": name, "items": len(items),
+                        "us_per_item": round(float(np.median(lat)) / len(items) * 1e6, 3), **percentiles(lat)})
+
+    agent = VisualAgent(embedder, None, MockVectorStore(), MockEnricher(seed=1))
+    ranked_in = MockEnricher(seed=1).enrich(items)
+    for k in (12, 100, 1000):
+        sub = ranked_in[:k]
+        lat = timed(lambda: agent._rank(sub), repeat=args.repeat_small)
+        results.append({"bench": "rank", "items": k, **percentiles(lat)})
+    return results
+
+def bench_clip(args) -> List[Dict[str, Any]]:
+    '''Throughput del encoder CLIP por backend (entradas aleatorias, sin decodificar) y paridad.'''
+    import torch
+    from app.core.tools.clip_embedder import CLIPEmbedder
+    from app.core.tools.clip_onnx import image_size_of
+    results = []
+    for backend in [b for b in args.clip_backends.split(",") if b]:
+        emb = CLIPEmbedder(device="cpu", backend=backend, batch_size=args.batch,
+                           intra_op_threads=args.clip_threads)
+        h, w = image_size_of(emb.model)
+        pixels = torch.randn(args.batch, 3, h, w, generator=torch.Generator().manual_seed(0))
+        lat = timed(lambda: emb._encode(pixels), repeat=10, warmup=2)
+        results.append({"bench": "embed", "embedder": f"CLIPEmbedder[{backend}]", "batch": args.batch,
+                        "items_per_s": round(args.batch / float(np.median(lat)), 1),
+                        **emb.parity_check(n=args.batch), **percentiles(lat)})
+    return results
+
+def bench_store(args, store_name: str, n: int, payloads, vectors, embedder) -> List[Dict[str, Any]]:
+    results = []
+    rng = np.random.default_rng(n)
+    vs = make_store(store_name, args)
+
+    t0 = time.perf_counter()
+    for start in range(0, n, args.index_chunk):
+        vs.index(vectors[start:start + args.index_chunk], payloads[start:start + args.index_chunk])
+    build = time.perf_counter() - t0
+    base = {"store": store_name, "n": n, "dim": int(vectors.shape[1])}
+    results.append({"bench": "index_build", **base, "seconds": round(build, 4),
+                    "items_per_s": round(n / build, 1) if build > 0 else None})
+    if isinstance(vs, QuantizedVectorStore):
+        vs.train()
+        results.append({"bench": "quantization", **base, **vs.memory_report(),
+                        "recall_at_k": round(vs.recall(vectors[rng.integers(0, n, size=100)], k=args.k), 4)})
+
+    n_q = args.queries if store_name != "mock" else min(args.queries, 30)
+    qids = rng.integers(0, n, size=n_q)
+    qs = vectors[qids]
+    it = iter(range(10 ** 9))
+
+    lat = timed(lambda: vs.query(qs[next(it) % n_q], k=args.k), repeat=n_q)
+    results.append({"bench": "query", **base, "k": args.k, **percentiles(lat)})
+
+    where = QueryFilter(color="red", max_price=60.0)
+    if vs.supports_filter("color") and vs.supports_filter("price"):
+        lat = timed(lambda: vs.query(qs[next(it) % n_q], k=args.k, where=where), repeat=n_q)
+        results.append({"bench": "query_filtered", **base, "k": args.k, **percentiles(lat)})
+
+    query_many = getattr(vs, "query_many", None)
+    if query_many is not None:
+        b = args.batch
+        batches = max(n_q // b, 3)
+
+        def next_batch() -> np.ndarray:
+            s = next(it) * b
+            return qs.take(np.arange(s, s + b) % n_q, axis=0)
+
+        lat = timed(lambda: query_many(next_batch(), k=args.k), repeat=batches)
+        results.append({"bench": "query_batch", **base, "k": args.k, "batch": b,
+                        "us_per_query": round(float(np.median(lat)) / b * 1e6, 2), **percentiles(lat)})
+
+    agent = VisualAgent(embedder, MockDataset(), vs, MockEnricher(seed=1))
+    agent._indexed = True
+    qpaths = [payloads[int(i)]["filepath"] for i in qids]
+    lat = timed(lambda: agent.retrieve(qpaths[next(it) % n_q]), repeat=n_q)
+    results.append({"bench": "retrieve_e2e", **base, "top_k": agent.cfg.top_k, **percentiles(lat)})
+    lat = timed(lambda: agent.retrieve(qpaths[next(it) % n_q], filters=where), repeat=n_q)
+    results.append({"bench": "retrieve_e2e_filtered", **base, "top_k": agent.cfg.top_k, **percentiles(lat)})
+    # las consultas son items del catálogo: sin reutilizar el vector indexado pasan por el embedder
+    reembed = replace(agent.cfg, reuse_indexed_vectors=False)
+    lat = timed(lambda: agent.retrieve(qpaths[next(it) % n_q], config=reembed), repeat=n_q)
+    results.append({"bench": "retrieve_e2e_reembed", **base, "top_k": agent.cfg.top_k, **percentiles(lat)})
+
+    if isinstance(vs, ShardedVectorStore):
+        results.append({"bench": "shards", **base, "workers": vs.workers, "per_shard": vs.shard_stats()})
+        vs.close()
+    if store_name == "weaviate":
+        vs.drop_class()
+    return results
+
+def result_key(r: Dict[str, Any]) -> str:
+    parts = [r["bench"]] + [f"{f}={r[f]}" for f in ("store", "n", "items", "enricher", "embedder", "batch") if f in r]
+    return " ".join(parts)
+
+def compare(base_path: str, results: List[Dict[str, Any]]) -> None:
+    '''Imprime la variación respecto a una ejecución anterior (p50 o throughput).'''
+    with open(base_path) as f:
+        base = {result_key(r): r for r in json.load(f)["results"]}
+    print(f"\n== Comparación con {base_path} ==")
+    for r in results:
+        old = base.get(result_key(r))
+        if old is None:
+            continue
+        for m in ("p50_ms", "p99_ms", "seconds", "items_per_s"):
+            if m in r and m in old and old[m]:
+                print(f"{result_key(r):60s} {m:12s} {old[m]:>12} -> {r[m]:>12}  ({r[m] / old[m]:.2f}x)")
+
+def main():
+    ap = argparse.ArgumentParser(description="Micro-benchmarks de componentes (catálogos sintéticos)")
+    ap.add_argument("--sizes", default="1000,10000,100000", help="tamaños de catálogo (p. ej. 1000,...,1000000)")
+    ap.add_argument("--stores", default="numpy,mock", help="numpy,mock,int8,pq,sharded[,weaviate]")
+    ap.add_argument("--shards", type=int, default=4, help="shards del store 'sharded'")
+    ap.add_argument("--shard-workers", type=int, default=4, help="procesos del store 'sharded' (0 = en proceso)")
+    ap.add_argument("--pq-m", type=int, default=16, help="subespacios PQ (dim divisible por pq_m)")
+    ap.add_argument("--rerank-factor", type=int, default=4)
+    ap.add_argument("--scratch-dir", default="data/bench", help="memmaps de los stores cuantizados y particionados")
+    ap.add_argument("--mock-max", type=int, default=10000, help="tamaño máximo para MockVectorStore (O(N) en Python)")
+    ap.add_argument("--weaviate-url", default="", help="si se indica, también mide WeaviateVectorStore")
+    ap.add_argument("--clip-backends", default="", help="torch,torchscript,onnx,onnx-int8 (vacío = no mide CLIP)")
+    ap.add_argument("--clip-threads", type=int, default=0, help="hilos intra-op del encoder CLIP (0 = por defecto)")
+    ap.add_argument("--dim", type=int, default=128)
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--batch", type=int, default=32)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--index-chunk", type=int, default=10000)
+    ap.add_argument("--embed-items", type=int, default=5000)
+    ap.add_argument("--repeat-small", type=int, default=50)
+    ap.add_argument("--out", default="", help="ruta del JSON de resultados")
+    ap.add_argument("--compare", default="", help="JSON de una ejecución anterior")
+    args = ap.parse_args()
+
+    sizes = sorted(int(s) for s in args.sizes.split(",") if s)
+    stores = [s for s in args.stores.split(",") if s]
+    if args.weaviate_url and "weaviate" not in stores:
+        stores.append("weaviate")
+    if "weaviate" in stores and not args.weaviate_url:
+        stores.remove("weaviate")
+        print("[bench] weaviate omitido (sin --weaviate-url)")
+
+    embedder = MockEmbedder(dim=args.dim)
+    results = bench_components(args, embedder)
+    if args.clip_backends:
+        results.extend(bench_clip(args))
+
+    # El catálogo mayor se genera una vez; los menores son prefijos suyos
+    t0 = time.perf_counter()
+    payloads = synthetic_payloads(sizes[-1])
+    vectors = synthetic_vectors(embedder, payloads)
+    print(f"[bench] catálogo sintético de {sizes[-1]} items en {time.perf_counter() - t0:.1f}s")
+
+    for n in sizes:
+        for store in stores:
+            if store == "mock" and n > args.mock_max:
+                continue
+            print(f"[bench] {store} n={n}")
+            results.extend(bench_store(args, store, n, payloads[:n], vectors[:n], embedder))
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": vars(args),
+        },
+        "results": results,
+    }
+    for r in results:
+        stat = r.get("p50_ms", r.get("items_per_s", r.get("recall_at_k")))
+        print(f"{result_key(r):60s} p50/thr={stat}  p99={r.get('p99_ms', '-')}")
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"[bench] resultados en {args.out}")
+    if args.compare:
+        compare(args.compare, results)
+
+if __name__ == "__main__":
+    main()
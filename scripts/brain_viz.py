@@ -44,15 +44,16 @@ def ensure_embeddings(ds: fo.Dataset, emb_field: str):
     try:
         print("[brain_viz] Intentandodocke con OpenCLIP (CLIPEmbedder)")
         from app.core.tools.clip_embedder import CLIPEmbedder
+        from app.core.tools.cached_embedder import CachedEmbedder
         embedder = CLIPEmbedder(model_name="ViT-B-32", pretrained="openai")
+        if os.getenv("EMB_CACHE_DIR"):
+            embedder = CachedEmbedder(embedder, cache_dir=os.environ["EMB_CACHE_DIR"])
         # Crea el campo si no existe
         if emb_field not in ds.get_field_schema():
             ds.add_sample_field(emb_field, fo.VectorField)
-        # Rellena
-        for s in ds:
-            vec = embedder.embed_image(s.filepath)
-            setattr(s, emb_field, vec)
-            s.save()
+        # Rellena por lotes y escribe la columna de una vez
+        vecs = embedder.embed_images(ds.values("filepath"))
+        ds.set_values(emb_field, list(vecs))
         print(f"[brain_viz] Listo: embeddings guardados en '{emb_field}'")
     except Exception as e:
         raise RuntimeError(f"[brain_viz] No pude generar embeddings por ningún camino: {e}")
@@ -0,0 +1,60 @@
+# tests/conftest.py
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json, threading
+import pytest
+
+"""Servidor HTTP local (stdlib) que hace de servicio externo en los tests."""
+
+# handler(método, ruta, cuerpo JSON) -> (status, cuerpo JSON)
+Handler = Callable[[str, str, Any], Tuple[int, Any]]
+
+class HTTPStub:
+    def __init__(self, handler: Handler):
+        self.handler = handler
+        self.requests: List[Tuple[str, str, Any]] = []
+        stub = self
+
+        class _Req(BaseHTTPRequestHandler):
+            def _serve(self):
+                n = int(self.headers.get("content-length") or 0)
+                body = json.loads(self.rfile.read(n)) if n else None
+                stub.requests.append((self.command, self.path, body))
+                status, payload = stub.handler(self.command, self.path, body)
+                data = json.dumps(payload).encode("utf-8") if payload is not None else b""
+                try:
+                    self.send_response(status)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # el cliente ya cortó por timeout
+
+            do_GET = do_POST = do_PUT = do_DELETE = _serve
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _Req)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def paths(self, method: Optional[str] = None) -> List[str]:
+        return [p for m, p, _ in self.requests if method is None or m == method]
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+@pytest.fixture
+def http_stub():
+    '''Fábrica de servidores: http_stub(handler) -> HTTPStub (se paran al acabar el test).'''
+    stubs: List[HTTPStub] = []
+    def make(handler: Handler) -> HTTPStub:
+        stubs.append(HTTPStub(handler))
+        return stubs[-1]
+    yield make
+    for s in stubs:
+        s.close()
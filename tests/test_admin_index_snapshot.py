@@ -0,0 +1,60 @@
+# tests/test_admin_index_snapshot.py
+import json, os, subprocess, sys
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("httpx")  # TestClient
+
+"""
+/admin/index con un store en proceso guarda el snapshot y, tras reiniciar,
+el calentamiento lo carga en vez de re-indexar. Cada "arranque" es un proceso
+nuevo: la configuración de app.deps se lee del entorno al importar.
+"""
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FIRST_BOOT = """
+from fastapi.testclient import TestClient
+from app.main import app
+with TestClient(app) as c:
+    r = c.post("/admin/index", json={"limit": 50, "chunk_size": 20})  # la tarea en background corre aquí
+    assert r.status_code == 200, r.text
+"""
+
+SECOND_BOOT = """
+import json, time
+from fastapi.testclient import TestClient
+from app.main import app
+from app.deps import agent_singleton
+with TestClient(app) as c:
+    for _ in range(200):
+        r = c.get("/ready")
+        if r.status_code == 200:
+            break
+        time.sleep(0.05)
+    print(json.dumps({"status": r.status_code, "items": len(agent_singleton.vstore)}))
+"""
+
+def _boot(script, env):
+    return subprocess.run(
+        [sys.executable, "-c", script], cwd=env["WORKDIR"], env=env, capture_output=True, text=True, timeout=120
+    )
+
+@pytest.mark.parametrize("store", ["numpy", "quantized", "sharded"])
+def test_admin_index_snapshot_survives_restart(store, tmp_path):
+    snapshot = tmp_path / "index.npz"
+    env = {
+        **os.environ, "PYTHONPATH": ROOT, "WORKDIR": str(tmp_path),
+        "VECTOR_STORE": store, "DATASET": "mock", "EMBEDDER": "mock", "ENRICHER": "mock",
+        "SHARD_WORKERS": "0", "QUANT_RAW_PATH": str(tmp_path / "raw.f32"),
+        "INDEX_SNAPSHOT_PATH": str(snapshot), "WARMUP_ON_STARTUP": "0",
+    }
+    first = _boot(FIRST_BOOT, env)
+    assert first.returncode == 0, first.stderr
+    assert snapshot.exists(), first.stdout + first.stderr
+
+    second = _boot(SECOND_BOOT, {**env, "WARMUP_ON_STARTUP": "1"})
+    assert second.returncode == 0, second.stderr
+    assert "índice cargado de" in second.stdout
+    result = json.loads(second.stdout.strip().splitlines()[-1])
+    assert result == {"status": 200, "items": 50}
@@ -0,0 +1,42 @@
+# tests/test_clip_onnx.py
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("open_clip")
+pytest.importorskip("onnx")
+pytest.importorskip("onnxruntime")
+
+from app.core.tools import clip_onnx
+from app.core.tools.clip_embedder import CLIPEmbedder
+
+"""
+Export TorchScript/ONNX del encoder de imagen y paridad con el modelo eager.
+Pesos aleatorios (pretrained="") para no descargar nada: la paridad depende
+del grafo exportado, no de los pesos.
+"""
+
+MODEL = "ViT-B-32"
+
+@pytest.fixture(scope="module")
+def onnx_path(tmp_path_factory):
+    return str(tmp_path_factory.mktemp("models") / "clip.onnx")
+
+@pytest.mark.parametrize("backend, min_cos", [("torchscript", 0.999), ("onnx", 0.999), ("onnx-int8", 0.9)])
+def test_backend_parity(backend, min_cos, onnx_path):
+    emb = CLIPEmbedder(model_name=MODEL, pretrained="", device="cpu", backend=backend, onnx_path=onnx_path, num_workers=1)
+    report = emb.parity_check(n=4)
+    assert report["backend"] == backend
+    assert report["cos_min"] >= min_cos, report
+
+def test_export_onnx_dynamic_batch(tmp_path):
+    emb = CLIPEmbedder(model_name=MODEL, pretrained="", device="cpu", num_workers=1)
+    path = clip_onnx.export_onnx(emb.model, str(tmp_path / "dyn.onnx"))
+    enc = clip_onnx.OnnxImageEncoder(path, intra_op_threads=1)
+    h, w = clip_onnx.image_size_of(emb.model)
+    for batch in (1, 3):
+        pixels = torch.randn(batch, 3, h, w, generator=torch.Generator().manual_seed(batch))
+        with torch.no_grad():
+            ref = emb.model.encode_image(pixels).numpy()
+        out = enc(pixels.numpy())
+        assert out.shape == ref.shape
+        assert clip_onnx.cosine_agreement(ref, out)["cos_min"] >= 0.999
@@ -0,0 +1,83 @@
+# tests/test_price_api_enricher.py
+import time
+import pytest
+
+pytest.importorskip("httpx")
+
+from app.core.tools.price_api_enricher import PriceAPIEnricher
+
+"""PriceAPIEnricher contra un servicio de precios local: lotes, caché TTL, caché negativa y degradación."""
+
+PRICES = {"a": {"price": 10.0, "currency": "EUR", "available": True}, "b": {"price": 20.0, "available": False}}
+
+def _prices(method, path, body):
+    return 200, {"items": {i: PRICES[i] for i in body["ids"] if i in PRICES}}
+
+def _items(*ids):
+    return [{"id": i, "filepath": i} for i in ids]
+
+@pytest.fixture
+def make_enricher():
+    made = []
+    def make(url, **kw):
+        made.append(PriceAPIEnricher(url, **kw))
+        return made[-1]
+    yield make
+    for e in made:
+        e.close()
+
+def test_bulk_request_and_ttl_cache(http_stub, make_enricher):
+    stub = http_stub(_prices)
+    enr = make_enricher(stub.url, timeout=2.0, ttl=0.3)
+    out = enr.enrich(_items("a", "b", "a"))
+    assert [x["price"] for x in out] == [10.0, 20.0, 10.0]
+    assert [x["available"] for x in out] == [True, False, True]
+    assert stub.requests == [("POST", "/prices", {"ids": ["a", "b"]})]  # una sola petición, ids únicos
+
+    enr.enrich(_items("a", "b"))
+    assert len(stub.requests) == 1  # servido desde la caché
+
+    time.sleep(0.35)
+    enr.enrich(_items("a"))
+    assert stub.requests[-1][2] == {"ids": ["a"]}  # caducado: se vuelve a pedir
+
+def test_unknown_ids_are_negatively_cached(http_stub, make_enricher):
+    stub = http_stub(_prices)
+    enr = make_enricher(stub.url, timeout=2.0, ttl=60, negative_ttl=0.3)
+    assert enr.enrich(_items("a", "zzz"))[1]["price"] is None
+    enr.enrich(_items("zzz"))
+    assert len(stub.requests) == 1  # el id desconocido no se vuelve a pedir
+    time.sleep(0.35)
+    enr.enrich(_items("zzz"))
+    assert stub.requests[-1][2] == {"ids": ["zzz"]}
+
+def test_timeout_degrades_without_prices(http_stub, make_enricher):
+    def slow(method, path, body):
+        time.sleep(0.5)
+        return _prices(method, path, body)
+    stub = http_stub(slow)
+    enr = make_enricher(stub.url, timeout=0.1)
+    t0 = time.perf_counter()
+    out = enr.enrich(_items("a", "b"))
+    assert time.perf_counter() - t0 < 0.4
+    assert [x["price"] for x in out] == [None, None]
+    assert [x["currency"] for x in out] == ["EUR", "EUR"]
+    assert enr.failures == 1
+
+def test_server_error_degrades_and_is_not_cached(http_stub, make_enricher):
+    state = {"down": True}
+    def flaky(method, path, body):
+        return (503, {"error": "down"}) if state["down"] else _prices(method, path, body)
+    stub = http_stub(flaky)
+    enr = make_enricher(stub.url, timeout=2.0)
+    assert enr.enrich(_items("a"))[0]["price"] is None
+    state["down"] = False
+    assert enr.enrich(_items("a"))[0]["price"] == 10.0  # el fallo no dejó caché negativa
+    assert len(stub.requests) == 2
+
+def test_aenrich_from_event_loop(http_stub, make_enricher):
+    import asyncio
+    stub = http_stub(_prices)
+    enr = make_enricher(stub.url, timeout=2.0)
+    out = asyncio.run(enr.aenrich(_items("b")))
+    assert out[0]["price"] == 20.0
@@ -0,0 +1,142 @@
+# tests/test_weaviate_vector_store.py
+import re
+import pytest
+
+pytest.importorskip("weaviate")
+
+from app.core.types import QueryFilter
+from app.core.utils import object_uuid
+from app.core.tools.weaviate_vector_store import WeaviateVectorStore, SCHEMA_PROPERTIES
+
+"""WeaviateVectorStore contra un Weaviate falso (REST + GraphQL) local: multi_get con alias, batch y reintentos."""
+
+CLASS = "FashionItem"
+ALIAS = re.compile(r"(q\d+)\s*:\s*" + CLASS)
+
+class FakeWeaviate:
+    '''Responde lo mínimo que usa el cliente v3; `fail` = estados a devolver antes de responder bien a /graphql.'''
+    def __init__(self):
+        self.fail = []
+        self.objects = []
+        self.batch_paths = []
+        self.props = list(SCHEMA_PROPERTIES)
+
+    def __call__(self, method, path, body):
+        if path == "/v1/meta":
+            return 200, {"version": "1.23.0"}
+        if path == "/v1/.well-known/ready":
+            return 200, None
+        if path.startswith("/v1/.well-known/openid-configuration"):
+            return 404, None
+        if path == "/v1/schema":
+            return 200, {"classes": [{"class": CLASS, "properties": self.props}]}
+        if path == f"/v1/schema/{CLASS}":
+            return 200, {"class": CLASS, "properties": self.props}
+        if path == f"/v1/schema/{CLASS}/properties" and method == "POST":
+            self.props.append(body)
+            return 200, body
+        if path == "/v1/nodes":  # tamaño de batch dinámico del cliente
+            return 200, {"nodes": [{"status": "HEALTHY", "stats": {"shardCount": 1, "objectCount": 0},
+                                    "batchStats": {"queueLength": 0, "ratePerSecond": 1000}}]}
+        if path.startswith("/v1/batch/objects"):
+            self.batch_paths.append(path)
+            self.objects.extend(body["objects"])
+            return 200, [{**o, "result": {}} for o in body["objects"]]
+        if path == "/v1/graphql":
+            if self.fail:
+                return self.fail.pop(0), {"error": "fallo simulado"}
+            return 200, {"data": {"Get": self._get(body["query"])}}
+        return 404, None
+
+    @staticmethod
+    def _get(query):
+        aliases = ALIAS.findall(query) or [CLASS]
+        limit = int(re.search(r"limit:\s*(\d+)", query).group(1))
+        return {
+            a: [{"filepath": f"{a}-{j}", "price": float(j), "_additional": {"distance": 0.1 * j}} for j in range(limit)]
+            for a in aliases
+        }
+
+@pytest.fixture
+def fake(http_stub):
+    weav = FakeWeaviate()
+    stub = http_stub(weav)
+    weav.stub = stub
+    return weav
+
+def _store(fake, **kw):
+    kw.setdefault("backoff", 0.001)
+    return WeaviateVectorStore(url=fake.stub.url, class_name=CLASS, **kw)
+
+def _graphql(fake):
+    return [b for m, p, b in fake.stub.requests if p == "/v1/graphql"]
+
+def test_query_many_packs_aliases_per_request(fake):
+    vs = _store(fake, max_queries_per_request=2)
+    out = vs.query_many([[1.0, 0.0]] * 5, k=3, where=QueryFilter(color="red", max_price=50))
+    reqs = _graphql(fake)
+    assert len(reqs) == 3  # 5 consultas en bloques de 2
+    assert [len(ALIAS.findall(r["query"])) for r in reqs] == [2, 2, 1]
+    assert all("nearVector" in r["query"] and "LessThanEqual" in r["query"] for r in reqs)
+    # cada resultado sale de su alias, en orden
+    assert [[x["filepath"] for x in res] for res in out] == [[f"q{i}-{j}" for j in range(3)] for i in (0, 1, 0, 1, 0)]
+    assert out[0][1]["score"] == pytest.approx(0.9)
+
+def test_query_uses_single_get(fake):
+    vs = _store(fake)
+    res = vs.query([0.5, 0.5], k=2)
+    assert [x["filepath"] for x in res] == [f"{CLASS}-0", f"{CLASS}-1"]
+    assert len(_graphql(fake)) == 1
+
+def test_transient_errors_are_retried(fake):
+    fake.fail = [503, 429]
+    vs = _store(fake, max_retries=3)
+    assert len(vs.query_many([[1.0, 0.0]], k=1)[0]) == 1
+    assert len(_graphql(fake)) == 3
+
+def test_retries_are_bounded(fake):
+    fake.fail = [503] * 10
+    vs = _store(fake, max_retries=2)
+    with pytest.raises(Exception):
+        vs.query([1.0, 0.0], k=1)
+    assert len(_graphql(fake)) == 3  # 1 intento + 2 reintentos
+
+def test_client_errors_are_not_retried(fake):
+    fake.fail = [400]
+    vs = _store(fake, max_retries=3)
+    with pytest.raises(Exception):
+        vs.query([1.0, 0.0], k=1)
+    assert len(_graphql(fake)) == 1
+
+def test_index_batches_with_deterministic_uuids(fake):
+    vs = _store(fake)
+    payloads = [{"filepath": f"img_{i}.jpg", "color": "red", "fingerprint": f"fp{i}"} for i in range(3)]
+    vs.index([[float(i), 1.0] for i in range(3)], payloads)
+    assert [o["id"] for o in fake.objects] == [object_uuid(p["filepath"]) for p in payloads]
+    assert [o["vector"] for o in fake.objects] == [[float(i), 1.0] for i in range(3)]
+    assert fake.objects[0]["properties"]["fingerprint"] == "fp0"
+    assert len(fake.batch_paths) == 1  # un solo envío batch
+
+def test_consistency_level_reaches_batch_and_graphql(fake):
+    vs = _store(fake, consistency_level="QUORUM")
+    vs.index([[1.0, 0.0]], [{"filepath": "a.jpg"}])
+    vs.query([1.0, 0.0], k=1)
+    assert fake.batch_paths == ["/v1/batch/objects?consistency_level=QUORUM"]
+    assert "consistencyLevel: QUORUM" in _graphql(fake)[0]["query"]
+
+def test_connection_pool_is_sized(fake):
+    vs = _store(fake, pool_connections=7, pool_maxsize=11)
+    adapter = vs.client._connection._session.get_adapter(fake.stub.url)
+    assert (adapter._pool_connections, adapter._pool_maxsize) == (7, 11)
+
+def test_ensure_schema_adds_missing_properties(fake):
+    # clase creada antes de materializar price/fingerprint
+    fake.props = [p for p in SCHEMA_PROPERTIES if p["name"] not in ("price", "fingerprint")]
+    vs = _store(fake)
+    assert not vs.supports_filter("price")
+    vs.ensure_schema()
+    added = [b["name"] for m, p, b in fake.stub.requests if p == f"/v1/schema/{CLASS}/properties"]
+    assert added == ["price", "fingerprint"]
+    assert vs.supports_filter("price")
+    vs.ensure_schema()  # ya completa: no añade nada
+    assert len([p for m, p, b in fake.stub.requests if p.endswith("/properties")]) == 2